@@ -0,0 +1 @@
+../common/geojson_io.py
\ No newline at end of file
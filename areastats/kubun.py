@@ -0,0 +1 @@
+../common/kubun.py
\ No newline at end of file
@@ -0,0 +1,212 @@
+import argparse
+import csv
+import glob
+import os
+import pathlib
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyproj
+import shapely
+from geojson_io import load_geojson
+from kubun import chu_kubuns, dai_kubuns
+from shapefiles import mesh_shapefiles
+
+# Albers equal-area conic for Japan on GRS80; Areas of projected polygons are areas on the ellipsoid
+EQUAL_AREA_CRS = (
+    "+proj=aea +lat_0=35 +lon_0=137 +lat_1=30 +lat_2=40 +ellps=GRS80 +units=m"
+)
+TRANSFORMER = pyproj.Transformer.from_crs("EPSG:4326", EQUAL_AREA_CRS, always_xy=True)
+
+# e.g. vg67/vg67_01/shp644441/p644441.shp
+PREFECTURE_PATTERN = re.compile(r"vg67_(\d{2})")
+
+KUBUNS = {
+    "sai": lambda codes: codes,
+    "chu": chu_kubuns,
+    "dai": dai_kubuns,
+}
+
+
+def project(xy: np.ndarray) -> np.ndarray:
+    return np.column_stack(TRANSFORMER.transform(xy[:, 0], xy[:, 1]))
+
+
+# Area (m^2) and feature count for each HANREI code of a mesh, cached as npz
+def mesh_areas(input_path: pathlib.Path, cache_path: pathlib.Path):
+    features = load_geojson(input_path)["features"]
+    codes = np.array([f["properties"]["H"] for f in features], dtype=np.int64)
+    geoms = np.array(
+        [shapely.geometry.shape(f["geometry"]) for f in features], dtype=object
+    )
+    areas = shapely.area(shapely.transform(geoms, project))
+
+    unique_codes, inverse = np.unique(codes, return_inverse=True)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = cache_path.with_name(f".{cache_path.name}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            codes=unique_codes,
+            areas=np.bincount(inverse, areas, len(unique_codes)),
+            features=np.bincount(inverse, minlength=len(unique_codes)),
+        )
+    tmp.replace(cache_path)
+
+
+# mesh -> prefecture code (e.g. "01") from directories of shapefiles
+def mesh_prefectures(shapefile_pattern: str) -> dict[str, str]:
+    mesh_path = mesh_shapefiles(glob.glob(shapefile_pattern, recursive=True))
+
+    prefectures = {}
+    for mesh, path in mesh_path.items():
+        if m := PREFECTURE_PATTERN.search(str(path)):
+            prefectures[mesh] = m.group(1)
+    return prefectures
+
+
+# Sums areas and feature counts by (group, kubun code); Returns rows sorted by them
+def aggregate(
+    groups: np.ndarray, codes: np.ndarray, areas: np.ndarray, features: np.ndarray
+) -> list[tuple[int, int, float, int]]:
+    # HANREI codes have 6 digits
+    keys = groups * 10**7 + codes
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    sum_areas = np.bincount(inverse, areas, len(unique_keys))
+    sum_features = np.bincount(inverse, features, len(unique_keys)).astype(np.int64)
+    return list(
+        zip(
+            (unique_keys // 10**7).tolist(),
+            (unique_keys % 10**7).tolist(),
+            sum_areas.tolist(),
+            sum_features.tolist(),
+        )
+    )
+
+
+def write_table(
+    path: pathlib.Path,
+    key: str,
+    names: list[str],
+    groups: np.ndarray,
+    codes: np.ndarray,
+    areas: np.ndarray,
+    features: np.ndarray,
+):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow([key, "kubun", "code", "features", "area_m2"])
+        for kubun, to_kubun in KUBUNS.items():
+            for group, code, area, count in aggregate(
+                groups, to_kubun(codes), areas, features
+            ):
+                writer.writerow([names[group], kubun, code, count, f"{area:.1f}"])
+
+
+def main(
+    geojson_pattern: str,
+    shapefile_pattern: str | None,
+    output_dir: pathlib.Path,
+    jobs: int,
+    force: bool,
+):
+    cache_dir = output_dir / "meshes"
+    inputs = {
+        pathlib.Path(f).stem.lower(): pathlib.Path(f)
+        for f in sorted(glob.glob(geojson_pattern, recursive=True))
+    }
+    if len(inputs) == 0:
+        raise RuntimeError(f"No geojson files: {geojson_pattern}")
+
+    # Only meshes whose geojson changed since the last run
+    targets = [
+        (path, cache_dir / f"{mesh}.npz")
+        for mesh, path in inputs.items()
+        if force
+        or not (cache := cache_dir / f"{mesh}.npz").exists()
+        or cache.stat().st_mtime_ns < path.stat().st_mtime_ns
+    ]
+    print(f"Meshes: {len(inputs)}, to calculate: {len(targets)}")
+    with ProcessPoolExecutor(jobs) as executor:
+        for (path, _), _ in zip(
+            targets,
+            executor.map(mesh_areas, [i for i, _ in targets], [c for _, c in targets]),
+        ):
+            print(path)
+
+    # Rows of all meshes
+    meshes = [*inputs]
+    mesh_indexes, codes, areas, features = [], [], [], []
+    for i, mesh in enumerate(meshes):
+        with np.load(cache_dir / f"{mesh}.npz") as data:
+            codes.append(data["codes"])
+            areas.append(data["areas"])
+            features.append(data["features"])
+        mesh_indexes.append(np.full(len(codes[-1]), i))
+    mesh_indexes = np.concatenate(mesh_indexes)
+    codes = np.concatenate(codes)
+    areas = np.concatenate(areas)
+    features = np.concatenate(features)
+
+    prefectures = mesh_prefectures(shapefile_pattern) if shapefile_pattern else {}
+    # Unknown prefecture as ""
+    prefecture_names = sorted({prefectures.get(mesh, "") for mesh in meshes})
+    mesh_prefecture_indexes = np.array(
+        [prefecture_names.index(prefectures.get(mesh, "")) for mesh in meshes]
+    )
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for key, names, groups in [
+        ("mesh", meshes, mesh_indexes),
+        ("prefecture", prefecture_names, mesh_prefecture_indexes[mesh_indexes]),
+        ("total", ["all"], np.zeros(len(codes), dtype=np.int64)),
+    ]:
+        write_table(
+            output_dir / f"{key}.csv", key, names, groups, codes, areas, features
+        )
+    print(f"Total area: {areas.sum() / 1e6:.1f} km^2")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "areastats", "Sum areas for each sai, chu and dai code by mesh and prefecture"
+    )
+    parser.add_argument(
+        "-g",
+        "--geojson-pattern",
+        help="Python glob library style file pattern locating geojsons",
+        type=str,
+        default="../data/geojson/*.geojson",
+    )
+    parser.add_argument(
+        "-s",
+        "--shapefile-pattern",
+        help="Shapefiles to find prefectures of meshes by vg67_XX directories; Prefectures are empty without it",
+        type=str,
+    )
+    parser.add_argument(
+        "-o",
+        "--out-dir",
+        help="Directory for output tables",
+        type=pathlib.Path,
+        default=pathlib.Path("../data/stats"),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes",
+        type=int,
+        default=os.cpu_count(),
+    )
+    parser.add_argument(
+        "-f", "--force", help="Recalculate all meshes", action="store_true"
+    )
+    args = parser.parse_args()
+    main(
+        args.geojson_pattern,
+        args.shapefile_pattern,
+        args.out_dir,
+        args.jobs,
+        args.force,
+    )
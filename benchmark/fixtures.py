@@ -0,0 +1,95 @@
+# Synthetic vg67-like shapefiles: mosaics of polygons filling 2nd meshes, without downloading the origin data
+
+import pathlib
+import random
+from dataclasses import dataclass
+
+import fiona
+import shapely
+from fiona.crs import CRS
+from mesh import mesh2_bounds
+
+EPSG_JDG2000 = CRS.from_epsg(4612)
+
+SCHEMA = {"geometry": "Polygon", "properties": {"HANREI_C": "int"}}
+
+# Sample HANREI codes across dai / chu kubun, including special ones in trimmer.dai_kubun
+CODES = [
+    10100,
+    10200,
+    20100,
+    50100,
+    50102,
+    51000,
+    70100,
+    70200,
+    90100,
+    100100,
+    110100,
+    400100,
+    570100,
+    570400,
+    580100,
+    580600,
+]
+
+# 0.0002 deg, ~20m; Origin polygons have dense vertices along borders
+SEGMENT_LENGTH = 0.00001 * 20
+
+
+@dataclass
+class Fixture:
+    meshes: list[str]
+    polygons_per_mesh: int
+    seed: int = 0
+
+
+FIXTURES = {
+    "sparse": Fixture(["533945", "533946"], 200),
+    "medium": Fixture(["533935", "533936", "533945", "533946"], 1000),
+    "dense": Fixture(["533945", "533946"], 5000),
+}
+
+
+# Voronoi mosaic clipped to the mesh; Neighbors share borders like the origin data
+def mosaic(mesh: str, count: int, rng: random.Random) -> list[shapely.Polygon]:
+    west, south, east, north = bounds = mesh2_bounds(mesh)
+    points = shapely.MultiPoint(
+        [(rng.uniform(west, east), rng.uniform(south, north)) for _ in range(count)]
+    )
+    box = shapely.box(*bounds)
+    cells = shapely.voronoi_polygons(points, extend_to=box).geoms  # type: ignore
+    polygons = shapely.intersection(cells, box)
+    return [
+        shapely.segmentize(p, SEGMENT_LENGTH)
+        for p in polygons
+        if p.geom_type == "Polygon" and not p.is_empty
+    ]
+
+
+def write_shapefile(
+    path: pathlib.Path, polygons: list[shapely.Polygon], codes: list[int]
+):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with fiona.open(
+        path, "w", "ESRI Shapefile", SCHEMA, crs=EPSG_JDG2000, encoding="Shift_JIS"
+    ) as dst:
+        dst.writerecords(
+            {
+                "geometry": shapely.geometry.mapping(p),
+                "properties": {"HANREI_C": code},
+            }
+            for p, code in zip(polygons, codes)
+        )
+
+
+# Write shapefiles in the same layout as the origin data; e.g. vg67_13/shp533945/p533945.shp
+def generate(fixture: Fixture, output_dir: pathlib.Path) -> int:
+    rng = random.Random(fixture.seed)
+    count = 0
+    for mesh in fixture.meshes:
+        polygons = mosaic(mesh, fixture.polygons_per_mesh, rng)
+        codes = [rng.choice(CODES) for _ in polygons]
+        write_shapefile(output_dir / f"vg67_00/shp{mesh}/p{mesh}.shp", polygons, codes)
+        count += len(polygons)
+    return count
@@ -0,0 +1,229 @@
+import argparse
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from fixtures import FIXTURES, generate
+
+REPO_DIR = pathlib.Path(__file__).parent.parent
+
+METRICS = ["seconds", "peak_rss_mb"]
+
+
+@dataclass
+class Stage:
+    name: str
+    # Stage directory in the repository
+    directory: str
+    # (fixture dir, work dir) -> CLI arguments
+    args: Callable[[pathlib.Path, pathlib.Path], list[str]]
+
+
+STAGES = [
+    Stage(
+        "geojsoner",
+        "geojsoner",
+        lambda f, w: [
+            *["-s", f"{f}/**/*.shp"],
+            *["-o", str(w / "geojson"), "-c", str(w / "coverage")],
+        ],
+    ),
+    Stage(
+        "trimmer-chu",
+        "trimmer",
+        lambda f, w: [
+            "-g",
+            f"{w}/geojson/*.geojson",
+            "-k",
+            "chu",
+            "-o",
+            str(w / "chu"),
+        ],
+    ),
+    Stage(
+        "trimmer-dai",
+        "trimmer",
+        lambda f, w: [
+            "-g",
+            f"{w}/geojson/*.geojson",
+            "-k",
+            "dai",
+            "-o",
+            str(w / "dai"),
+        ],
+    ),
+    Stage(
+        "labeler",
+        "labeler",
+        lambda f, w: ["-g", f"{w}/geojson/*.geojson", "-o", str(w / "sai-labels")],
+    ),
+]
+
+
+# Returns (seconds, peak RSS in MB) of the stage process
+def run_stage(python: str, stage: Stage, args: list[str]) -> tuple[float, float]:
+    started_at = time.perf_counter()
+    process = subprocess.Popen(
+        [python, "main.py", *args],
+        cwd=REPO_DIR / stage.directory,
+        stdout=subprocess.DEVNULL,
+    )
+    # wait4 returns the resource usage of the process itself, not of all children so far
+    _, status, rusage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started_at
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise RuntimeError(f"{stage.name} failed: {process.returncode}")
+
+    # ru_maxrss is in KB on Linux
+    return seconds, rusage.ru_maxrss / 1024
+
+
+def count_features(geojson_dir: pathlib.Path) -> int:
+    return sum(
+        len(json.load(open(path))["features"]) for path in geojson_dir.glob("*.geojson")
+    )
+
+
+# Best of repeats for seconds, worst for memory
+def run_fixture(python: str, fixture_dir: pathlib.Path, repeat: int) -> dict:
+    results: dict[str, dict[str, float]] = {}
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as d:
+            work_dir = pathlib.Path(d)
+            for stage in STAGES:
+                seconds, rss = run_stage(
+                    python, stage, stage.args(fixture_dir, work_dir)
+                )
+                if (r := results.get(stage.name)) is not None:
+                    r["seconds"] = min(r["seconds"], seconds)
+                    r["peak_rss_mb"] = max(r["peak_rss_mb"], rss)
+                else:
+                    results[stage.name] = {"seconds": seconds, "peak_rss_mb": rss}
+            features = count_features(work_dir / "geojson")
+
+    for r in results.values():
+        r["features"] = features
+        r["features_per_sec"] = features / r["seconds"]
+    return results
+
+
+def print_results(results: dict):
+    print("fixture   stage          seconds   peak RSS(MB)   features   features/sec")
+    for fixture, stages in results.items():
+        for stage, r in stages.items():
+            print(
+                f"{fixture:<9} {stage:<12} {r['seconds']:>9.2f} {r['peak_rss_mb']:>14.1f}"
+                f" {r['features']:>10} {r['features_per_sec']:>14.1f}"
+            )
+
+
+# Returns regressions over threshold (%)
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for fixture, stages in results.items():
+        for stage, r in stages.items():
+            if (b := baseline.get(fixture, {}).get(stage)) is None:
+                continue
+            for metric in METRICS:
+                old, new = b[metric], r[metric]
+                change = (new - old) / old * 100 if old > 0 else 0
+                print(
+                    f"{fixture} {stage} {metric}: {old:.2f} -> {new:.2f} ({change:+.1f}%)"
+                )
+                if change > threshold:
+                    regressions.append(f"{fixture} {stage} {metric}: {change:+.1f}%")
+    return regressions
+
+
+def main(
+    fixture_names: list[str],
+    fixtures_dir: pathlib.Path,
+    python: str,
+    repeat: int,
+    output: pathlib.Path | None,
+    baseline: pathlib.Path | None,
+    threshold: float,
+):
+    results = {}
+    for name in fixture_names:
+        fixture_dir = (fixtures_dir / name).absolute()
+        # Fixtures are deterministic; Generate once
+        if not fixture_dir.exists():
+            print(f"Generating fixture: {name}")
+            generate(FIXTURES[name], fixture_dir)
+
+        print(f"Running fixture: {name}")
+        results[name] = run_fixture(python, fixture_dir, repeat)
+
+    print_results(results)
+
+    if output is not None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None:
+        print(f"\nCompare with {baseline}:")
+        regressions = compare(results, json.load(open(baseline)), threshold)
+        if len(regressions) > 0:
+            raise RuntimeError(f"Pipeline got slower: {regressions}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "benchmark", "Benchmark the conversion pipeline with synthetic fixtures"
+    )
+    parser.add_argument(
+        "-f",
+        "--fixture",
+        help="Fixtures to run (repeatable)",
+        choices=FIXTURES.keys(),
+        action="append",
+    )
+    parser.add_argument(
+        "--fixtures-dir",
+        help="Directory for generated fixture shapefiles",
+        type=pathlib.Path,
+        default=REPO_DIR / "data/benchmark/fixtures",
+    )
+    parser.add_argument(
+        "--python",
+        help="Python executable to run stages with (fiona and shapely required)",
+        type=str,
+        default=sys.executable,
+    )
+    parser.add_argument(
+        "-r", "--repeat", help="Number of runs for each fixture", type=int, default=3
+    )
+    parser.add_argument(
+        "-o", "--out", help="Output results JSON file", type=pathlib.Path
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        help="Results JSON file to compare with; Fails if seconds or peak RSS exceeds the threshold",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--threshold",
+        help="Allowed increase from the baseline in percent",
+        type=float,
+        default=20,
+    )
+    args = parser.parse_args()
+    main(
+        args.fixture or [*FIXTURES],
+        args.fixtures_dir,
+        args.python,
+        args.repeat,
+        args.out,
+        args.baseline,
+        args.threshold,
+    )
@@ -2,18 +2,15 @@
 
 import argparse
 import colorsys
+import hashlib
 import json
 import pathlib
+from collections import defaultdict
 from dataclasses import dataclass
 from operator import itemgetter
 from typing import Tuple
 
-from slyr_community.parser import objects
-from slyr_community.parser.object import Object
-from slyr_community.parser.object_registry import REGISTRY
-from slyr_community.parser.stream import Stream
-
-LAYER_FILE = "/lyr/origin.lyr"
+LAYER_FILE = pathlib.Path("/lyr/origin.lyr")
 
 
 @dataclass(frozen=True)
@@ -72,73 +69,38 @@ DAI_COLOR_OVERWRITES = {
 }
 
 
-def cmyk_to_rgba(c: int, m: int, y: int, k: int) -> RGBA:
-    return RGBA(
-        255 * (1 - c / 100) * (1 - k / 100),
-        255 * (1 - m / 100) * (1 - k / 100),
-        255 * (1 - y / 100) * (1 - k / 100),
-        1,
-    )
+def read_lyr_colors(
+    layer_file: pathlib.Path, cache_file: pathlib.Path
+) -> dict[int, Tuple[RGBA, RGBA]]:
+    # Parsing lyr takes a while and requires slyr; Reuse the result while the lyr file is unchanged
+    digest = hashlib.sha256(layer_file.read_bytes()).hexdigest()
+
+    raw_colors = None
+    if cache_file.exists():
+        cache = json.load(open(cache_file))
+        if cache["sha256"] == digest:
+            raw_colors = cache["colors"]
+
+    if raw_colors is None:
+        import lyr
+
+        raw_colors = lyr.read_colors(layer_file)
+        json.dump(
+            {"sha256": digest, "colors": raw_colors},
+            open(cache_file, "w"),
+            separators=(",", ":"),
+        )
 
+    return {
+        int(hanrei_c): (RGBA(*fill), RGBA(*outline))
+        for hanrei_c, (fill, outline) in raw_colors.items()
+    }
 
-def convert_color(
-    color: objects.CmykColor | objects.HsvColor | objects.RgbColor,
-) -> RGBA:
-    match type(color):
-        case objects.CmykColor:
-            return cmyk_to_rgba(
-                color.cyan,
-                color.magenta,
-                color.yellow,
-                color.black,
-            )
-        case objects.HsvColor | objects.RgbColor:
-            # HsvColor internal values are identical to RGBColor
-            return RGBA(color.red, color.green, color.blue, 1)
-        case _:
-            raise RuntimeError(f"Unknown fill color: {color}, label: {label}")
-
-
-def get_colors_from_lyr(layer_file_path: str) -> dict[int, Tuple[RGBA, RGBA]]:
-    colors = {}
-
-    with open(layer_file_path, "rb") as f:
-        stream = Stream(f)
-        feature_layer = stream.read_object()  # type: FeatureLayer
-        renderer = feature_layer.renderer  # type: UniqueValueRenderer
-        legend_group = renderer.groups[0]  # type: LegendGroup
-        for hanrei_c, clazz in zip(
-            renderer.values, legend_group.classes
-        ):  # hanrei_c -> str, clazz -> LegendClass
-            label = clazz.label
-            hanrei_n = label[len(hanrei_c) :]  # For debugging
-            symbol = clazz.symbol  # type: SimpleFillSymbol | MultiLayerFillSymbol
-
-            # Get background symbol's fill / outline color
-            match type(symbol):
-                case objects.SimpleFillSymbol:
-                    background_symbol = symbol
-                case objects.MultiLayerFillSymbol:
-                    # The first layer should be the background layer
-                    background_symbol = symbol.layers[0]
-                    if type(background_symbol) != objects.SimpleFillSymbol:
-                        raise RuntimeError(
-                            f"Unknown background_symbol: {background_symbol}, label: {label}"
-                        )
-                case _:
-                    raise RuntimeError(f"Unknown symbol: {symbol}, label: {label}")
-
-            if background_symbol.fill_style != objects.SimpleFillSymbol.STYLE_SOLID:
-                raise RuntimeError(
-                    f"Unknown symbol style: {background_symbol.fill_style}, label: {label}"
-                )
-
-            fill_color_rgba = convert_color(background_symbol.color)
-
-            outline = background_symbol.outline  # type: SimpleLineSymbol
-            outline_color_rgba = convert_color(outline.color)
-
-            colors[int(hanrei_c)] = (fill_color_rgba, outline_color_rgba)
+
+def get_colors_from_lyr(
+    layer_file: pathlib.Path, cache_file: pathlib.Path
+) -> dict[int, Tuple[RGBA, RGBA]]:
+    colors = read_lyr_colors(layer_file, cache_file)
 
     for hanrei, color in ADDITIONAL_COLORS.items():
         if hanrei in colors:
@@ -196,20 +158,37 @@ def pick_color_for_dai(
     return dai_color
 
 
-def main(output_dir: pathlib.Path):
+# Same as FALLBACK_COLOR in page/consts.js
+FALLBACK_COLOR = "#000000"
+
+
+# Build a mapbox match expression sharing a branch among codes with the identical color
+# e.g. ["match", ["get", "H"], [10101, 10102], "#123456", [10103], "#abcdef", "#000000"]
+def build_matcher(fill_style: dict[int, str], key: str) -> list:
+    color_codes = defaultdict(list)
+    for code, color in sorted(fill_style.items(), key=itemgetter(0)):
+        color_codes[color].append(code)
+
+    branches = []
+    for color, codes in color_codes.items():
+        branches.extend([codes, color])
+
+    return ["match", ["get", key], *branches, FALLBACK_COLOR]
+
+
+# Codes ordered by the palette index property `P` baked into tiles by paletter
+def build_palette(fill_style: dict[int, str], key: str) -> dict:
+    return {"key": key, "codes": sorted(fill_style.keys())}
+
+
+def main(layer_file: pathlib.Path, cache_file: pathlib.Path, output_dir: pathlib.Path):
     if output_dir.exists() and not output_dir.is_dir():
         raise RuntimeError(
             f"Output directory: {output_dir.absolute()} is not a directory"
         )
     output_dir.mkdir(parents=True, exist_ok=True)
 
-    # Register all available objects in slyr_community
-    for i in dir(objects):
-        obj = getattr(objects, i)
-        if type(obj) is type and issubclass(obj, Object):
-            REGISTRY.register(obj)
-
-    colors = darken_fill(get_colors_from_lyr(LAYER_FILE))
+    colors = darken_fill(get_colors_from_lyr(layer_file, cache_file))
 
     def pick_fill_colors(colors):
         return {code: fill.mapbox_style() for code, (fill, _) in colors.items()}
@@ -225,11 +204,32 @@ def main(output_dir: pathlib.Path):
     dump(output_dir / "vg67_chu_style.json", chu_fill_style)
     dump(output_dir / "vg67_dai_style.json", dai_fill_style)
 
+    dump(output_dir / "vg67_sai_matcher.json", build_matcher(sai_fill_style, "H"))
+    dump(output_dir / "vg67_chu_matcher.json", build_matcher(chu_fill_style, "C"))
+    dump(output_dir / "vg67_dai_matcher.json", build_matcher(dai_fill_style, "D"))
+
+    dump(output_dir / "vg67_sai_palette.json", build_palette(sai_fill_style, "H"))
+    dump(output_dir / "vg67_chu_palette.json", build_palette(chu_fill_style, "C"))
+    dump(output_dir / "vg67_dai_palette.json", build_palette(dai_fill_style, "D"))
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         "colormap", "Export vg67 lyr colromap as mapbox style json"
     )
+    parser.add_argument(
+        "-l",
+        "--layer-file",
+        help="vg67 lyr file",
+        type=pathlib.Path,
+        default=LAYER_FILE,
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        help="Cache file for colors parsed from the lyr file (default: {layer file}.colors.json)",
+        type=pathlib.Path,
+    )
     parser.add_argument(
         "-o",
         "--out",
@@ -239,4 +239,8 @@ if __name__ == "__main__":
     )
     args = parser.parse_args()
 
-    main(args.out)
+    cache = args.cache
+    if cache is None:
+        cache = args.layer_file.with_name(f"{args.layer_file.name}.colors.json")
+
+    main(args.layer_file, cache, args.out)
@@ -0,0 +1,95 @@
+# type: ignore
+
+# Read legend colors from a vg67 lyr file
+# slyr_community is available only in the Docker image. Import this module only when required
+
+import pathlib
+
+from slyr_community.parser import objects
+from slyr_community.parser.object import Object
+from slyr_community.parser.object_registry import REGISTRY
+from slyr_community.parser.stream import Stream
+
+# (r, g, b, a)
+Color = tuple[float, float, float, float]
+
+
+def register_objects():
+    # Register all available objects in slyr_community
+    for i in dir(objects):
+        obj = getattr(objects, i)
+        if type(obj) is type and issubclass(obj, Object):
+            REGISTRY.register(obj)
+
+
+def cmyk_to_rgba(c: int, m: int, y: int, k: int) -> Color:
+    return (
+        255 * (1 - c / 100) * (1 - k / 100),
+        255 * (1 - m / 100) * (1 - k / 100),
+        255 * (1 - y / 100) * (1 - k / 100),
+        1,
+    )
+
+
+def convert_color(
+    color: objects.CmykColor | objects.HsvColor | objects.RgbColor,
+) -> Color:
+    match type(color):
+        case objects.CmykColor:
+            return cmyk_to_rgba(
+                color.cyan,
+                color.magenta,
+                color.yellow,
+                color.black,
+            )
+        case objects.HsvColor | objects.RgbColor:
+            # HsvColor internal values are identical to RGBColor
+            return (color.red, color.green, color.blue, 1)
+        case _:
+            raise RuntimeError(f"Unknown fill color: {color}, label: {label}")
+
+
+def read_colors(layer_file_path: pathlib.Path) -> dict[int, tuple[Color, Color]]:
+    register_objects()
+
+    colors = {}
+
+    with open(layer_file_path, "rb") as f:
+        stream = Stream(f)
+        feature_layer = stream.read_object()  # type: FeatureLayer
+        renderer = feature_layer.renderer  # type: UniqueValueRenderer
+        legend_group = renderer.groups[0]  # type: LegendGroup
+        for hanrei_c, clazz in zip(
+            renderer.values, legend_group.classes
+        ):  # hanrei_c -> str, clazz -> LegendClass
+            label = clazz.label
+            hanrei_n = label[len(hanrei_c) :]  # For debugging
+            symbol = clazz.symbol  # type: SimpleFillSymbol | MultiLayerFillSymbol
+
+            # Get background symbol's fill / outline color
+            match type(symbol):
+                case objects.SimpleFillSymbol:
+                    background_symbol = symbol
+                case objects.MultiLayerFillSymbol:
+                    # The first layer should be the background layer
+                    background_symbol = symbol.layers[0]
+                    if type(background_symbol) != objects.SimpleFillSymbol:
+                        raise RuntimeError(
+                            f"Unknown background_symbol: {background_symbol}, label: {label}"
+                        )
+                case _:
+                    raise RuntimeError(f"Unknown symbol: {symbol}, label: {label}")
+
+            if background_symbol.fill_style != objects.SimpleFillSymbol.STYLE_SOLID:
+                raise RuntimeError(
+                    f"Unknown symbol style: {background_symbol.fill_style}, label: {label}"
+                )
+
+            fill_color_rgba = convert_color(background_symbol.color)
+
+            outline = background_symbol.outline  # type: SimpleLineSymbol
+            outline_color_rgba = convert_color(outline.color)
+
+            colors[int(hanrei_c)] = (fill_color_rgba, outline_color_rgba)
+
+    return colors
@@ -0,0 +1,41 @@
+# Read and write GeoJSON of stages with orjson if installed, otherwise with json
+# Shared among stages; Symlinked into each stage directory
+#
+# Outputs are identical to json.dump(value, f, separators=(",", ":")) for GeoJSON in this project:
+# ASCII strings, coordinates in Japan and integer properties.
+# (orjson writes non-ASCII strings as is and tiny floats like 1e-05 as 0.00001, unlike json)
+
+import json
+import os
+import pathlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Set VG67_JSON_BACKEND=json to compare with the standard library
+BACKEND = os.environ.get("VG67_JSON_BACKEND", "orjson" if orjson else "json")
+
+
+def loads_geojson(data: str | bytes) -> dict:
+    if BACKEND == "orjson":
+        return orjson.loads(data)  # type: ignore
+    return json.loads(data)
+
+
+def dumps_geojson(value: dict) -> str:
+    if BACKEND == "orjson":
+        return orjson.dumps(value).decode()  # type: ignore
+    # json.dumps encodes in C at once, while json.dump to a file runs the pure Python encoder
+    return json.dumps(value, separators=(",", ":"))
+
+
+def load_geojson(path: pathlib.Path) -> dict:
+    with open(path, "rb") as f:
+        return loads_geojson(f.read())
+
+
+def dump_geojson(value: dict, path: pathlib.Path):
+    with open(path, "w") as f:
+        f.write(dumps_geojson(value))
@@ -0,0 +1,142 @@
+# Per-file timing and counters for stage CLIs, written as JSON lines
+# Shared among stages; Symlinked into each stage directory
+
+import argparse
+import json
+import pathlib
+import resource
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Iterator
+
+PROFILERS = ["cprofile", "pyinstrument"]
+
+
+class FileStats:
+    def __init__(self, stage: str, file: str):
+        self.stage = stage
+        self.file = file
+        self.phases: Counter[str] = Counter()
+        self.counts: Counter[str] = Counter()
+        self.lapped_at = time.perf_counter()
+
+    # Phase time accumulates when entered multiple times, e.g. in a loop
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] += time.perf_counter() - started_at
+
+    # Time since the previous lap (or the start of the file) goes to the phase; Marks the end of a phase without indenting it
+    def lap(self, name: str):
+        now = time.perf_counter()
+        self.phases[name] += now - self.lapped_at
+        self.lapped_at = now
+
+    def count(self, name: str, n: int = 1):
+        self.counts[name] += n
+
+
+# Does nothing unless a log file or a profiler is set
+class Instrument:
+    def __init__(
+        self,
+        stage: str,
+        log_path: pathlib.Path | None,
+        profiler: str | None,
+        profile_dir: pathlib.Path,
+    ):
+        self.stage = stage
+        self.log_path = log_path
+        self.profiler = profiler
+        self.profile_dir = profile_dir
+
+    @contextmanager
+    def file(self, path: pathlib.Path) -> Iterator[FileStats]:
+        stats = FileStats(self.stage, str(path))
+        stop_profiler = self.start_profiler(path)
+        started_at = time.perf_counter()
+        try:
+            yield stats
+        finally:
+            seconds = time.perf_counter() - started_at
+            if stop_profiler is not None:
+                stop_profiler()
+            if self.log_path is not None:
+                self.write(stats, seconds)
+
+    def write(self, stats: FileStats, seconds: float):
+        line = {
+            "stage": stats.stage,
+            "file": stats.file,
+            "time": time.time(),
+            "seconds": seconds,
+            "phases": dict(stats.phases),
+            "counts": dict(stats.counts),
+            # High-water mark of the process so far, not of this file only; ru_maxrss is in KB on Linux
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)  # type: ignore
+        # One write per line to keep lines from parallel processes intact
+        with open(self.log_path, "a") as f:  # type: ignore
+            f.write(json.dumps(line, separators=(",", ":")) + "\n")
+
+    # Returns a function to stop the profiler and save the result
+    def start_profiler(self, path: pathlib.Path):
+        if self.profiler is None:
+            return None
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        out = self.profile_dir / f"{self.stage}-{path.stem}"
+
+        match self.profiler:
+            case "cprofile":
+                import cProfile
+
+                profile = cProfile.Profile()
+                profile.enable()
+
+                def stop():
+                    profile.disable()
+                    profile.dump_stats(out.with_suffix(".prof"))
+
+            case "pyinstrument":
+                import pyinstrument
+
+                profiler = pyinstrument.Profiler()
+                profiler.start()
+
+                def stop():
+                    profiler.stop()
+                    out.with_suffix(".html").write_text(profiler.output_html())
+
+            case _:
+                raise RuntimeError(f"Unknown profiler: {self.profiler}")
+
+        return stop
+
+
+def add_instrument_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--log",
+        help="Append per-file timings and counts to this JSON lines file",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Profile each file (pyinstrument requires the pyinstrument package)",
+        choices=PROFILERS,
+    )
+    parser.add_argument(
+        "--profile-dir",
+        help="Directory for profile outputs",
+        type=pathlib.Path,
+        default=pathlib.Path(__file__).parent.parent / "data/profile",
+    )
+
+
+def instrument_from_args(stage: str, args: argparse.Namespace) -> Instrument:
+    return Instrument(stage, args.log, args.profile, args.profile_dir)
@@ -0,0 +1,35 @@
+# Chu and dai kubun codes of HANREI codes (H)
+# Shared among stages; Symlinked into each stage directory
+
+import numpy as np
+
+# Codes of special dai kubun; Others are code // 10000
+SPECIAL_DAI_KUBUN = {
+    # Water area
+    580600: 91,
+    # Paddy field
+    570400: 99,
+}
+
+
+def chu_kubun(code: int) -> int:
+    return code // 100
+
+
+def dai_kubun(code: int) -> int:
+    if (dai := SPECIAL_DAI_KUBUN.get(code)) is not None:
+        return dai
+
+    return code // 10000
+
+
+# Same as chu_kubun / dai_kubun for each code
+def chu_kubuns(codes: np.ndarray) -> np.ndarray:
+    return codes // 100
+
+
+def dai_kubuns(codes: np.ndarray) -> np.ndarray:
+    dais = codes // 10000
+    for code, dai in SPECIAL_DAI_KUBUN.items():
+        dais[codes == code] = dai
+    return dais
@@ -0,0 +1,120 @@
+# Label points of sai polygons for each code, thinned out for each scale
+# Shared among stages; Symlinked into each stage directory
+
+import traceback
+from collections import defaultdict
+from operator import itemgetter
+from typing import Iterable
+
+import shapely
+
+LIMIT_AREA_ALPHA = 0.25  # (16 - scale) ^ 2 ^ 2 * 100m * 100m
+LIMIT_DISTANCE_ALPHA = 5  # (16 - scale) ^ 2 * 100m
+
+LIMIT_AREA_16 = LIMIT_AREA_ALPHA * 100 * 100 * 0.00001 * 0.00001
+
+LIMIT_DISTANCE_16 = LIMIT_DISTANCE_ALPHA * 100 * 0.00001
+
+SCALES = {
+    "25": 2**3.5,  # 12.5
+    "3": 2**3,  # 13
+    "4": 2**2,  # 14
+    "5": 2,  # 15
+}
+
+
+# Representative points and areas of polygons for each code; Too small polygons are skipped
+def representative_points(
+    code_geoms: Iterable[tuple[int, shapely.Polygon | shapely.MultiPolygon]],
+) -> dict[int, list[tuple[shapely.Point, float]]]:
+    code_point_areas = defaultdict(list)
+    for code, geom in code_geoms:
+        try:
+            match type(geom):
+                case shapely.MultiPolygon:
+                    code_point_areas[code].extend(
+                        [(p.representative_point(), p.area) for p in geom.geoms if p.area > LIMIT_AREA_16]  # type: ignore
+                    )
+                case shapely.Polygon:
+                    if geom.area > LIMIT_AREA_16:
+                        code_point_areas[code].append(
+                            (
+                                geom.representative_point(),
+                                geom.area,
+                            )
+                        )
+                case _:
+                    raise RuntimeError(f"Unknown feature geometry type: {type(geom)}")
+        except:
+            traceback.print_exc()
+            # e.g. Empty polygon as the result of round-off
+            print(code, geom)
+
+    return code_point_areas
+
+
+# Label points with properties of scales where they appear
+def thin_out(
+    code_point_areas: dict[int, list[tuple[shapely.Point, float]]],
+) -> list[tuple[shapely.Point, dict]]:
+    all_points = []
+    for code, point_areas in code_point_areas.items():
+        sorted_point_areas = list(reversed(sorted(point_areas, key=itemgetter(1))))
+        distance_cache = {}
+
+        def get_distance(i, j):
+            if cache := distance_cache.get((i, j), None):
+                return cache
+
+            distance = shapely.distance(
+                sorted_point_areas[i][0], sorted_point_areas[j][0]
+            )
+            distance_cache[(i, j)] = distance
+            return distance
+
+        i = 0
+        while i < len(sorted_point_areas):
+            point_i = sorted_point_areas[i][0]
+            sorted_point_areas = sorted_point_areas[: i + 1] + [
+                pa_j
+                for pa_j in sorted_point_areas[i + 1 :]
+                if shapely.distance(point_i, pa_j[0]) > LIMIT_DISTANCE_16
+            ]
+            i += 1
+
+        properties = [{"H": code} for _ in sorted_point_areas]
+        for key, scale in SCALES.items():
+            # Filter points that is eligible for scale 14
+            idxes = [
+                idx
+                for idx in range(len(sorted_point_areas))
+                if sorted_point_areas[idx][1] > (LIMIT_AREA_16 * scale * scale)
+            ]
+
+            i = 0
+            while i < len(idxes):
+                idxes = idxes[: i + 1] + [
+                    j
+                    for j in idxes[i + 1 :]
+                    if get_distance(i, j) > (LIMIT_DISTANCE_16 * scale)
+                ]
+                i += 1
+
+            for i in idxes:
+                properties[i][key] = True
+
+        for i, (point, _) in enumerate(sorted_point_areas):
+            all_points.append((point, properties[i]))
+
+    return all_points
+
+
+def to_features(all_points: list[tuple[shapely.Point, dict]]) -> list[dict]:
+    return [
+        {
+            "type": "Feature",
+            "properties": properties,
+            "geometry": shapely.geometry.mapping(geo),
+        }
+        for geo, properties in all_points
+    ]
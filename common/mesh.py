@@ -0,0 +1,76 @@
+# JIS X 0410 mesh codes covered by XYZ tiles
+# 1st mesh: 2/3 deg (lat) x 1 deg (lng), e.g. 5739
+# 2nd mesh: 1/8 of 1st mesh; 1/12 deg (lat) x 1/8 deg (lng), e.g. 573926; Same as vg67 shapefile names
+# Shared among stages; Symlinked into each stage directory
+
+import math
+
+# 2nd meshes per degree
+MESH2_ROWS_PER_LAT = 12
+MESH2_COLS_PER_LNG = 8
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    n = 1 << z
+
+    def lat(y: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+
+    return x / n * 360 - 180, lat(y + 1), (x + 1) / n * 360 - 180, lat(y)
+
+
+def mesh2_code(row: int, col: int) -> str:
+    return f"{row // 8:02d}{col // 8 - 100:02d}{row % 8}{col % 8}"
+
+
+# 2nd mesh codes overlapping the tile; 1st mesh codes instead if more than max_meshes
+def tile_meshes(z: int, x: int, y: int, max_meshes: int) -> list[str]:
+    west, south, east, north = tile_bounds(z, x, y)
+    rows = range(
+        math.floor(south * MESH2_ROWS_PER_LAT), math.ceil(north * MESH2_ROWS_PER_LAT)
+    )
+    cols = range(
+        math.floor(west * MESH2_COLS_PER_LNG), math.ceil(east * MESH2_COLS_PER_LNG)
+    )
+
+    if len(rows) * len(cols) <= max_meshes:
+        return [mesh2_code(r, c) for r in rows for c in cols]
+
+    return sorted({mesh2_code(r, c)[:4] for r in rows for c in cols})
+
+
+# Bounds of a 2nd mesh, e.g. "573926"; Inverse of mesh2_code
+def mesh2_bounds(code: str) -> tuple[float, float, float, float]:
+    row = int(code[:2]) * 8 + int(code[4])
+    col = (int(code[2:4]) + 100) * 8 + int(code[5])
+    return (
+        col / MESH2_COLS_PER_LNG,
+        row / MESH2_ROWS_PER_LAT,
+        (col + 1) / MESH2_COLS_PER_LNG,
+        (row + 1) / MESH2_ROWS_PER_LAT,
+    )
+
+
+# Tiles overlapping the bounds as (min x, min y, max x, max y), inclusive
+# buffer: Margin in tile widths, e.g. tippecanoe buffer 5 (of 256) -> 5 / 256
+def bounds_tiles(
+    z: int, bounds: tuple[float, float, float, float], buffer: float = 0
+) -> tuple[int, int, int, int]:
+    n = 1 << z
+    west, south, east, north = bounds
+
+    def tile_x(lng: float) -> float:
+        return (lng + 180) / 360 * n
+
+    def tile_y(lat: float) -> float:
+        return (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+
+    def clamp(v: float) -> int:
+        return min(max(math.floor(v), 0), n - 1)
+
+    return (
+        clamp(tile_x(west) - buffer),
+        clamp(tile_y(north) - buffer),
+        clamp(tile_x(east) + buffer),
+        clamp(tile_y(south) + buffer),
+    )
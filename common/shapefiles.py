@@ -0,0 +1,20 @@
+# Shapefiles of meshes, e.g. vg67/vg67_01/shp644441/p644441.shp
+# Shared among stages; Symlinked into each stage directory
+
+import pathlib
+
+
+# mesh (lower stem of the file, e.g. "p644441") -> path; Pick shallowest path for a mesh
+# Background: Some origin data have multiple shapefiles for a mesh. Deeper shapefiles tend to be an old or duplicate one.
+def mesh_shapefiles(files: list[str]) -> dict[str, pathlib.Path]:
+    mesh_path: dict[str, pathlib.Path] = {}
+    for f in files:
+        path = pathlib.Path(f)
+        if p := mesh_path.get(path.stem.lower()):
+            if len(p.parents) < len(path.parents):
+                # Prior shallower path
+                continue
+
+        mesh_path[path.stem.lower()] = path
+
+    return mesh_path
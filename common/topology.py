@@ -0,0 +1,258 @@
+# Shared-arc topology of polygons, in TopoJSON
+# Shared among stages; Symlinked into each stage directory
+#
+# Rings are cut into arcs at junctions, vertices with other than 2 neighbors, and at the start of each ring.
+# A border shared by adjacent polygons becomes one arc; Rings refer to arcs by index, ~index for reversed.
+# Coordinates are integers in 1e-7 degree units (See quantize), so geojsoner output round-trips exactly,
+# except points off the grid (e.g. intersections made by make_valid) snapping to it.
+
+import pathlib
+from dataclasses import dataclass
+
+import numpy as np
+import shapely
+from geojson_io import dump_geojson, load_geojson
+from quantize import PRECISION, dequantize, pack, quantize
+
+
+@dataclass
+class Topology:
+    # Quantized coordinates of all the arcs, concatenated
+    xy: np.ndarray
+    # Start of each arc in xy, and the end of the last arc
+    arc_offsets: np.ndarray
+    # Arc references of rings of each polygon; Exterior first
+    polygons: list[list[list[int]]]
+
+    def arc(self, i: int) -> np.ndarray:
+        return self.xy[self.arc_offsets[i] : self.arc_offsets[i + 1]]
+
+
+def build(polygons: list[shapely.Polygon]) -> Topology:
+    rings, ring_polygons = shapely.get_rings(polygons, return_index=True)
+    xy, vertex_rings = shapely.get_coordinates(rings, return_index=True)
+    q = quantize(xy)
+    points, point = np.unique(pack(q), return_inverse=True)
+    point = point.reshape(-1)
+
+    # Neighbors of each point over all the rings
+    a = np.flatnonzero(vertex_rings[:-1] == vertex_rings[1:])
+    edges = np.unique(
+        np.minimum(point[a], point[a + 1]) * len(points)
+        + np.maximum(point[a], point[a + 1])
+    )
+    degree = np.bincount(edges // len(points), minlength=len(points)) + np.bincount(
+        edges % len(points), minlength=len(points)
+    )
+    junction = degree != 2
+    ring_starts = np.searchsorted(vertex_rings, np.arange(len(rings) + 1))
+    junction[point[ring_starts[:-1]]] = True
+
+    # Arcs by the first segment of each direction
+    arc_keys: dict[tuple[int, int], int] = {}
+    arc_points: list[np.ndarray] = []
+    topology_polygons: list[list[list[int]]] = [[] for _ in polygons]
+    for r, (start, end) in enumerate(zip(ring_starts[:-1], ring_starts[1:])):
+        ids = point[start:end]
+        cuts = np.flatnonzero(junction[ids[:-1]]).tolist()
+        refs = []
+        for cut, next_cut in zip(cuts, [*cuts[1:], len(ids) - 1]):
+            chain = ids[cut : next_cut + 1]
+            forward = (int(chain[0]), int(chain[1]))
+            backward = (int(chain[-1]), int(chain[-2]))
+            if forward in arc_keys:
+                refs.append(arc_keys[forward])
+            elif backward in arc_keys:
+                refs.append(~arc_keys[backward])
+            else:
+                arc_keys[forward] = len(arc_points)
+                refs.append(len(arc_points))
+                arc_points.append(chain)
+        topology_polygons[ring_polygons[r]].append(refs)
+
+    # Coordinates of each point
+    point_xy = np.empty((len(points), 2), dtype=q.dtype)
+    point_xy[point] = q
+    return Topology(
+        point_xy[np.concatenate(arc_points)] if arc_points else q[:0],
+        np.cumsum([0, *(len(p) for p in arc_points)]),
+        topology_polygons,
+    )
+
+
+def to_polygons(topology: Topology) -> list[shapely.Polygon]:
+    refs, ref_rings, ring_polygons = [], [], []
+    for i, rings in enumerate(topology.polygons):
+        for ring in rings:
+            refs.extend(ring)
+            ref_rings.extend([len(ring_polygons)] * len(ring))
+            ring_polygons.append(i)
+    refs = np.array(refs, dtype=np.int64)
+    ref_rings = np.array(ref_rings, dtype=np.int64)
+    reversed_ = refs < 0
+    arcs = np.where(reversed_, ~refs, refs)
+
+    # Arcs of a ring share their ends; Later arcs skip the first position
+    first = np.concatenate([[True], ref_rings[1:] != ref_rings[:-1]])
+    skip = (~first).astype(np.int64)
+    counts = topology.arc_offsets[arcs + 1] - topology.arc_offsets[arcs] - skip
+    repeated = np.repeat(np.arange(len(refs)), counts)
+    nth = np.arange(len(repeated)) - np.repeat(np.cumsum(counts) - counts, counts)
+    nth += skip[repeated]
+    positions = np.where(
+        reversed_[repeated],
+        topology.arc_offsets[arcs + 1][repeated] - 1 - nth,
+        topology.arc_offsets[arcs][repeated] + nth,
+    )
+
+    # Polygons without rings (e.g. POLYGON EMPTY) stay empty; One polygon for each of topology.polygons
+    polygons = np.full(len(topology.polygons), shapely.Polygon(), dtype=object)
+    if len(ring_polygons) == 0:
+        return polygons.tolist()
+    rings = shapely.linearrings(
+        dequantize(topology.xy[positions]), indices=ref_rings[repeated]
+    )
+    # The first ring of each polygon is the exterior; Indices of shapely.polygons must have no gaps
+    with_rings, indices = np.unique(ring_polygons, return_inverse=True)
+    polygons[with_rings] = shapely.polygons(rings, indices=indices.reshape(-1))
+    return polygons.tolist()
+
+
+def arc_lengths(topology: Topology) -> np.ndarray:
+    xy = dequantize(topology.xy)
+    distances = np.sqrt(((xy[1:] - xy[:-1]) ** 2).sum(axis=1))
+    # Segments within each arc only
+    distances[topology.arc_offsets[1:-1] - 1] = 0
+    cumulative = np.concatenate([[0], np.cumsum(distances)])
+    return (
+        cumulative[topology.arc_offsets[1:] - 1] - cumulative[topology.arc_offsets[:-1]]
+    )
+
+
+# Border length of each pair of polygons sharing arcs, in degrees: (i, j, length); Both (i, j) and (j, i)
+def border_lengths(topology: Topology) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    lengths = arc_lengths(topology)
+    n = len(topology.polygons)
+    arc_users = np.unique(
+        [
+            (ref if ref >= 0 else ~ref) * n + i
+            for i, rings in enumerate(topology.polygons)
+            for refs in rings
+            for ref in refs
+        ]
+    ).astype(np.int64)
+    arcs, users = arc_users // n, arc_users % n
+
+    # Each user j of the arc for each user i
+    starts = np.searchsorted(arcs, arcs, side="left")
+    counts = np.searchsorted(arcs, arcs, side="right") - starts
+    repeated = np.repeat(np.arange(len(arcs)), counts)
+    nth = np.arange(len(repeated)) - np.repeat(np.cumsum(counts) - counts, counts)
+    i = users[repeated]
+    j = users[starts[repeated] + nth]
+    shared = i != j
+
+    pairs, pair_index = np.unique(i[shared] * n + j[shared], return_inverse=True)
+    pair_lengths = np.bincount(
+        pair_index.reshape(-1), lengths[arcs[repeated[shared]]], minlength=len(pairs)
+    )
+    return pairs // n, pairs % n, pair_lengths
+
+
+# Features of Polygon / MultiPolygon with integer or string properties as a TopoJSON file
+# Members of the collection other than features (e.g. name, crs of geojsoner) are kept in "members"
+def dump_topology(collection: dict, path: pathlib.Path) -> Topology:
+    polygons = []
+    feature_parts = []
+    for feature in collection["features"]:
+        geom = shapely.geometry.shape(feature["geometry"])
+        parts = shapely.get_parts(geom).tolist()
+        feature_parts.append((feature, len(polygons), len(parts)))
+        polygons.extend(parts)
+    topology = build(polygons)
+
+    geometries = []
+    for feature, start, count in feature_parts:
+        arcs = topology.polygons[start : start + count]
+        if feature["geometry"]["type"] == "Polygon":
+            geometry = {"type": "Polygon", "arcs": arcs[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "arcs": arcs}
+        geometries.append({**geometry, "properties": feature["properties"]})
+
+    # Delta-encoded arcs; The first position is absolute
+    arcs = []
+    for i in range(len(topology.arc_offsets) - 1):
+        arc = topology.arc(i).astype(np.int64)
+        arcs.append(np.concatenate([arc[:1], np.diff(arc, axis=0)]).tolist())
+
+    value = {
+        "type": "Topology",
+        "transform": {"scale": [10.0**-PRECISION] * 2, "translate": [0, 0]},
+        "members": {
+            k: v for k, v in collection.items() if k not in ("type", "features")
+        },
+        "objects": {
+            "features": {"type": "GeometryCollection", "geometries": geometries}
+        },
+        "arcs": arcs,
+    }
+    dump_geojson(value, path)
+    return topology
+
+
+def load_topology(path: pathlib.Path) -> tuple[dict, Topology, list[int]]:
+    value = load_geojson(path)
+    if value["transform"]["scale"] != [10.0**-PRECISION] * 2:
+        raise RuntimeError(f"Unsupported transform: {value['transform']}")
+
+    # Undo delta encoding of all the arcs at once
+    offsets = np.cumsum([0, *(len(arc) for arc in value["arcs"])])
+    deltas = np.array(
+        [position for arc in value["arcs"] for position in arc], dtype=np.int64
+    ).reshape(-1, 2)
+    cumulative = np.cumsum(deltas, axis=0)
+    # Sum of deltas before each arc; No arcs for no features
+    starts = np.zeros((len(offsets) - 1, 2), dtype=np.int64)
+    starts[1:] = cumulative[offsets[1:-1] - 1]
+    xy = cumulative - np.repeat(starts, np.diff(offsets), axis=0)
+
+    polygons = []
+    # Number of polygons of each feature
+    feature_parts = []
+    for geometry in value["objects"]["features"]["geometries"]:
+        match geometry["type"]:
+            case "Polygon":
+                parts = [geometry["arcs"]]
+            case "MultiPolygon":
+                parts = geometry["arcs"]
+            case _:
+                raise RuntimeError(f"Unknown geometry type: {geometry['type']}")
+        polygons.extend(parts)
+        feature_parts.append(len(parts))
+
+    topology = Topology(xy, offsets, polygons)
+    return value, topology, feature_parts
+
+
+# GeoJSON FeatureCollection of a TopoJSON file written by dump_topology
+def to_collection(value: dict, topology: Topology, feature_parts: list[int]) -> dict:
+    polygons = to_polygons(topology)
+    features = []
+    start = 0
+    for geometry, count in zip(
+        value["objects"]["features"]["geometries"], feature_parts
+    ):
+        parts = polygons[start : start + count]
+        start += count
+        geom = (
+            parts[0] if geometry["type"] == "Polygon" else shapely.MultiPolygon(parts)
+        )
+        features.append(
+            {
+                "type": "Feature",
+                "geometry": shapely.geometry.mapping(geom),
+                "properties": geometry["properties"],
+            }
+        )
+    return {"type": "FeatureCollection", **value["members"], "features": features}
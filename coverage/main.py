@@ -0,0 +1,97 @@
+import argparse
+import glob
+import json
+import pathlib
+
+
+def merge(mesh_coverage_files: list[str]) -> dict[int, dict]:
+    codes: dict[int, dict] = {}
+    for file in sorted(mesh_coverage_files):
+        mesh_coverage = json.load(open(file))
+        mesh = mesh_coverage["mesh"]
+        for code_str, c in mesh_coverage["codes"].items():
+            code = int(code_str)
+            if (merged := codes.get(code)) is None:
+                codes[code] = {"n": c["n"], "a": c["a"], "b": c["b"], "m": [mesh]}
+                continue
+
+            merged["n"] += c["n"]
+            merged["a"] += c["a"]
+            merged["b"] = [
+                min(merged["b"][0], c["b"][0]),
+                min(merged["b"][1], c["b"][1]),
+                max(merged["b"][2], c["b"][2]),
+                max(merged["b"][3], c["b"][3]),
+            ]
+            merged["m"].append(mesh)
+
+    return dict(sorted(codes.items()))
+
+
+# Same fallback as SAI_RAW_CODE_NAMES in page/consts.js: 010100 -> chu 0101, 010000 -> dai 01
+def has_name(code: int, sai: dict, chu: dict, dai: dict) -> bool:
+    if str(code) in sai:
+        return True
+    if code % 100 == 0 and str(code // 100) in chu:
+        return True
+    if code % 10000 == 0 and str(code // 10000) in dai:
+        return True
+    return False
+
+
+def check(data_dir: pathlib.Path, codes: dict[int, dict]) -> bool:
+    sai_colors = json.load(open(data_dir / "style/vg67_sai_style.json"))
+    sai_names = json.load(open(data_dir / "hanrei/names/sai.json"))
+    chu_names = json.load(open(data_dir / "hanrei/names/chu.json"))
+    dai_names = json.load(open(data_dir / "hanrei/names/dai.json"))
+
+    ok = True
+    for code, c in codes.items():
+        if str(code) not in sai_colors:
+            ok = False
+            print(f"No color for {code:06}: {c['n']} features in {', '.join(c['m'])}")
+        if not has_name(code, sai_names, chu_names, dai_names):
+            ok = False
+            print(f"No name for {code:06}: {c['n']} features in {', '.join(c['m'])}")
+
+    return ok
+
+
+def main(coverage_pattern: str, data_dir: pathlib.Path, run_check: bool):
+    out = data_dir / "coverage/coverage.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+
+    codes = merge(glob.glob(coverage_pattern, recursive=True))
+    json.dump(codes, open(out, "w"), separators=(",", ":"))
+
+    if run_check and not check(data_dir, codes):
+        raise RuntimeError("Some codes in the data are missing in color / name tables")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "coverage", "Merge per-mesh code coverage files generated by geojsoner"
+    )
+    parser.add_argument(
+        "-c",
+        "--coverage-pattern",
+        help="Python glob library style file pattern locating per-mesh coverage files",
+        type=str,
+        default=str(
+            pathlib.Path(__file__).parent.parent / "data/coverage/meshes/*.json"
+        ),
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        help="Base directory for input and output files",
+        type=pathlib.Path,
+        default=pathlib.Path(__file__).parent.parent / "data",
+    )
+    parser.add_argument(
+        "--check",
+        help="Check all codes have colors and names (Run colormap and hanrei_crawler in advance)",
+        action="store_true",
+    )
+    args = parser.parse_args()
+    main(args.coverage_pattern, args.data_dir, args.check)
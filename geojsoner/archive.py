@@ -0,0 +1,71 @@
+# Locate shapefiles in vg67 zip archives without extracting them
+# Member lists are cached by path, size and mtime of archives; Reading central directories of many archives on a network filesystem is slow.
+
+import fcntl
+import json
+import os
+import pathlib
+import zipfile
+
+
+class Catalog:
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.archives = self.load()
+        # Entries read from archives by this process
+        self.added: dict[str, dict] = {}
+
+    def load(self) -> dict[str, dict]:
+        if not self.path.exists():
+            return {}
+        return json.load(open(self.path))
+
+    def members(self, archive: pathlib.Path) -> list[str]:
+        key = str(archive.absolute())
+        stat = archive.stat()
+        cached = self.archives.get(key)
+        if (
+            cached is not None
+            and cached["size"] == stat.st_size
+            and cached["mtime_ns"] == stat.st_mtime_ns
+        ):
+            return cached["members"]
+
+        with zipfile.ZipFile(archive) as z:
+            members = [name for name in z.namelist() if not name.endswith("/")]
+        self.added[key] = {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "members": members,
+        }
+        self.archives[key] = self.added[key]
+        return members
+
+    def save(self):
+        if len(self.added) == 0:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Parallel processes (e.g. xargs -P) save at the same time
+        # Merge into the latest catalog under the lock so entries of others are kept
+        with open(self.path.with_name(f"{self.path.name}.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self.archives = {**self.load(), **self.added}
+            # Replace at once; Readers without the lock see either version
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp, "w") as f:
+                json.dump(self.archives, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        self.added = {}
+
+
+# Path of each shapefile as if extracted next to the archive (e.g. /foo/vg67_01.zip/shp644441/p644441.shp) -> path for fiona
+# The former keeps the depth of members for the shallowest-path dedup
+def zip_shapefiles(archives: list[str], catalog: Catalog) -> dict[pathlib.Path, str]:
+    shapefiles = {}
+    for archive in sorted(archives):
+        path = pathlib.Path(archive).absolute()
+        for member in catalog.members(path):
+            if member.lower().endswith(".shp"):
+                shapefiles[path / member] = f"zip://{path}!{member}"
+    catalog.save()
+    return shapefiles
@@ -1,67 +1,168 @@
-# Remove invalid data from vg64
+# Remove invalid data from vg64 by rules in cleanup.toml
+# Rules run on flattened coordinate arrays of a whole mesh; Meshes without rules are not touched.
+
+import pathlib
+import tomllib
 
 import fiona
+import numpy as np
+from quantize import round_coordinates
+
+RULES_PATH = pathlib.Path(__file__).parent / "cleanup.toml"
+
+# type -> required keys
+RULE_TYPES = {
+    "drop_ids": ["ids"],
+    "snap": ["precision"],
+    "drop_degenerate": [],
+}
+
+
+# mesh -> rules in order
+def load_rules(path: pathlib.Path = RULES_PATH) -> dict[str, list[dict]]:
+    with open(path, "rb") as f:
+        rules = tomllib.load(f)
+
+    for mesh, mesh_rules in rules.items():
+        if not isinstance(mesh_rules, list):
+            raise RuntimeError(f"Rules of {mesh} must be an array of tables: {path}")
+        for rule in mesh_rules:
+            if (required := RULE_TYPES.get(rule.get("type"))) is None:
+                raise RuntimeError(f"Unknown rule type of {mesh}: {rule}")
+            if missing := [key for key in required if key not in rule]:
+                raise RuntimeError(f"Missing {missing} in a rule of {mesh}: {rule}")
+    return rules
+
+
+# Coordinates of (Multi)Polygon records in flat arrays
+class Rings:
+    def __init__(self, records: list[fiona.Feature]):
+        rings = []
+        # Indexes of the polygon for each ring, and of the record for each polygon
+        ring_polygons = []
+        polygon_records = []
+        self.exteriors = []
+        for i, record in enumerate(records):
+            geom: fiona.Geometry
+            geom = record.geometry  # type: ignore
+            match geom.type:
+                case "MultiPolygon":
+                    polygons = geom.coordinates
+                case "Polygon":
+                    polygons = [geom.coordinates]
+                case _:
+                    raise RuntimeError(f"Unknown record type: {geom.type}")
+
+            for polygon in polygons:  # type: ignore
+                for j, ring in enumerate(polygon):
+                    rings.append(np.asarray(ring, dtype=np.float64).reshape(-1, 2))
+                    ring_polygons.append(len(polygon_records))
+                    self.exteriors.append(j == 0)
+                polygon_records.append(i)
+
+        self.xy = np.concatenate(rings) if rings else np.empty((0, 2))
+        self.offsets = np.cumsum([0, *(len(ring) for ring in rings)])
+        self.ring_polygons = np.array(ring_polygons, dtype=np.int64)
+        self.polygon_records = np.array(polygon_records, dtype=np.int64)
+        self.exteriors = np.array(self.exteriors, dtype=bool)
 
+    def ring_lengths(self) -> np.ndarray:
+        return np.diff(self.offsets)
 
-# id 1490 polygon is invalid; That has only two points in coordinates.
-def p584170(
-    collection: fiona.Collection, record: fiona.Feature
-) -> fiona.Feature | None:
-    if record.id == "1490":  # type: ignore
-        return None
-    else:
-        return record
+    # Absolute shoelace area of each ring
+    def ring_areas(self) -> np.ndarray:
+        lengths = self.ring_lengths()
+        vertex_rings = np.repeat(np.arange(len(lengths)), lengths)
+        # Next vertex in the same ring; The last one goes to the first
+        next_vertex = np.arange(len(self.xy)) + 1
+        ends = self.offsets[1:][lengths > 0] - 1
+        next_vertex[ends] = self.offsets[:-1][lengths > 0]
+        x, y = self.xy[:, 0], self.xy[:, 1]
+        cross = x * y[next_vertex] - x[next_vertex] * y
+        return np.abs(np.bincount(vertex_rings, cross, len(lengths))) / 2
 
+    def coordinates(self, ring: int) -> list:
+        return self.xy[self.offsets[ring] : self.offsets[ring + 1]].tolist()
 
-# Many polygons reside apart; Round with ~1m
-def p573926(
-    collection: fiona.Collection, record: fiona.Feature
-) -> fiona.Feature | None:
-    geom: fiona.Geometry
-    geom = record.geometry  # type: ignore
-    latlng_precision = 5  # approx. 1m
+
+def drop_ids(records: list[fiona.Feature], rule: dict) -> np.ndarray:
+    ids = np.array([record.id for record in records], dtype=object)
+    return ~np.isin(ids, [str(i) for i in rule["ids"]])
+
+
+def snap(collection: fiona.Collection, rings: Rings, rule: dict):
     minx, miny, maxx, maxy = collection.bounds  # type: ignore
+    rounded = round_coordinates(rings.xy, rule["precision"])
+    # Border check. Use original value if border; will be rounded after
+    outside = (rounded < [minx, miny]) | (rounded > [maxx, maxy])
+    rings.xy = np.where(outside, rings.xy, rounded)
 
-    def round_p(x, y):
-        r_x = round(x, latlng_precision)
-        r_y = round(y, latlng_precision)
-
-        # Border check. Use original value if border; will be rounded after
-        new_x = x if r_x < minx or r_x > maxx else r_x
-        new_y = y if r_y < miny or r_y > maxy else r_y
-
-        return new_x, new_y
-
-    match geom.type:
-        case "MultiPolygon":
-            new_geom = fiona.Geometry(
-                type=geom.type,
-                coordinates=[
-                    [
-                        [round_p(x, y) for (x, y) in coordinate]
-                        for coordinate in coordinates
-                    ]
-                    for coordinates in geom.coordinates  # type: ignore
-                ],
-            )
-        case "Polygon":
-            new_geom = fiona.Geometry(
-                type=geom.type,
-                coordinates=[
-                    [round_p(x, y) for (x, y) in coordinate]
-                    for coordinate in geom.coordinates  # type: ignore
-                ],
-            )
-        case _:
-            raise RuntimeError(f"Unknown record type: {record.type}")
-
-    return fiona.Feature(
-        geometry=new_geom,
-        properties=record.properties,
+
+# Returns rings to keep
+def drop_degenerate(rings: Rings, rule: dict) -> np.ndarray:
+    keep = (rings.ring_lengths() >= rule.get("min_points", 4)) & (
+        rings.ring_areas() > rule.get("min_area", 0)
     )
+    # Holes go with the exterior
+    polygon_keep = np.ones(len(rings.polygon_records), dtype=bool)
+    polygon_keep[rings.ring_polygons[rings.exteriors & ~keep]] = False
+    return keep & polygon_keep[rings.ring_polygons]
 
 
-CLEANUP_FUNCTIONS = {
-    "p584170": p584170,
-    "p573926": p573926,
-}
+def rebuild(
+    records: list[fiona.Feature], rings: Rings, ring_keep: np.ndarray
+) -> list[fiona.Feature | None]:
+    polygons: list[list[list]] = [[] for _ in range(len(records))]
+    current = None
+    for ring in np.flatnonzero(ring_keep).tolist():
+        polygon = int(rings.ring_polygons[ring])
+        if polygon != current:
+            polygons[rings.polygon_records[polygon]].append([])
+            current = polygon
+        polygons[rings.polygon_records[polygon]][-1].append(rings.coordinates(ring))
+
+    new_records: list[fiona.Feature | None] = []
+    for record, record_polygons in zip(records, polygons):
+        if len(record_polygons) == 0:
+            new_records.append(None)
+            continue
+        geom_type = record.geometry.type  # type: ignore
+        new_geom = fiona.Geometry(
+            type=geom_type,
+            coordinates=(
+                record_polygons if geom_type == "MultiPolygon" else record_polygons[0]
+            ),
+        )
+        new_records.append(
+            fiona.Feature(geometry=new_geom, properties=record.properties, id=record.id)
+        )
+    return new_records
+
+
+# Returns records in the same order; None for dropped records
+def cleanup(
+    collection: fiona.Collection, records: list[fiona.Feature], rules: list[dict]
+) -> list[fiona.Feature | None]:
+    keep = np.ones(len(records), dtype=bool)
+    rings = None
+    ring_keep = None
+    for rule in rules:
+        if rule["type"] == "drop_ids":
+            keep &= drop_ids(records, rule)
+            continue
+
+        # Rules on coordinates
+        if rings is None:
+            rings = Rings(records)
+            ring_keep = np.ones(len(rings.ring_polygons), dtype=bool)
+        match rule["type"]:
+            case "snap":
+                snap(collection, rings, rule)
+            case "drop_degenerate":
+                ring_keep &= drop_degenerate(rings, rule)
+
+    if rings is None:
+        return [record if k else None for record, k in zip(records, keep.tolist())]
+
+    new_records = rebuild(records, rings, ring_keep)  # type: ignore
+    return [record if k else None for record, k in zip(new_records, keep.tolist())]
@@ -0,0 +1,47 @@
+# Collect which HANREI codes appear in a mesh, and where
+
+from dataclasses import dataclass, field
+
+import shapely
+
+
+@dataclass
+class CodeCoverage:
+    count: int = 0
+    # Square degrees (WGS84), the same unit as trimmer
+    area: float = 0
+    bounds: tuple[float, float, float, float] | None = None
+
+    def add(self, geom: shapely.Geometry):
+        self.count += 1
+        self.area += geom.area  # type: ignore
+        minx, miny, maxx, maxy = geom.bounds  # type: ignore
+        if self.bounds is None:
+            self.bounds = (minx, miny, maxx, maxy)
+        else:
+            self.bounds = (
+                min(self.bounds[0], minx),
+                min(self.bounds[1], miny),
+                max(self.bounds[2], maxx),
+                max(self.bounds[3], maxy),
+            )
+
+
+@dataclass
+class MeshCoverage:
+    mesh: str
+    codes: dict[int, CodeCoverage] = field(default_factory=dict)
+
+    def add(self, code: int, geom: shapely.Geometry):
+        if (coverage := self.codes.get(code)) is None:
+            coverage = self.codes[code] = CodeCoverage()
+        coverage.add(geom)
+
+    def to_json(self) -> dict:
+        return {
+            "mesh": self.mesh,
+            "codes": {
+                code: {"n": c.count, "a": c.area, "b": c.bounds}
+                for code, c in sorted(self.codes.items())
+            },
+        }
@@ -5,9 +5,22 @@ import pathlib
 
 import fiona
 import fiona.transform
+import numpy as np
 import shapely
-from cleanup import CLEANUP_FUNCTIONS
+from archive import Catalog, zip_shapefiles
+from cleanup import cleanup, load_rules
+from code_coverage import MeshCoverage
 from fiona.crs import CRS
+from geojson_io import dump_geojson
+from instrument import (
+    FileStats,
+    Instrument,
+    add_instrument_arguments,
+    instrument_from_args,
+)
+from labels import representative_points, thin_out, to_features
+from quantize import round_coordinates
+from shapefiles import mesh_shapefiles
 
 EPSG_JDG2000 = CRS.from_epsg(4612)
 EPSG_WGS84 = CRS.from_epsg(4326)
@@ -20,140 +33,202 @@ WGS84_CRS_GEOJSON = {
 LATLNG_PRECISION = 7  # approx. 1cm
 
 
-# Pick shallowest path for a mesh
-# Background: Some origin data have multiple shapefiles for a mesh. Deeper shapefiles tend to be an old or duplicate one.
-def unique_files(files: list[str]) -> list[pathlib.Path]:
-    mesh_path = {}
-    for f in files:
-        path = pathlib.Path(f)
-        if p := mesh_path.get(path.stem.lower()):
-            if len(p.parents) < len(path.parents):
-                # Prior shallower path
-                continue
+ALLOWED_GEO_TYPES = [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON]
 
-        mesh_path[path.stem.lower()] = path
 
-    return [*mesh_path.values()]
+# Make valid some invalid shapes of a mesh at once
+# Returns valid geometries, indexes of their source geometries and the number of repaired geometries
+def make_valid(geoms: np.ndarray) -> tuple[np.ndarray, np.ndarray, int]:
+    invalid = ~shapely.is_valid(geoms)
+    valid_geoms = geoms.copy()
+    valid_geoms[invalid] = shapely.make_valid(geoms[invalid])
 
+    # Take members of collections; (Multi)Polygons in a collection are kept as is
+    collection = (
+        shapely.get_type_id(valid_geoms) == shapely.GeometryType.GEOMETRYCOLLECTION
+    )
+    parts, part_indexes = shapely.get_parts(valid_geoms[collection], return_index=True)
+    indexes = np.concatenate(
+        [np.flatnonzero(~collection), np.flatnonzero(collection)[part_indexes]]
+    )
+    valid_geoms = np.concatenate([valid_geoms[~collection], parts])
+    # Keep the source order; Parts of a collection are in order
+    order = np.argsort(indexes, kind="stable")
+    valid_geoms, indexes = valid_geoms[order], indexes[order]
 
-ALLOWED_GEO_TYPES = ["Polygon", "MultiPolygon"]
+    # Some shape has zero area coodinates which should be called (Multi)LineStrings.
+    allowed = np.isin(shapely.get_type_id(valid_geoms), ALLOWED_GEO_TYPES)
+    return (
+        shapely.remove_repeated_points(valid_geoms[allowed]),
+        indexes[allowed],
+        int(invalid.sum()),
+    )
 
 
-# Make valid some invalid shapes
-def make_valid(geo: shapely.Geometry) -> list[shapely.Polygon | shapely.MultiPolygon]:
-    if geo.is_valid:  # type: ignore
-        return [shapely.remove_repeated_points(geo)]  # type: ignore
+# source: path of the shapefile for fiona, e.g. zip://foo.zip!bar/p533945.shp
+def process_file(
+    path: pathlib.Path,
+    source: str | pathlib.Path,
+    output_dir: pathlib.Path,
+    coverage_dir: pathlib.Path,
+    labels_dir: pathlib.Path | None,
+    rules: list[dict] | None,
+    stats: FileStats,
+):
+    out = output_dir / f"{path.stem.lower()}.geojson"
+    coverage = MeshCoverage(path.stem.lower())
+    with fiona.open(source, encoding="Shift_JIS", crs=EPSG_JDG2000) as colxn:
+        hanrei_key = (
+            "HANREI_C" if "HANREI_C" in colxn.schema["properties"] else "Hanrei_C"
+        )
 
-    valid_geo = shapely.make_valid(geo)
+        geoms = []
+        codes = []
 
-    if type(valid_geo) == shapely.GeometryCollection:
-        for g in valid_geo.geoms:
-            if not g.is_valid:
-                print(g.is_valid)
-        return [shapely.remove_repeated_points(x) for x in valid_geo.geoms if x.geom_type in ALLOWED_GEO_TYPES]  # type: ignore
-    else:
-        if valid_geo.geom_type not in ALLOWED_GEO_TYPES:
-            # Some shape has zero area coodinates which should be called (Multi)LineStrings.
-            return []
-        else:
-            return [shapely.remove_repeated_points(valid_geo)]  # type: ignore
+        records = colxn
+        if rules is not None:
+            with stats.phase("cleanup"):
+                records = cleanup(colxn, list(colxn), rules)
+
+        for record in records:
+            stats.count("records")
+            if record is None:
+                stats.count("cleaned_up")
+                continue
+
+            with stats.phase("transform"):
+                wgs_geom = fiona.transform.transform_geom(
+                    EPSG_JDG2000, EPSG_WGS84, record.geometry
+                )
 
+                if wgs_geom.type not in ["MultiPolygon", "Polygon"]:
+                    raise RuntimeError(f"Unknown record type: {record.type}")
+                geoms.append(shapely.geometry.shape(wgs_geom))
+            codes.append(int(record.properties[hanrei_key]))  # type: ignore
 
-def main(shapefile_pattern: str, output_dir: pathlib.Path):
-    if output_dir.exists() and not output_dir.is_dir():
-        raise RuntimeError(
-            f"Output directory: {output_dir.absolute()} is not a directory"
+    # Round all vertices at once; Same as round(v, LATLNG_PRECISION) for each
+    with stats.phase("round"):
+        rounded_geoms = shapely.transform(
+            np.array(geoms, dtype=object),
+            lambda xy: round_coordinates(xy, LATLNG_PRECISION),
         )
-    output_dir.mkdir(parents=True, exist_ok=True)
 
-    files = unique_files(glob.glob(shapefile_pattern, recursive=True))
-    for path in files:
-        print(path.absolute())
-        out = output_dir / f"{path.stem.lower()}.geojson"
-        cleanup_function = CLEANUP_FUNCTIONS.get(path.stem.lower())
-        with fiona.open(path, encoding="Shift_JIS", crs=EPSG_JDG2000) as colxn:
-            hanrei_key = (
-                "HANREI_C" if "HANREI_C" in colxn.schema["properties"] else "Hanrei_C"
-            )
+    with stats.phase("make_valid"):
+        valid_geoms, indexes, repaired = make_valid(rounded_geoms)
+    dropped = len(geoms) - len(np.unique(indexes))
+    stats.count("repaired", repaired)
+    stats.count("dropped", dropped)
+    if repaired > 0 or dropped > 0:
+        print(f"Repaired: {repaired}, Dropped: {dropped}")
 
-            features = []
+    features = []
+    for valid_geom, i in zip(valid_geoms, indexes.tolist()):
+        coverage.add(codes[i], valid_geom)
+        new_feature = {
+            "type": "Feature",
+            "geometry": shapely.geometry.mapping(valid_geom),
+            "properties": {"H": codes[i]},
+        }
+        features.append(new_feature)
+    stats.count("features", len(features))
+    stats.count("vertices", int(shapely.get_num_coordinates(valid_geoms).sum()))
 
-            for record in colxn:
-                if cleanup_function is not None:
-                    record = cleanup_function(colxn, record)
-                    if record is None:
-                        continue
+    output = {
+        "type": "FeatureCollection",
+        "name": out.stem.lower(),
+        "crs": WGS84_CRS_GEOJSON,
+        "features": features,
+    }
 
-                wgs_geom = fiona.transform.transform_geom(
-                    EPSG_JDG2000, EPSG_WGS84, record.geometry
+    with stats.phase("dump"):
+        dump_geojson(output, out)
+        json.dump(
+            coverage.to_json(),
+            open(coverage_dir / f"{out.stem}.json", "w"),
+            separators=(",", ":"),
+        )
+
+    if labels_dir is not None:
+        # Same as labeler on the output, without reading it again
+        with stats.phase("labels"):
+            labels = to_features(
+                thin_out(
+                    representative_points(
+                        (codes[i], valid_geom)
+                        for valid_geom, i in zip(valid_geoms, indexes.tolist())
+                    )
                 )
+            )
+        stats.count("labels", len(labels))
+        with stats.phase("dump_labels"):
+            dump_geojson({**output, "features": labels}, labels_dir / out.name)
 
-                match wgs_geom.type:
-                    case "MultiPolygon":
-                        new_geom = {
-                            "type": "MultiPolygon",
-                            "coordinates": [
-                                [
-                                    [
-                                        (
-                                            round(x, LATLNG_PRECISION),
-                                            round(y, LATLNG_PRECISION),
-                                        )
-                                        for (x, y) in coordinate
-                                    ]
-                                    for coordinate in coordinates
-                                ]
-                                for coordinates in wgs_geom.coordinates
-                            ],
-                        }
-                    case "Polygon":
-                        new_geom = {
-                            "type": "Polygon",
-                            "coordinates": [
-                                [
-                                    (
-                                        round(x, LATLNG_PRECISION),
-                                        round(y, LATLNG_PRECISION),
-                                    )
-                                    for (x, y) in coordinate
-                                ]
-                                for coordinate in wgs_geom.coordinates
-                            ],
-                        }
-                    case _:
-                        raise RuntimeError(f"Unknown record type: {record.type}")
-
-                valid_geoms = make_valid(shapely.geometry.shape(new_geom))
-
-                for valid_geom in valid_geoms:
-                    new_feature = {
-                        "type": "Feature",
-                        "geometry": shapely.geometry.mapping(valid_geom),
-                        "properties": {"H": int(record.properties[hanrei_key])},  # type: ignore
-                    }
-                    features.append(new_feature)
-
-        output = {
-            "type": "FeatureCollection",
-            "name": out.stem.lower(),
-            "crs": WGS84_CRS_GEOJSON,
-            "features": features,
-        }
 
-        json.dump(output, open(out, "w"), separators=(",", ":"))
+def main(
+    shapefile_pattern: str | None,
+    zip_pattern: str | None,
+    catalog_path: pathlib.Path,
+    output_dir: pathlib.Path,
+    coverage_dir: pathlib.Path,
+    labels_dir: pathlib.Path | None,
+    instrument: Instrument,
+):
+    for d in [output_dir, coverage_dir, *([labels_dir] if labels_dir else [])]:
+        if d.exists() and not d.is_dir():
+            raise RuntimeError(f"Output directory: {d.absolute()} is not a directory")
+        d.mkdir(parents=True, exist_ok=True)
+
+    # Only meshes with rules are cleaned up
+    rules = load_rules()
+
+    if zip_pattern is not None:
+        # Read shapefiles in archives as they are
+        sources = zip_shapefiles(
+            glob.glob(zip_pattern, recursive=True), Catalog(catalog_path)
+        )
+        files = [*mesh_shapefiles([str(path) for path in sources]).values()]
+    else:
+        shapefiles = glob.glob(shapefile_pattern, recursive=True)  # type: ignore
+        files = [*mesh_shapefiles(shapefiles).values()]
+        sources = {path: path for path in files}
+
+    for path in files:
+        print(path.absolute())
+        with instrument.file(path) as stats:
+            process_file(
+                path,
+                sources[path],
+                output_dir,
+                coverage_dir,
+                labels_dir,
+                rules.get(path.stem.lower()),
+                stats,
+            )
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         "geojsoner", "Export vg67 shape files as geojson files with some optimization"
     )
-    parser.add_argument(
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
         "-s",
         "--shapefile-pattern",
         help="Python glob library style file pattern locating shapefiles",
-        required=True,
+        type=str,
+    )
+    source.add_argument(
+        "-z",
+        "--zip-pattern",
+        help="Python glob library style file pattern locating zip archives of shapefiles; Read without extracting",
         type=str,
     )
+    parser.add_argument(
+        "--zip-catalog",
+        help="Cache file of members of zip archives",
+        type=pathlib.Path,
+        default=pathlib.Path("../data/cache/zip_catalog.json"),
+    )
     parser.add_argument(
         "-o",
         "--out-dir",
@@ -161,5 +236,27 @@ if __name__ == "__main__":
         type=pathlib.Path,
         default=pathlib.Path("../data/geojson"),
     )
+    parser.add_argument(
+        "-c",
+        "--coverage-dir",
+        help="Directory for output per-mesh code coverage files",
+        type=pathlib.Path,
+        default=pathlib.Path("../data/coverage/meshes"),
+    )
+    parser.add_argument(
+        "-l",
+        "--labels-dir",
+        help="Also write label geojson files (sai-labels) into this directory, same as labeler, e.g. ../data/geojson-trimmed/sai-labels",
+        type=pathlib.Path,
+    )
+    add_instrument_arguments(parser)
     args = parser.parse_args()
-    main(args.shapefile_pattern, args.out_dir)
+    main(
+        args.shapefile_pattern,
+        args.zip_pattern,
+        args.zip_catalog,
+        args.out_dir,
+        args.coverage_dir,
+        args.labels_dir,
+        instrument_from_args("geojsoner", args),
+    )
@@ -0,0 +1 @@
+../common/shapefiles.py
\ No newline at end of file
@@ -0,0 +1 @@
+../common/labels.py
\ No newline at end of file
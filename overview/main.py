@@ -0,0 +1,275 @@
+import argparse
+import glob
+import json
+import math
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+from geojson_io import dumps_geojson, load_geojson, loads_geojson
+from mesh import tile_bounds
+from quantize import round_coordinates
+
+ZOOMS = range(0, 6)
+TILE_SIZE = 256
+# Same as bounds of sources in page
+BOUNDS = (122, 24, 154, 46)
+# approx. 1m; Finer than pixels at zoom 5 enough
+COORDINATE_PRECISION = 5
+
+
+# Width of a pixel in degrees
+def pixel_degrees(z: int) -> float:
+    return 360 / (TILE_SIZE << z)
+
+
+def load(geojson_pattern: str) -> dict[int, list[shapely.Geometry]]:
+    code_geoms: dict[int, list[shapely.Geometry]] = {}
+    for file in sorted(glob.glob(geojson_pattern, recursive=True)):
+        for feature in load_geojson(pathlib.Path(file))["features"]:
+            code_geoms.setdefault(feature["properties"]["D"], []).append(
+                shapely.geometry.shape(feature["geometry"])
+            )
+    return code_geoms
+
+
+# Union of all polygons of a code, snapped to a grid finer than pixels at the max zoom
+# Borders of different codes snap to the same grid and keep sharing vertices
+def dissolve(geoms: list[shapely.Geometry]) -> shapely.Geometry:
+    return shapely.union_all(geoms, grid_size=pixel_degrees(ZOOMS[-1]) / 4)
+
+
+# Simplify dissolved polygons of all codes together as a coverage; No gaps or overlaps appear between codes
+# Parts smaller than a pixel are dropped
+def simplify(dissolved: np.ndarray, z: int) -> np.ndarray:
+    simplified = shapely.coverage_simplify(dissolved, pixel_degrees(z))
+    parts, indexes = shapely.get_parts(simplified, return_index=True)
+    large = shapely.area(parts) >= pixel_degrees(z) ** 2
+    geoms = np.full(len(dissolved), None, dtype=object)
+    present = np.unique(indexes[large])
+    # Indices must be contiguous
+    geoms[present] = shapely.multipolygons(
+        parts[large], indices=np.searchsorted(present, indexes[large])
+    )
+    return geoms
+
+
+def write_geojsonlines(
+    codes: list[int], zoom_geoms: dict[int, np.ndarray], output: pathlib.Path
+):
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        for z, geoms in zoom_geoms.items():
+            rounded = shapely.transform(
+                geoms, lambda xy: round_coordinates(xy, COORDINATE_PRECISION)
+            )
+            for code, geom in zip(codes, rounded):
+                if geom is None:
+                    continue
+                feature = {
+                    "type": "Feature",
+                    # Features for the zoom only; See tippecanoe
+                    "tippecanoe": {"minzoom": z, "maxzoom": z},
+                    "properties": {"D": code},
+                    "geometry": shapely.geometry.mapping(geom),
+                }
+                f.write(dumps_geojson(feature) + "\n")
+
+
+# Raster tiles; Each worker process loads the overview once
+
+_worker: dict = {}
+
+
+# e.g. #123456, #123, rgba(1,2,3,0.5) by colormap -> (r, g, b, a)
+def parse_color(value: str) -> tuple[int, int, int, int]:
+    if value.startswith("#"):
+        digits = value[1:]
+        if len(digits) == 3:
+            digits = "".join(d * 2 for d in digits)
+        if len(digits) != 6:
+            raise RuntimeError(f"Unknown color: {value}")
+        return int(digits[0:2], 16), int(digits[2:4], 16), int(digits[4:6], 16), 255
+    r, g, b, a = value[value.index("(") + 1 : value.index(")")].split(",")
+    return int(r), int(g), int(b), round(float(a) * 255)
+
+
+def init_worker(geojsonlines: pathlib.Path, style: dict[str, str]):
+    zoom_features: dict[int, tuple[list, list]] = {z: ([], []) for z in ZOOMS}
+    for line in open(geojsonlines, "rb"):
+        feature = loads_geojson(line)
+        geoms, colors = zoom_features[feature["tippecanoe"]["minzoom"]]
+        geoms.append(shapely.geometry.shape(feature["geometry"]))
+        colors.append(
+            parse_color(style.get(str(feature["properties"]["D"]), "#000000"))
+        )
+    for z, (geoms, colors) in zoom_features.items():
+        geoms = np.array(geoms, dtype=object)
+        _worker[z] = (geoms, colors, shapely.STRtree(geoms))
+
+
+# Pixel coordinates of the tile in Web Mercator
+def to_pixels(xy: np.ndarray, z: int, x: int, y: int) -> list[tuple[float, float]]:
+    size = TILE_SIZE << z
+    px = (xy[:, 0] + 180) / 360 * size - x * TILE_SIZE
+    lat = np.radians(xy[:, 1])
+    py = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * size
+    return list(zip(px.tolist(), (py - y * TILE_SIZE).tolist()))
+
+
+# Returns whether the tile has any feature
+def render_tile(
+    z: int, x: int, y: int, output: pathlib.Path, image_format: str
+) -> bool:
+    from PIL import Image, ImageChops, ImageDraw
+
+    geoms, colors, tree = _worker[z]
+    hits = tree.query(shapely.box(*tile_bounds(z, x, y)), predicate="intersects")
+    if len(hits) == 0:
+        return False
+
+    image = Image.new("RGBA", (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+    for i in hits.tolist():
+        mask = Image.new("L", image.size, 0)
+        for polygon in shapely.get_parts(geoms[i]).tolist():
+            # Holes of a part must not erase other parts in them
+            part = Image.new("L", image.size, 0)
+            draw = ImageDraw.Draw(part)
+            draw.polygon(
+                to_pixels(shapely.get_coordinates(polygon.exterior), z, x, y), 255
+            )
+            for interior in polygon.interiors:
+                draw.polygon(to_pixels(shapely.get_coordinates(interior), z, x, y), 0)
+            mask = ImageChops.lighter(mask, part)
+        image.paste(colors[i], (0, 0), mask)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    if image_format == "webp":
+        image.save(output, "WEBP", lossless=True)
+    else:
+        image.save(output, "PNG", optimize=True)
+    return True
+
+
+def tiles(z: int) -> list[tuple[int, int]]:
+    n = 1 << z
+    west, south, east, north = BOUNDS
+
+    def tile_y(lat: float) -> int:
+        lat = math.radians(lat)
+        return int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)
+
+    xs = range(int((west + 180) / 360 * n), int((east + 180) / 360 * n) + 1)
+    ys = range(tile_y(north), tile_y(south) + 1)
+    return [(x, y) for x in xs for y in ys]
+
+
+def rasterize(
+    geojsonlines: pathlib.Path,
+    style_path: pathlib.Path,
+    raster_dir: pathlib.Path,
+    image_format: str,
+    jobs: int,
+):
+    style = json.load(open(style_path))
+    targets = [(z, x, y) for z in ZOOMS for x, y in tiles(z)]
+    with ProcessPoolExecutor(
+        jobs, initializer=init_worker, initargs=(geojsonlines, style)
+    ) as executor:
+        rendered = executor.map(
+            render_tile,
+            *zip(*targets),
+            [raster_dir / f"{z}/{x}/{y}.{image_format}" for z, x, y in targets],
+            [image_format] * len(targets),
+        )
+        print(f"Raster tiles: {sum(rendered)}")
+
+
+def main(
+    geojson_pattern: str,
+    output: pathlib.Path,
+    raster_format: str | None,
+    raster_dir: pathlib.Path,
+    style_path: pathlib.Path,
+    jobs: int,
+):
+    code_geoms = load(geojson_pattern)
+    if len(code_geoms) == 0:
+        raise RuntimeError(f"No features: {geojson_pattern}")
+    codes = sorted(code_geoms)
+    print(f"Codes: {len(codes)}, Polygons: {sum(len(g) for g in code_geoms.values())}")
+
+    # Codes in parallel
+    with ProcessPoolExecutor(jobs) as executor:
+        dissolved = np.array(
+            [*executor.map(dissolve, [code_geoms[c] for c in codes])], dtype=object
+        )
+
+    zoom_geoms = {z: simplify(dissolved, z) for z in ZOOMS}
+    for z, geoms in zoom_geoms.items():
+        present = [g for g in geoms if g is not None]
+        print(
+            f"z{z}: {len(present)} features,"
+            f" {int(shapely.get_num_coordinates(present).sum())} vertices"
+        )
+    write_geojsonlines(codes, zoom_geoms, output)
+
+    if raster_format is not None:
+        rasterize(output, style_path, raster_dir, raster_format, jobs)
+
+
+if __name__ == "__main__":
+    data_dir = pathlib.Path(__file__).parent.parent / "data"
+
+    parser = argparse.ArgumentParser(
+        "overview", "Build z0-z5 overview features (and raster tiles) from dai"
+    )
+    parser.add_argument(
+        "-g",
+        "--geojson-pattern",
+        help="Python glob library style file pattern locating dai geojsons of trimmer",
+        type=str,
+        default=str(data_dir / "geojson-trimmed/dai/*.geojson"),
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        help="Output geojsonlines file for tippecanoe",
+        type=pathlib.Path,
+        default=data_dir / "geojson-lines/vg67_dai_overview.geojsonlines",
+    )
+    parser.add_argument(
+        "--raster",
+        help="Also render raster tiles (requires Pillow)",
+        choices=["png", "webp"],
+    )
+    parser.add_argument(
+        "--raster-dir",
+        help="Directory for raster tiles",
+        type=pathlib.Path,
+        default=data_dir / "overview/raster",
+    )
+    parser.add_argument(
+        "--style",
+        help="Colors of dai codes by colormap",
+        type=pathlib.Path,
+        default=data_dir / "style/vg67_dai_style.json",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes",
+        type=int,
+        default=os.cpu_count(),
+    )
+    args = parser.parse_args()
+    main(
+        args.geojson_pattern,
+        args.out,
+        args.raster,
+        args.raster_dir,
+        args.style,
+        args.jobs,
+    )
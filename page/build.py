@@ -1,9 +1,33 @@
+import argparse
+import http.server
 import json
 import pathlib
+import re
+import threading
+import time
 import tomllib
 
+from legend import code_hierarchy, shokusei_layer_filters
+from release import hashed_name, optimize, write_compressed
 
-def build_variables(data_dir: pathlib.Path) -> dict[str, str]:
+
+# Make sure the matcher generated by colormap renders the same colors as the style
+def check_matcher(style: dict[str, str], matcher: list):
+    colors = {}
+    for codes, color in zip(matcher[2:-1:2], matcher[3:-1:2]):
+        for code in codes:
+            # Keys of the style are strings
+            key = str(code)
+            if key in colors:
+                raise RuntimeError(f"Duplicated code in matcher: {code}")
+            colors[key] = color
+
+    if colors != style:
+        diff = set(colors.items()) ^ set(style.items())
+        raise RuntimeError(f"Matcher does not match the style: {sorted(diff)}")
+
+
+def build_data(data_dir: pathlib.Path) -> dict[str, object]:
     legend_dai = json.load(open(data_dir / "hanrei/names/dai.json"))
     legend_chu = json.load(open(data_dir / "hanrei/names/chu.json"))
     legend_sai = json.load(open(data_dir / "hanrei/names/sai.json"))
@@ -14,47 +38,105 @@ def build_variables(data_dir: pathlib.Path) -> dict[str, str]:
     mapbox_dai_styles = json.load(open(data_dir / "style/vg67_dai_style.json"))
     mapbox_chu_styles = json.load(open(data_dir / "style/vg67_chu_style.json"))
 
-    variables = {
-        '"__TEMPLATE_CODE_COLORS_SAI_MATCHER__"': json.dumps(
-            mapbox_sai_styles, separators=(",", ":")
-        ),
-        '"__TEMPLATE_CODE_COLORS_CHU_MATCHER__"': json.dumps(
-            mapbox_chu_styles, separators=(",", ":")
-        ),
-        '"__TEMPLATE_CODE_COLORS_DAI_MATCHER__"': json.dumps(
-            mapbox_dai_styles, separators=(",", ":")
-        ),
-        '"__TEMPLATE_LEGEND_SAI__"': json.dumps(
-            legend_sai, separators=(",", ":"), ensure_ascii=False
-        ),
-        '"__TEMPLATE_LEGEND_CHU__"': json.dumps(
-            legend_chu, separators=(",", ":"), ensure_ascii=False
-        ),
-        '"__TEMPLATE_LEGEND_DAI__"': json.dumps(
-            legend_dai, separators=(",", ":"), ensure_ascii=False
-        ),
-        '"__TEMPLATE_LEGEND_SHOKUSEI__"': json.dumps(
-            legend_shokusei, separators=(",", ":"), ensure_ascii=False
+    mapbox_sai_matcher = json.load(open(data_dir / "style/vg67_sai_matcher.json"))
+    mapbox_dai_matcher = json.load(open(data_dir / "style/vg67_dai_matcher.json"))
+    mapbox_chu_matcher = json.load(open(data_dir / "style/vg67_chu_matcher.json"))
+
+    check_matcher(mapbox_sai_styles, mapbox_sai_matcher)
+    check_matcher(mapbox_dai_styles, mapbox_dai_matcher)
+    check_matcher(mapbox_chu_styles, mapbox_chu_matcher)
+
+    palette_sai = json.load(open(data_dir / "style/vg67_sai_palette.json"))
+    palette_dai = json.load(open(data_dir / "style/vg67_dai_palette.json"))
+    palette_chu = json.load(open(data_dir / "style/vg67_chu_palette.json"))
+
+    return {
+        "CODE_COLORS_SAI_MATCHER": mapbox_sai_styles,
+        "CODE_COLORS_CHU_MATCHER": mapbox_chu_styles,
+        "CODE_COLORS_DAI_MATCHER": mapbox_dai_styles,
+        "FILL_COLOR_MATCHER_SAI": mapbox_sai_matcher,
+        "FILL_COLOR_MATCHER_CHU": mapbox_chu_matcher,
+        "FILL_COLOR_MATCHER_DAI": mapbox_dai_matcher,
+        "PALETTE_CODES_SAI": palette_sai["codes"],
+        "PALETTE_CODES_CHU": palette_chu["codes"],
+        "PALETTE_CODES_DAI": palette_dai["codes"],
+        "LEGEND_SAI": legend_sai,
+        "LEGEND_CHU": legend_chu,
+        "LEGEND_DAI": legend_dai,
+        "LEGEND_SHOKUSEI": legend_shokusei,
+        "SHOKUSEI_LAYER_FILTERS": shokusei_layer_filters(
+            legend_dai, legend_chu, legend_sai
         ),
+        "CODE_HIERARCHY": code_hierarchy(legend_dai, legend_chu, legend_sai),
     }
 
+
+# Data not needed by the first style; consts.js loads them into LEGEND_DATA without blocking the map
+LAZY_DATA = {
+    "LEGEND_SAI",
+    "LEGEND_CHU",
+    "LEGEND_DAI",
+    "LEGEND_SHOKUSEI",
+    "SHOKUSEI_LAYER_FILTERS",
+    "CODE_HIERARCHY",
+}
+
+
+# Returns variables and split data chunks (file name -> content)
+# split_data: Put data into separate JSON files to cache them apart from JS files
+def build_variables(
+    data_dir: pathlib.Path, split_data: bool
+) -> tuple[dict[str, str], dict[str, str]]:
+    variables = {
+        # Overwritten by variables.toml
+        '"__TEMPLATE_PALETTE_PROPERTY__"': "false",
+        '"__TEMPLATE_MAPTILE_DAI_OVERVIEW_URL__"': "null",
+    }
+    chunks = {}
+    preloads = []
+
+    for key, value in build_data(data_dir).items():
+        content = json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+        if split_data:
+            name = hashed_name(f"data/{key.lower()}.json", content)
+            chunks[name] = content
+            if key in LAZY_DATA:
+                # A promise awaited by LEGEND_DATA
+                variables[f'"__TEMPLATE_{key}__"'] = f'fetchData("./{name}")'
+            else:
+                variables[f'"__TEMPLATE_{key}__"'] = f'await fetchData("./{name}")'
+                preloads.append(name)
+        else:
+            variables[f'"__TEMPLATE_{key}__"'] = content
+
+    # Start downloading the chunks of the first style before module imports
+    variables["<!-- __TEMPLATE_DATA_PRELOADS__ -->"] = "\n  ".join(
+        f'<link rel="preload" href="./{name}" as="fetch" crossorigin>'
+        for name in preloads
+    )
+
     toml_variables = tomllib.load(
         open(pathlib.Path(__file__).with_name("variables.toml"), "rb")
     )
     for key, value in toml_variables.items():
         variables[f'"__TEMPLATE_{key}__"'] = value
 
-    return variables
+    return variables, chunks
+
+
+# Matches any of the variable keys; Longer keys first in case a key contains another
+def variables_pattern(variables: dict[str, str]) -> re.Pattern:
+    return re.compile(
+        "|".join(re.escape(key) for key in sorted(variables, key=len, reverse=True))
+    )
 
 
-def template(path: pathlib.Path, variables: dict[str, str]) -> str:
+# Replace all the variables in one pass
+def template(path: pathlib.Path, variables: dict[str, str], pattern: re.Pattern) -> str:
     with open(path) as f:
         content = f.read()
 
-    for key, value in variables.items():
-        content = content.replace(key, value)
-
-    return content
+    return pattern.sub(lambda m: variables[m.group()], content)
 
 
 TEMPLATES = [
@@ -72,15 +154,222 @@ TEMPLATES = [
     "assets/compass_active.svg",
 ]
 
-data_dir = pathlib.Path(__file__).parent.parent / "data"
-out_dir = data_dir / "page"
-out_dir.mkdir(parents=True, exist_ok=True)
 
-variables = build_variables(data_dir)
+PAGE_DIR = pathlib.Path(__file__).parent
+
+
+def write_files(out_dir: pathlib.Path, contents: dict[str, str], release: bool):
+    for name, content in contents.items():
+        dst = out_dir / name
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        with open(dst, "w") as f:
+            f.write(content)
+        if release:
+            write_compressed(dst, content.encode())
 
-for template_file in TEMPLATES:
-    content = template(pathlib.Path(__file__).parent / template_file, variables)
-    dst = out_dir / template_file
-    dst.parent.mkdir(parents=True, exist_ok=True)
-    with open(out_dir / template_file, "w") as f:
-        f.write(content)
+
+def main(
+    data_dir: pathlib.Path, out_dir: pathlib.Path, release: bool, split_data: bool
+):
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    variables, chunks = build_variables(data_dir, split_data)
+    pattern = variables_pattern(variables)
+
+    contents = {
+        template_file: template(PAGE_DIR / template_file, variables, pattern)
+        for template_file in TEMPLATES
+    }
+    contents.update(chunks)
+    if release:
+        # Chunk names have content hashes already
+        contents = optimize(contents, list(chunks))
+
+    write_files(out_dir, contents, release)
+
+
+# Watch mode: Serve the output and reload the browser after each rebuild
+
+LIVE_RELOAD_PATH = "/__live-reload"
+LIVE_RELOAD_SCRIPT = f'<script>new EventSource("{LIVE_RELOAD_PATH}").onmessage = () => location.reload();</script>'
+
+
+# Build counter waited by live reload connections
+class Reloader:
+    def __init__(self):
+        self.version = 0
+        self.condition = threading.Condition()
+
+    def notify(self):
+        with self.condition:
+            self.version += 1
+            self.condition.notify_all()
+
+    # Returns the current version; The same version after the timeout
+    def wait(self, version: int, timeout: float) -> int:
+        with self.condition:
+            self.condition.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+
+def serve(out_dir: pathlib.Path, port: int, reloader: Reloader):
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=str(out_dir), **kwargs)
+
+        def end_headers(self):
+            self.send_header("Cache-Control", "no-store")
+            super().end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != LIVE_RELOAD_PATH:
+                super().do_GET()
+                return
+
+            # Server-sent events; A message per rebuild
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            version = reloader.version
+            try:
+                while True:
+                    new_version = reloader.wait(version, 15)
+                    if new_version == version:
+                        # Keep the connection alive
+                        self.wfile.write(b": ping\n\n")
+                    else:
+                        self.wfile.write(b"data: reload\n\n")
+                        version = new_version
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = http.server.ThreadingHTTPServer(("localhost", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+# Files building variables; Any change of them rebuilds all the templates
+def variable_files(data_dir: pathlib.Path) -> list[pathlib.Path]:
+    return [
+        PAGE_DIR / "variables.toml",
+        *sorted((data_dir / "hanrei/names").glob("*.json")),
+        *sorted((data_dir / "style").glob("*.json")),
+    ]
+
+
+# None for missing files; Editors may delete and rename files while saving them
+def mtimes(paths: list[pathlib.Path]) -> dict[pathlib.Path, int | None]:
+    result: dict[pathlib.Path, int | None] = {}
+    for p in paths:
+        try:
+            result[p] = p.stat().st_mtime_ns
+        except FileNotFoundError:
+            result[p] = None
+    return result
+
+
+def watch(
+    data_dir: pathlib.Path,
+    out_dir: pathlib.Path,
+    split_data: bool,
+    port: int,
+    interval: float,
+):
+    out_dir.mkdir(parents=True, exist_ok=True)
+    reloader = Reloader()
+    serve(out_dir, port, reloader)
+    print(f"Serving {out_dir} at http://localhost:{port}/")
+
+    # Kept in memory while templates change; None until the first successful build
+    variables: dict[str, str] | None = None
+    pattern = variables_pattern({})
+    variable_mtimes: dict[pathlib.Path, int | None] = {}
+    template_mtimes: dict[pathlib.Path, int | None] = {}
+    last_error = None
+
+    while True:
+        new_variable_mtimes = mtimes(variable_files(data_dir))
+        new_template_mtimes = mtimes([PAGE_DIR / t for t in TEMPLATES])
+        started_at = time.perf_counter()
+        try:
+            contents = {}
+            if variables is None or new_variable_mtimes != variable_mtimes:
+                variables, chunks = build_variables(data_dir, split_data)
+                pattern = variables_pattern(variables)
+                contents.update(chunks)
+                targets = TEMPLATES
+            else:
+                targets = [
+                    t
+                    for t in TEMPLATES
+                    if new_template_mtimes[PAGE_DIR / t]
+                    != template_mtimes.get(PAGE_DIR / t)
+                ]
+            for template_file in targets:
+                contents[template_file] = template(
+                    PAGE_DIR / template_file, variables, pattern
+                )
+            if "index.html" in contents:
+                contents["index.html"] = contents["index.html"].replace(
+                    "</head>", f"  {LIVE_RELOAD_SCRIPT}\n</head>"
+                )
+            write_files(out_dir, contents, False)
+        except (OSError, ValueError, RuntimeError) as e:
+            # e.g. A file being saved; Keep the last mtimes and retry until a build succeeds
+            if repr(e) != last_error:
+                print(f"Build failed: {e!r}")
+                last_error = repr(e)
+            time.sleep(interval)
+            continue
+        variable_mtimes, template_mtimes = new_variable_mtimes, new_template_mtimes
+        last_error = None
+
+        if contents:
+            reloader.notify()
+            print(
+                f"Built {len(contents)} files in"
+                f" {(time.perf_counter() - started_at) * 1000:.0f} ms"
+            )
+        time.sleep(interval)
+
+
+if __name__ == "__main__":
+    data_dir = pathlib.Path(__file__).parent.parent / "data"
+
+    parser = argparse.ArgumentParser("build", "Build the viewer page")
+    parser.add_argument(
+        "-o",
+        "--out",
+        help="Output directory",
+        type=pathlib.Path,
+        default=data_dir / "page",
+    )
+    parser.add_argument(
+        "--release",
+        help="Minify, add content hashes to file names and precompress (requires rjsmin, rcssmin and brotli)",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--split-data",
+        help="Put legend and style data into separate JSON files with content hashes",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--watch",
+        help="Rebuild changed files and serve the output with live reload",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--port", help="Port to serve on with --watch", type=int, default=8080
+    )
+    args = parser.parse_args()
+    if args.watch:
+        if args.release:
+            parser.error("--watch does not support --release")
+        watch(data_dir, args.out, args.split_data, args.port, 0.1)
+    else:
+        main(data_dir, args.out, args.release, args.split_data)
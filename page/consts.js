@@ -1,21 +1,55 @@
-export const LEGEND_DAI = "__TEMPLATE_LEGEND_DAI__";
-export const LEGEND_CHU = "__TEMPLATE_LEGEND_CHU__";
-export const LEGEND_SAI = "__TEMPLATE_LEGEND_SAI__";
-export const LEGEND_SHOKUSEI = "__TEMPLATE_LEGEND_SHOKUSEI__";
-
-export const DAI_RAW_CODE_NAMES = Object.fromEntries(Object.entries(LEGEND_DAI).map(([k, v]) => [k, v.n]));
-export const CHU_RAW_CODE_NAMES = Object.fromEntries([
-  ...Object.entries(DAI_RAW_CODE_NAMES).map(([k, v]) => [parseInt(k) * 100, v]),
-  ...Object.entries(LEGEND_CHU),
-])
-export const SAI_RAW_CODE_NAMES = Object.fromEntries([
-  ...Object.entries(CHU_RAW_CODE_NAMES).map(([k, v]) => [parseInt(k) * 100, v]),
-  ...Object.entries(LEGEND_SAI),
-])
-
-export const DAI_RAW_CODES = Object.keys(DAI_RAW_CODE_NAMES).map(v => parseInt(v))
-export const CHU_RAW_CODES = Object.keys(CHU_RAW_CODE_NAMES).map(v => parseInt(v))
-export const SAI_RAW_CODES = Object.keys(SAI_RAW_CODE_NAMES).map(v => parseInt(v))
+// Data may be split into JSON files by `build.py --split-data`; Preloaded by index.html
+async function fetchData(path) {
+  const resp = await fetch(new URL(path, import.meta.url));
+  return resp.json();
+}
+
+// Legends and code hierarchy are not needed by the first style; Loaded without blocking the map
+// Await LEGEND_DATA before using them (and RAW_CODE_NAMES / RAW_CODES built from them)
+export let LEGEND_DAI = null;
+export let LEGEND_CHU = null;
+export let LEGEND_SAI = null;
+export let LEGEND_SHOKUSEI = null;
+
+export let DAI_RAW_CODE_NAMES = null;
+export let CHU_RAW_CODE_NAMES = null;
+export let SAI_RAW_CODE_NAMES = null;
+
+export let DAI_RAW_CODES = null;
+export let CHU_RAW_CODES = null;
+export let SAI_RAW_CODES = null;
+
+// [dai, chu, sai] layer filters for each shokusei filter (prebuilt by build.py)
+export let SHOKUSEI_LAYER_FILTERS = null;
+
+// Lower kubun raw codes for each upper kubun code (prebuilt by build.py)
+// e.g. CODE_HIERARCHY.dai_chu[1] -> [100, 101, ...]
+export let CODE_HIERARCHY = null;
+
+export const LEGEND_DATA = (async () => {
+  [LEGEND_DAI, LEGEND_CHU, LEGEND_SAI, LEGEND_SHOKUSEI, SHOKUSEI_LAYER_FILTERS, CODE_HIERARCHY] = await Promise.all([
+    "__TEMPLATE_LEGEND_DAI__",
+    "__TEMPLATE_LEGEND_CHU__",
+    "__TEMPLATE_LEGEND_SAI__",
+    "__TEMPLATE_LEGEND_SHOKUSEI__",
+    "__TEMPLATE_SHOKUSEI_LAYER_FILTERS__",
+    "__TEMPLATE_CODE_HIERARCHY__",
+  ]);
+
+  DAI_RAW_CODE_NAMES = Object.fromEntries(Object.entries(LEGEND_DAI).map(([k, v]) => [k, v.n]));
+  CHU_RAW_CODE_NAMES = Object.fromEntries([
+    ...Object.entries(DAI_RAW_CODE_NAMES).map(([k, v]) => [parseInt(k) * 100, v]),
+    ...Object.entries(LEGEND_CHU),
+  ])
+  SAI_RAW_CODE_NAMES = Object.fromEntries([
+    ...Object.entries(CHU_RAW_CODE_NAMES).map(([k, v]) => [parseInt(k) * 100, v]),
+    ...Object.entries(LEGEND_SAI),
+  ])
+
+  DAI_RAW_CODES = Object.keys(DAI_RAW_CODE_NAMES).map(v => parseInt(v))
+  CHU_RAW_CODES = Object.keys(CHU_RAW_CODE_NAMES).map(v => parseInt(v))
+  SAI_RAW_CODES = Object.keys(SAI_RAW_CODE_NAMES).map(v => parseInt(v))
+})();
 
 // Kubun enums
 // Contribution guide: Put your favorite month/day for a new kubun const
@@ -34,6 +68,10 @@ export const LAYER_NAME = {
   [SAI_LABELS]: 'vg67-sai-labels',
 }
 
+// Optional z0-z5 dai tiles built by overview; null if not deployed
+export const MAPTILE_DAI_OVERVIEW_URL = "__TEMPLATE_MAPTILE_DAI_OVERVIEW_URL__";
+export const DAI_OVERVIEW_LAYER_NAME = 'vg67-dai-overview';
+
 export const PROPERTY_KEY = {
   [DAI]: 'D',
   [CHU]: 'C',
@@ -48,23 +86,21 @@ export const CODE_COLORS_DAI = "__TEMPLATE_CODE_COLORS_DAI_MATCHER__";
 
 export const FALLBACK_COLOR = "#000000"
 
-const buildMapboxMatcher = (colors, key) => {
-  return [
-    "match", ["get", key],
-    ...Object.entries(Object.groupBy(Object.entries(colors), ([_, color]) => color)).flatMap(
-      ([color, vs]) => [vs.map(([code,]) => parseInt(code)), color]
-    ),
-    FALLBACK_COLOR,
-  ];
-}
-
 // Zoom level 12.5 -> zoom = 12
 export const SAI_LABEL_BASE_FILTER = ["step", ["zoom"], false,
   12, ["has", "25"], 13, ["has", "3"], 14, ["has", "4"], 15, ["has", "5"], 16, true];
 
-export const FILL_COLOR_MATCHER_SAI = buildMapboxMatcher(CODE_COLORS_SAI, PROPERTY_KEY[SAI]);
-export const FILL_COLOR_MATCHER_CHU = buildMapboxMatcher(CODE_COLORS_CHU, PROPERTY_KEY[CHU]);
-export const FILL_COLOR_MATCHER_DAI = buildMapboxMatcher(CODE_COLORS_DAI, PROPERTY_KEY[DAI]);
+// Prebuilt by colormap; Codes with the identical color share a match branch
+export const FILL_COLOR_MATCHER_SAI = "__TEMPLATE_FILL_COLOR_MATCHER_SAI__";
+export const FILL_COLOR_MATCHER_CHU = "__TEMPLATE_FILL_COLOR_MATCHER_CHU__";
+export const FILL_COLOR_MATCHER_DAI = "__TEMPLATE_FILL_COLOR_MATCHER_DAI__";
+
+// Tiles have palette index property (`P`) baked by paletter; index -> code
+export const PALETTE_PROPERTY = "__TEMPLATE_PALETTE_PROPERTY__";
+export const PALETTE_PROPERTY_KEY = 'P';
+export const PALETTE_CODES_SAI = "__TEMPLATE_PALETTE_CODES_SAI__";
+export const PALETTE_CODES_CHU = "__TEMPLATE_PALETTE_CODES_CHU__";
+export const PALETTE_CODES_DAI = "__TEMPLATE_PALETTE_CODES_DAI__";
 
 export const MIN_SOURCE_ZOOM_LEVEL_SAI = 10
 export const MIN_SOURCE_ZOOM_LEVEL_CHU = 8
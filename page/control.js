@@ -1,5 +1,5 @@
 import { getLayerOpacitySetting, getMapStyleSetting, setLayerOpacitySetting, setMapStyleSetting } from "./localStorage.js";
-import { CHU, CHU_RAW_CODE_NAMES, DAI, DAI_RAW_CODE_NAMES, DAI_SPECIAL_TRANSFORM, SAI, SAI_RAW_CODE_NAMES } from "./consts.js";
+import { CHU, CHU_RAW_CODE_NAMES, DAI, DAI_RAW_CODE_NAMES, DAI_SPECIAL_TRANSFORM, LEGEND_DATA, SAI, SAI_RAW_CODE_NAMES } from "./consts.js";
 import { CURRENT_ADVANCED_FILTER_CHANGE_EVENT, CURRENT_SHOKUSEI_FILTER_CHANGE_EVENT, currentAdvancedFilter, currentShokuseiFilter, setCurrentAdvancedFilter, setCurrentShokuseiFilter } from './variables.js';
 import { getCodeKubunDescription, getCodeKubunDescriptionWithName, parseCodeKubunsForAdvancedFilter, throttle } from "./mapFunction.js";
 
@@ -21,7 +21,12 @@ export class SettingsButtonControl {
       }
     }
 
-    this.settingsControl.onSearchButtonClick = () => {
+    this.settingsControl.onSearchButtonClick = async () => {
+      // Code names come with the legend data
+      await LEGEND_DATA;
+      if (!map.hasControl(this.settingsControl)) {
+        return
+      }
       map.removeControl(this.settingsControl)
       map.addControl(this.hanreiFilterSettingsControl, "bottom-right")
     }
@@ -89,7 +94,12 @@ export class SettingsControl {
     this.onCurrentShokuseiFilterChange = (e) => setShokuseiFilter(e.detail.value)
     window.addEventListener(CURRENT_SHOKUSEI_FILTER_CHANGE_EVENT, this.onCurrentShokuseiFilterChange);
 
-    const updateDescription = (codeKubuns) => {
+    const updateDescription = async (filter, codeKubuns) => {
+      // Code names come with the legend data
+      await LEGEND_DATA;
+      if (filterInput.value !== filter) {
+        return
+      }
       const wrapper = document.querySelector("#settingsControlFilterWrapperTemplate").content.cloneNode(true).firstElementChild;
       codeKubuns.map(([code, kubun]) => {
         const desc = getCodeKubunDescription(code, kubun)
@@ -122,7 +132,7 @@ export class SettingsControl {
       if (newFilter.trim().length > 0) {
         // as validate
         const codeKubuns = parseCodeKubunsForAdvancedFilter(newFilter);
-        updateDescription(codeKubuns);
+        updateDescription(newFilter, codeKubuns);
       } else {
         if (!initialize) {
           clearDescription();
@@ -165,6 +175,12 @@ export class SettingsControl {
 export class HanreiFilterSettingsControl {
 
   constructor() {
+    this.allCodeDescriptions = null;
+    this.onCloseButtonClick = null;
+  }
+
+  // Built on the first open; Needs the legend data
+  getAllCodeDescriptions() {
     const getDescriptionEntries = (kubun) => {
       let names;
       switch (kubun) {
@@ -187,13 +203,12 @@ export class HanreiFilterSettingsControl {
       }))
     }
 
-    this.allCodeDescriptions = [
+    this.allCodeDescriptions ??= [
       ...getDescriptionEntries(DAI),
       ...getDescriptionEntries(CHU),
       ...getDescriptionEntries(SAI),
     ]
-
-    this.onCloseButtonClick = null;
+    return this.allCodeDescriptions
   }
 
   onAdd(map) {
@@ -211,8 +226,9 @@ export class HanreiFilterSettingsControl {
       const selectTemplate = selects.querySelector('#hanrelFilterSelectTemplate');
 
       const trimmed = value.trim().replace(/\**$/, "").replace(/^0*/, ""); // Remove 0 prefix and * suffix
-      const selectedCodeDescriptions = this.allCodeDescriptions.filter(([k,]) => this.currentAdvancedFilterCodes.includes(k))
-      const remainingCodeDescriptions = this.allCodeDescriptions.filter(
+      const allCodeDescriptions = this.getAllCodeDescriptions();
+      const selectedCodeDescriptions = allCodeDescriptions.filter(([k,]) => this.currentAdvancedFilterCodes.includes(k))
+      const remainingCodeDescriptions = allCodeDescriptions.filter(
         ([k, v]) => !this.currentAdvancedFilterCodes.includes(k) && (String(k).includes(trimmed) || v.includes(trimmed))
       ).slice(0, 101);
 
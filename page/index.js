@@ -1,6 +1,5 @@
 import {
   MAP_URL, LAYER_NAME, SAI, CHU, DAI,
-  FILL_COLOR_MATCHER_CHU, FILL_COLOR_MATCHER_SAI, FILL_COLOR_MATCHER_DAI,
   DAI_SPECIAL_TRANSFORM,
   PROPERTY_KEY,
   MIN_SOURCE_ZOOM_LEVEL_CHU,
@@ -9,10 +8,13 @@ import {
   SAI_LABEL_BASE_FILTER,
   SAI_LABELS,
   LAYER_KUBUNS,
+  MAPTILE_DAI_OVERVIEW_URL,
+  DAI_OVERVIEW_LAYER_NAME,
+  LEGEND_DATA,
 } from './consts.js';
 import { CompassControl, SettingsButtonControl } from './control.js';
 import { getMapStyleSetting, SETTINGS_LAYER_OPACITY_CHANGE_EVENT, SETTINGS_MAP_STYLE_CHANGE_EVENT } from './localStorage.js';
-import { formatCode, getAdvancedLayerFilters, getCodeColor, getFillOpacity, getKubunForZoom, getLegends, getShokuseiLayerFilters, scaleCode, updateCodeColor, updateFillMatcher } from './mapFunction.js';
+import { formatCode, getAdvancedLayerFilters, getCodeColor, getFillColor, getFillOpacity, getKubunForZoom, getLegends, getShokuseiLayerFilters, scaleCode, updateCodeColor, updateFillMatcher } from './mapFunction.js';
 import { getLngLatFromURL, getZoomFromURL, updateURL } from './url.js';
 import { currentChuFillOpacity, currentChuFilter, currentDaiFillOpacity, currentDaiFilter, currentSaiFillOpacity, currentSaiFilter, setCurrentRawCode, setCurrentFillOpacity, setCurrentHanreiKubun, currentCodeKubun, currentHanreiKubun, currentRawCode, CURRENT_ADVANCED_FILTER_CHANGE_EVENT, CURRENT_SHOKUSEI_FILTER_CHANGE_EVENT, setCurrentDaiFilter, setCurrentChuFilter, setCurrentSaiFilter, setCurrentShokuseiFilter, currentSaiLabelsFillOpacity } from './variables.js';
 
@@ -25,7 +27,8 @@ const map = new mapboxgl.Map({
   center: getLngLatFromURL(),
   style: MAP_URL[getMapStyleSetting()],
   zoom: getZoomFromURL(),
-  minZoom: 6,
+  // Overview tiles cover lower zoom levels
+  minZoom: MAPTILE_DAI_OVERVIEW_URL != null ? 0 : 6,
   language: 'ja',
   customAttribution: [`Source: <a href="http://www.biodic.go.jp/kiso/vg/vg_kiso.html">1/2.5万植生図GISデータ(環境省生物多様性センター)</a> を加工して作成`],
 });
@@ -72,7 +75,12 @@ const paintPropertyOptions = {
   validate: false,
 }
 
-const LAYER_NAMES = Object.values(LAYER_NAME);
+// Dai features are in the overview layer too when it exists
+const DAI_LAYER_NAMES = MAPTILE_DAI_OVERVIEW_URL != null ? [LAYER_NAME[DAI], DAI_OVERVIEW_LAYER_NAME] : [LAYER_NAME[DAI]];
+
+const LAYER_NAMES = [...Object.values(LAYER_NAME), ...DAI_LAYER_NAMES.slice(1)];
+
+const getLayerNames = (kubun) => kubun === DAI ? DAI_LAYER_NAMES : [LAYER_NAME[kubun]];
 
 const HANREI_BASE_URL = "__TEMPLATE_HANREI_BASE_URL__";
 
@@ -92,7 +100,9 @@ const setOpacityToMap = (layerKubun, opacity) => {
   if (layerKubun === SAI_LABELS) {
     map.setPaintProperty(LAYER_NAME[layerKubun], 'text-opacity', opacity, paintPropertyOptions);
   } else {
-    map.setPaintProperty(LAYER_NAME[layerKubun], 'fill-opacity', opacity, paintPropertyOptions);
+    getLayerNames(layerKubun).forEach(name => {
+      map.setPaintProperty(name, 'fill-opacity', opacity, paintPropertyOptions);
+    })
   }
 }
 
@@ -195,6 +205,11 @@ const handlePitchEnd = () => {
   geolocateControl.options.fitBoundsOptions.pitch = map.getPitch();
 }
 
+// Names come with the legend data; No labels until it is loaded
+const getSaiLabelTextField = () => {
+  return ["get", ["to-string", ["get", "H"]], ["literal", SAI_RAW_CODE_NAMES ?? {}]]
+}
+
 const getSaiLabelFilter = (sai) => {
   if (sai == null) {
     return SAI_LABEL_BASE_FILTER
@@ -207,22 +222,25 @@ const setMapFilters = ([dai, chu, sai]) => {
   setCurrentDaiFilter(dai);
   setCurrentChuFilter(chu);
   setCurrentSaiFilter(sai);
-  map.setFilter(LAYER_NAME[DAI], dai)
+  DAI_LAYER_NAMES.forEach(name => map.setFilter(name, dai))
   map.setFilter(LAYER_NAME[CHU], chu)
   map.setFilter(LAYER_NAME[SAI], sai)
   map.setFilter(LAYER_NAME[SAI_LABELS], getSaiLabelFilter(sai))
 }
 
-const handleCurrentAdvancedFilterChanged = (e) => {
+// Filters are built from the legend data
+const handleCurrentAdvancedFilterChanged = async (e) => {
   const filter = e.detail.value;
+  await LEGEND_DATA;
   setMapFilters(getAdvancedLayerFilters(filter));
 }
 
-const handleCurrentShokuseiFilterChanged = (e) => {
+const handleCurrentShokuseiFilterChanged = async (e) => {
   const filter = e.detail.value;
   if (filter === 'disabled') {
     return
   }
+  await LEGEND_DATA;
   setMapFilters(getShokuseiLayerFilters(filter));
 }
 
@@ -237,7 +255,9 @@ const handleSettingsLayerOpacityChanged = (e) => {
 const onPickColorChange = (value, rawCode, kubun) => {
   updateCodeColor(rawCode, kubun, value);
   const fillMatcher = updateFillMatcher(rawCode, kubun, value);
-  map.setPaintProperty(LAYER_NAME[kubun], 'fill-color', fillMatcher, paintPropertyOptions);
+  getLayerNames(kubun).forEach(name => {
+    map.setPaintProperty(name, 'fill-color', fillMatcher, paintPropertyOptions);
+  })
   if (kubun == SAI) {
     map.setPaintProperty(LAYER_NAME[SAI_LABELS], 'text-halo-color', fillMatcher, paintPropertyOptions);
   }
@@ -364,9 +384,10 @@ const showPopup = (lngLat, name) => {
   popup.getElement().querySelector("button.mapboxgl-popup-close-button").onclick = deselect;
 }
 
-const onMapClick = (e, kubun) => {
+const onMapClick = async (e, kubun) => {
   const rawCode = e.features[0].properties[PROPERTY_KEY[kubun]];
   const lngLat = e.lngLat;
+  await LEGEND_DATA;
   const legends = getLegends(rawCode, kubun);
 
   handleSingleClick(() => {
@@ -388,7 +409,7 @@ map.on('load', () => {
     onMapClick(e, CHU);
   });
 
-  map.on('click', LAYER_NAME[DAI], (e) => {
+  map.on('click', DAI_LAYER_NAMES, (e) => {
     onMapClick(e, DAI);
   });
 
@@ -422,7 +443,7 @@ map.on('style.load', () => {
 
   const dark = ['night', 'satellite'].includes(getMapStyleSetting());
   const labelTextColor = [
-    "let", "rgb", ["to-rgba", FILL_COLOR_MATCHER_SAI],
+    "let", "rgb", ["to-rgba", getFillColor(SAI)],
     [
       "step",
       // calcluate luma
@@ -449,6 +470,19 @@ map.on('style.load', () => {
       122, 24, 154, 46,
     ],
   });
+  if (MAPTILE_DAI_OVERVIEW_URL != null) {
+    map.addSource('vg67-dai-overview', {
+      type: 'vector',
+      tiles: [
+        MAPTILE_DAI_OVERVIEW_URL,
+      ],
+      minzoom: 0,
+      maxzoom: 5,
+      bounds: [
+        122, 24, 154, 46,
+      ],
+    });
+  }
   map.addSource('vg67-chu', {
     type: 'vector',
     tiles: [
@@ -483,6 +517,26 @@ map.on('style.load', () => {
     ],
   });
 
+  if (MAPTILE_DAI_OVERVIEW_URL != null) {
+    map.addLayer(
+      Object.assign(
+        {
+          'id': DAI_OVERVIEW_LAYER_NAME,
+          'type': 'fill',
+          'source': 'vg67-dai-overview',
+          'source-layer': 'vg67_dai',
+          'maxzoom': 6,
+          "paint": {
+            "fill-color": getFillColor(DAI),
+            "fill-opacity": currentDaiFillOpacity,
+            "fill-outline-color": "rgba(0,0,0,0)",
+            "fill-emissive-strength": fillEmissiveStrength,
+          },
+        },
+        currentDaiFilter != null ? { "filter": currentDaiFilter } : null
+      )
+    );
+  }
   map.addLayer(
     Object.assign(
       {
@@ -493,7 +547,7 @@ map.on('style.load', () => {
         'minzoom': 6,
         'maxzoom': MIN_SOURCE_ZOOM_LEVEL_CHU,
         "paint": {
-          "fill-color": FILL_COLOR_MATCHER_DAI,
+          "fill-color": getFillColor(DAI),
           "fill-opacity": currentDaiFillOpacity,
           "fill-outline-color": "rgba(0,0,0,0)",
           "fill-emissive-strength": fillEmissiveStrength,
@@ -512,7 +566,7 @@ map.on('style.load', () => {
         'minzoom': MIN_SOURCE_ZOOM_LEVEL_CHU,
         'maxzoom': MIN_SOURCE_ZOOM_LEVEL_SAI,
         "paint": {
-          "fill-color": FILL_COLOR_MATCHER_CHU,
+          "fill-color": getFillColor(CHU),
           "fill-opacity": currentChuFillOpacity,
           "fill-outline-color": "rgba(0,0,0,0)",
           "fill-emissive-strength": fillEmissiveStrength,
@@ -530,12 +584,12 @@ map.on('style.load', () => {
         'source-layer': 'vg67_sai',
         'minzoom': MIN_SOURCE_ZOOM_LEVEL_SAI,
         "paint": {
-          "fill-color": FILL_COLOR_MATCHER_SAI,
+          "fill-color": getFillColor(SAI),
           "fill-opacity": currentSaiFillOpacity,
           "fill-outline-color": [
             "step", ["zoom"],
             "rgba(0,0,0,0)",
-            12, FILL_COLOR_MATCHER_SAI,
+            12, getFillColor(SAI),
           ],
           "fill-emissive-strength": fillEmissiveStrength,
         },
@@ -551,7 +605,7 @@ map.on('style.load', () => {
       'source-layer': 'vg67_sai_labels',
       'minzoom': 12.5,
       'layout': {
-        "text-field": ["get", ["to-string", ["get", "H"]], ["literal", SAI_RAW_CODE_NAMES]],
+        "text-field": getSaiLabelTextField(),
         "text-size": 13,
         "text-letter-spacing": 0.1,
         "text-line-height": 1.3,
@@ -560,10 +614,17 @@ map.on('style.load', () => {
         "text-color": labelTextColor,
         "text-halo-width": 1,
         "text-halo-blur": 2,
-        "text-halo-color": FILL_COLOR_MATCHER_SAI,
+        "text-halo-color": getFillColor(SAI),
         "text-opacity": currentSaiLabelsFillOpacity,
       },
       "filter": getSaiLabelFilter(currentSaiFilter),
     }
   );
 });
+
+// The style may be loaded before the legend data
+LEGEND_DATA.then(() => {
+  if (map.getLayer(LAYER_NAME[SAI_LABELS]) != null) {
+    map.setLayoutProperty(LAYER_NAME[SAI_LABELS], 'text-field', getSaiLabelTextField());
+  }
+});
@@ -0,0 +1,71 @@
+# Precompute tables derived from legends for the viewer, instead of in browsers
+
+# http://gis.biodic.go.jp/webgis/sc-016.html
+SHOKUSEI_CODES_NATURAL = [1, 2, 4, 6, 8]
+SHOKUSEI_CODES_SECONDARY = [3, 5, 7, 9]
+
+ADDITIONAL_CHU_CODES_NATURAL = [5807]  # Natural bare ground
+
+# Same as PROPERTY_KEY in consts.js
+DAI_KEY = "D"
+CHU_KEY = "C"
+SAI_KEY = "H"
+
+
+# Same as {DAI,CHU,SAI}_RAW_CODES in consts.js
+# Upper kubun codes are included as lower kubun codes; e.g. dai 01 -> chu 0100 -> sai 010000
+def raw_codes(
+    legend_dai: dict, legend_chu: dict, legend_sai: dict
+) -> tuple[list[int], list[int], list[int]]:
+    dai = sorted(int(k) for k in legend_dai)
+    chu = sorted({*(k * 100 for k in dai), *(int(k) for k in legend_chu)})
+    sai = sorted({*(k * 100 for k in chu), *(int(k) for k in legend_sai)})
+    return dai, chu, sai
+
+
+def to_mapbox_filter(raw_codes: list[int], key: str) -> list:
+    return ["in", ["get", key], ["literal", raw_codes]]
+
+
+# [dai, chu, sai] layer filters for each shokusei filter
+def shokusei_layer_filters(
+    legend_dai: dict, legend_chu: dict, legend_sai: dict
+) -> dict[str, list[list]]:
+    dai_codes, chu_codes, sai_codes = raw_codes(legend_dai, legend_chu, legend_sai)
+
+    def layer_filters(shokusei_codes: list[int], additional_chu_codes: list[int]):
+        dai = [v for v in dai_codes if legend_dai[str(v)]["cc"] in shokusei_codes]
+        dai_set = set(dai)
+        chu = [v for v in chu_codes if v // 100 in dai_set] + additional_chu_codes
+        chu_set = set(chu)
+        sai = [v for v in sai_codes if v // 100 in chu_set]
+
+        return [
+            to_mapbox_filter(dai, DAI_KEY),
+            to_mapbox_filter(chu, CHU_KEY),
+            to_mapbox_filter(sai, SAI_KEY),
+        ]
+
+    return {
+        "natural": layer_filters(SHOKUSEI_CODES_NATURAL, ADDITIONAL_CHU_CODES_NATURAL),
+        "secondary": layer_filters(SHOKUSEI_CODES_SECONDARY, []),
+    }
+
+
+# Lower kubun raw codes for each upper kubun code; e.g. {"dai_chu": {1: [100, 101, ...]}, ...}
+def code_hierarchy(
+    legend_dai: dict, legend_chu: dict, legend_sai: dict
+) -> dict[str, dict[int, list[int]]]:
+    _, chu_codes, sai_codes = raw_codes(legend_dai, legend_chu, legend_sai)
+
+    def group_by(codes: list[int], divisor: int) -> dict[int, list[int]]:
+        groups: dict[int, list[int]] = {}
+        for code in codes:
+            groups.setdefault(code // divisor, []).append(code)
+        return groups
+
+    return {
+        "dai_chu": group_by(chu_codes, 100),
+        "dai_sai": group_by(sai_codes, 10000),
+        "chu_sai": group_by(sai_codes, 100),
+    }
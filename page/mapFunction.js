@@ -2,7 +2,7 @@ import {
   SAI, CHU, DAI, DAI_SPECIAL_TRANSFORM,
   LEGEND_DAI, LEGEND_CHU, LEGEND_SAI, LEGEND_SHOKUSEI, PROPERTY_KEY,
   DAI_SPECIAL_TRANSFORM_REVERSE, DEFAULT_FILL_OPACITY,
-  DAI_RAW_CODES, CHU_RAW_CODES, SAI_RAW_CODES, FALLBACK_COLOR,
+  FALLBACK_COLOR,
   CODE_COLORS_SAI, CODE_COLORS_CHU, CODE_COLORS_DAI,
   MIN_SOURCE_ZOOM_LEVEL_CHU,
   MIN_SOURCE_ZOOM_LEVEL_SAI,
@@ -12,7 +12,14 @@ import {
   DAI_RAW_CODE_NAMES,
   CHU_RAW_CODE_NAMES,
   SAI_RAW_CODE_NAMES,
-  SAI_LABELS
+  SAI_LABELS,
+  PALETTE_PROPERTY,
+  PALETTE_PROPERTY_KEY,
+  PALETTE_CODES_SAI,
+  PALETTE_CODES_CHU,
+  PALETTE_CODES_DAI,
+  SHOKUSEI_LAYER_FILTERS,
+  CODE_HIERARCHY,
 } from './consts.js';
 import { getLayerOpacitySetting } from './localStorage.js';
 
@@ -43,44 +50,15 @@ export const throttle = (func, timeoutMs) => {
 
 // Get layer filter
 
-// Prebuild shokusei filters
-// http://gis.biodic.go.jp/webgis/sc-016.html
-const SHOKUSEI_CODES_NATURAL = [1, 2, 4, 6, 8]
-const SHOKUSEI_CODES_SECONDARY = [3, 5, 7, 9]
-
-const ADDITIONAL_CHU_CODES_NATURAL = [5807] // Natural bare ground
-
-const daiNaturalCodes = DAI_RAW_CODES.filter(v => SHOKUSEI_CODES_NATURAL.includes(LEGEND_DAI[v]["cc"]));
-const daiSecondaryCodes = DAI_RAW_CODES.filter(v => SHOKUSEI_CODES_SECONDARY.includes(LEGEND_DAI[v]["cc"]));
-
-const chuNaturalCodes = [
-  ...CHU_RAW_CODES.filter(v => daiNaturalCodes.includes(Math.floor(v / 100))),
-  ...ADDITIONAL_CHU_CODES_NATURAL,
-];
-const chuSecondaryCodes = CHU_RAW_CODES.filter(v => daiSecondaryCodes.includes(Math.floor(v / 100)));
-
-const saiNaturalCodes = SAI_RAW_CODES.filter(v => chuNaturalCodes.includes(Math.floor(v / 100)));
-const saiSecondaryCodes = SAI_RAW_CODES.filter(v => chuSecondaryCodes.includes(Math.floor(v / 100)));
-
 const toMapboxFilter = (rawCodes, kubun) => {
   return ["in", ["get", PROPERTY_KEY[kubun]], ["literal", rawCodes]]
 }
 
-const LAYER_FILTER_DAI_NATURAL = toMapboxFilter(daiNaturalCodes, DAI)
-const LAYER_FILTER_DAI_SECONDARY = toMapboxFilter(daiSecondaryCodes, DAI)
-
-const LAYER_FILTER_CHU_NATURAL = toMapboxFilter(chuNaturalCodes, CHU)
-const LAYER_FILTER_CHU_SECONDARY = toMapboxFilter(chuSecondaryCodes, CHU)
-
-const LAYER_FILTER_SAI_NATURAL = toMapboxFilter(saiNaturalCodes, SAI)
-const LAYER_FILTER_SAI_SECONDARY = toMapboxFilter(saiSecondaryCodes, SAI)
-
 export const getShokuseiLayerFilters = (shokusei) => {
   switch (shokusei) {
     case "natural":
-      return [LAYER_FILTER_DAI_NATURAL, LAYER_FILTER_CHU_NATURAL, LAYER_FILTER_SAI_NATURAL]
     case "secondary":
-      return [LAYER_FILTER_DAI_SECONDARY, LAYER_FILTER_CHU_SECONDARY, LAYER_FILTER_SAI_SECONDARY]
+      return SHOKUSEI_LAYER_FILTERS[shokusei]
     default:
       // no filter
       return [null, null, null]
@@ -118,48 +96,33 @@ export const getAdvancedLayerFilters = (filter) => {
 
   const codeKubuns = parseCodeKubunsForAdvancedFilter(filter);
 
-  const dai = toMapboxFilter(
-    DAI_RAW_CODES.filter(rawCode => {
-      return codeKubuns.some(([filterCode, kubun]) => {
-        switch (kubun) {
-          case DAI:
-            return rawCode === filterCode || DAI_SPECIAL_TRANSFORM[rawCode] === filterCode;
-          default:
-            return false;
-        }
-      })
-    }), DAI
-  )
-
-  const chu = toMapboxFilter(
-    CHU_RAW_CODES.filter(rawCode => {
-      return codeKubuns.some(([filterCode, kubun]) => {
-        switch (kubun) {
-          case DAI:
-            return Math.floor(rawCode / 100) === filterCode;
-          case CHU:
-            return rawCode === filterCode;
-          case SAI:
-            return false;
-        }
-      })
-    }), CHU
-  )
-
-  const sai = toMapboxFilter(
-    SAI_RAW_CODES.filter(rawCode => {
-      return codeKubuns.some(([filterCode, kubun]) => {
-        switch (kubun) {
-          case DAI:
-            return Math.floor(rawCode / 10000) === filterCode;
-          case CHU:
-            return Math.floor(rawCode / 100) === filterCode;
-          case SAI:
-            return rawCode === filterCode;
-        }
-      })
-    }), SAI
-  )
+  const daiCodes = new Set();
+  const chuCodes = new Set();
+  const saiCodes = new Set();
+
+  const addAll = (codes, rawCodes) => (rawCodes ?? []).forEach(v => codes.add(v));
+
+  codeKubuns.forEach(([filterCode, kubun]) => {
+    switch (kubun) {
+      case DAI:
+        addAll(daiCodes, [filterCode, DAI_SPECIAL_TRANSFORM_REVERSE[filterCode]].filter(v => v in DAI_RAW_CODE_NAMES));
+        addAll(chuCodes, CODE_HIERARCHY.dai_chu[filterCode]);
+        addAll(saiCodes, CODE_HIERARCHY.dai_sai[filterCode]);
+        break;
+      case CHU:
+        addAll(chuCodes, [filterCode].filter(v => v in CHU_RAW_CODE_NAMES));
+        addAll(saiCodes, CODE_HIERARCHY.chu_sai[filterCode]);
+        break;
+      case SAI:
+        addAll(saiCodes, [filterCode].filter(v => v in SAI_RAW_CODE_NAMES));
+        break;
+    }
+  })
+
+  const sorted = (codes) => [...codes].sort((a, b) => a - b);
+  const dai = toMapboxFilter(sorted(daiCodes), DAI);
+  const chu = toMapboxFilter(sorted(chuCodes), CHU);
+  const sai = toMapboxFilter(sorted(saiCodes), SAI);
 
   return [dai, chu, sai]
 }
@@ -305,7 +268,7 @@ const getTargetCodes = (rawCode, codeKubun, targetKubun) => {
       switch (targetKubun) {
         case SAI_LABELS:
         case SAI:
-          return SAI_RAW_CODES.filter(v => Math.floor(v / 100) === rawCode)
+          return CODE_HIERARCHY.chu_sai[rawCode] ?? []
         case CHU:
           return [rawCode]
         case DAI:
@@ -317,9 +280,9 @@ const getTargetCodes = (rawCode, codeKubun, targetKubun) => {
       switch (targetKubun) {
         case SAI_LABELS:
         case SAI:
-          return SAI_RAW_CODES.filter(v => Math.floor(v / 10000) === code)
+          return CODE_HIERARCHY.dai_sai[code] ?? []
         case CHU:
-          return CHU_RAW_CODES.filter(v => Math.floor(v / 100) === code)
+          return CODE_HIERARCHY.dai_chu[code] ?? []
         case DAI:
           return [rawCode]
       }
@@ -402,7 +365,32 @@ export const updateFillMatcher = (rawCode, kubun, newColor) => {
   }
 
   fillMatcher.splice(2, 0, [rawCode], newColor);
-  return fillMatcher;
+  return getFillColor(kubun);
+}
+
+// Look up the palette by the palette index property if exists, otherwise match the code
+const withPalette = (fillMatcher, paletteCodes, codeColors) => {
+  if (!PALETTE_PROPERTY) {
+    return fillMatcher
+  }
+
+  const palette = paletteCodes.map(code => codeColors[code] ?? FALLBACK_COLOR);
+  return [
+    "case", ["has", PALETTE_PROPERTY_KEY],
+    ["at", ["get", PALETTE_PROPERTY_KEY], ["literal", palette]],
+    fillMatcher,
+  ]
+}
+
+export const getFillColor = (kubun) => {
+  switch (kubun) {
+    case SAI:
+      return withPalette(FILL_COLOR_MATCHER_SAI, PALETTE_CODES_SAI, CODE_COLORS_SAI)
+    case CHU:
+      return withPalette(FILL_COLOR_MATCHER_CHU, PALETTE_CODES_CHU, CODE_COLORS_CHU)
+    case DAI:
+      return withPalette(FILL_COLOR_MATCHER_DAI, PALETTE_CODES_DAI, CODE_COLORS_DAI)
+  }
 }
 
 
@@ -0,0 +1,90 @@
+# Optimize built files for distribution: minify, add content hashes to file names and precompress
+# Requires rjsmin, rcssmin and brotli
+
+import gzip
+import hashlib
+import pathlib
+import re
+
+# Entry files keep their names; Referred from outside (e.g. browser address bar)
+ENTRY_FILES = ["index.html"]
+
+HASH_LENGTH = 10
+
+COMPRESS_SUFFIXES = [".html", ".js", ".css", ".svg", ".json"]
+
+
+def minify(name: str, content: str) -> str:
+    match pathlib.PurePath(name).suffix:
+        case ".js":
+            import rjsmin
+
+            return rjsmin.jsmin(content)
+        case ".css":
+            import rcssmin
+
+            return rcssmin.cssmin(content)
+        case _:
+            return content
+
+
+# Files refer to each other relative to the page root, e.g. from './consts.js' or url('./assets/compass.svg')
+def reference_pattern(name: str) -> re.Pattern:
+    return re.compile(r"(?<=[\"'(])\./" + re.escape(name) + r"(?=[\"')])")
+
+
+def hashed_name(name: str, content: str) -> str:
+    path = pathlib.PurePath(name)
+    digest = hashlib.sha256(content.encode()).hexdigest()[:HASH_LENGTH]
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+# Rename files with their content hashes, and rewrite references to the renamed files
+# A file hash covers hashes of referred files, so dependencies should be resolved first
+def hash_names(contents: dict[str, str], fixed_names: list[str]) -> dict[str, str]:
+    patterns = {name: reference_pattern(name) for name in contents}
+    dependencies = {
+        name: [dep for dep in contents if dep != name and patterns[dep].search(content)]
+        for name, content in contents.items()
+    }
+
+    out_names: dict[str, str] = {}
+    out_contents: dict[str, str] = {}
+
+    def resolve(name: str, visiting: list[str]):
+        if name in out_names:
+            return
+        if name in visiting:
+            raise RuntimeError(f"Circular reference: {' -> '.join([*visiting, name])}")
+
+        content = contents[name]
+        for dep in dependencies[name]:
+            resolve(dep, [*visiting, name])
+            content = patterns[dep].sub(f"./{out_names[dep]}", content)
+
+        out_names[name] = name if name in fixed_names else hashed_name(name, content)
+        out_contents[out_names[name]] = content
+
+    for name in contents:
+        resolve(name, [])
+
+    return out_contents
+
+
+# fixed_names: Files to keep their names in addition to ENTRY_FILES
+def optimize(contents: dict[str, str], fixed_names: list[str]) -> dict[str, str]:
+    return hash_names(
+        {name: minify(name, c) for name, c in contents.items()},
+        [*ENTRY_FILES, *fixed_names],
+    )
+
+
+def write_compressed(path: pathlib.Path, data: bytes):
+    import brotli
+
+    if path.suffix not in COMPRESS_SUFFIXES:
+        return
+
+    # mtime=0 for reproducible outputs
+    path.with_name(f"{path.name}.gz").write_bytes(gzip.compress(data, 9, mtime=0))
+    path.with_name(f"{path.name}.br").write_bytes(brotli.compress(data, quality=11))
@@ -0,0 +1,63 @@
+import argparse
+import json
+import pathlib
+
+from geojson_io import dumps_geojson, loads_geojson
+
+PALETTE_PROPERTY_KEY = "P"
+
+
+def add_palette_index(value: dict, key: str, palette_index: dict[int, int]):
+    for feature in value["features"]:
+        properties = feature["properties"]
+        # Codes without colors are left as is; The viewer falls back to the color matcher
+        if (index := palette_index.get(properties[key])) is not None:
+            properties[PALETTE_PROPERTY_KEY] = index
+
+
+def main(
+    input_path: pathlib.Path, palette_path: pathlib.Path, output_path: pathlib.Path
+):
+    palette = json.load(open(palette_path))
+    key = palette["key"]
+    palette_index = {code: i for i, code in enumerate(palette["codes"])}
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # A FeatureCollection per line
+    with open(input_path) as src, open(output_path, "w") as dst:
+        for line in src:
+            if line.strip() == "":
+                continue
+            value = loads_geojson(line)
+            add_palette_index(value, key, palette_index)
+            dst.write(dumps_geojson(value) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "paletter", "Add palette index property to features for the viewer"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="Input geojsonlines file",
+        required=True,
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "-p",
+        "--palette",
+        help="Palette file generated by colormap (e.g. ../data/style/vg67_sai_palette.json)",
+        required=True,
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        help="Output geojsonlines file",
+        required=True,
+        type=pathlib.Path,
+    )
+    args = parser.parse_args()
+    main(args.input, args.palette, args.out)
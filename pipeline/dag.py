@@ -0,0 +1,162 @@
+# Run nodes of a DAG in parallel; Nodes whose inputs are unchanged since the last successful run are skipped
+
+import glob
+import hashlib
+import heapq
+import json
+import pathlib
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+@dataclass
+class Node:
+    name: str
+    # Command, or a Python function run in a worker thread
+    action: list[str] | Callable[[], None]
+    deps: list[str] = field(default_factory=list)
+    # Appended to the command; Not a part of the fingerprint (e.g. logging)
+    options: list[str] = field(default_factory=list)
+    cwd: pathlib.Path | None = None
+    # Glob patterns of input files; The node reruns when any of them changes
+    inputs: list[str] = field(default_factory=list)
+    # The node reruns when any of them is missing
+    outputs: list[pathlib.Path] = field(default_factory=list)
+    # Also a part of the fingerprint; e.g. cleanup rules of the mesh, not the whole rule file
+    data: str = ""
+    # Higher runs first among ready nodes; e.g. downstream of a mesh before upstream of another mesh
+    priority: int = 0
+
+
+# Completion state as JSON lines, appended on each completion; The last line wins for a node
+class State:
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.fingerprints: dict[str, str] = {}
+        if path.exists():
+            for line in open(path):
+                if line.strip() != "":
+                    value = json.loads(line)
+                    self.fingerprints[value["name"]] = value["fingerprint"]
+        self.lock = threading.Lock()
+
+    def done(self, name: str, fingerprint: str):
+        with self.lock:
+            self.fingerprints[name] = fingerprint
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"name": name, "fingerprint": fingerprint}) + "\n")
+
+
+# Size and mtime of input files; Hashing contents of GB files is too slow
+def fingerprint(node: Node) -> str:
+    # Functions are identified by the node name
+    action = node.name if callable(node.action) else " ".join(node.action)
+    h = hashlib.sha256(action.encode())
+    h.update(node.data.encode())
+    for pattern in node.inputs:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            stat = pathlib.Path(path).stat()
+            h.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def is_done(node: Node, state: State) -> bool:
+    return state.fingerprints.get(node.name) == fingerprint(node) and all(
+        p.exists() for p in node.outputs
+    )
+
+
+def run_node(node: Node):
+    if callable(node.action):
+        node.action()
+        return
+
+    command = [*node.action, *node.options]
+    result = subprocess.run(command, cwd=node.cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"Exit code {result.returncode}: {' '.join(command)}\n{result.stdout}{result.stderr}"
+        )
+
+
+# Nodes required to build the targets
+def select(nodes: dict[str, Node], targets: list[str]) -> dict[str, Node]:
+    selected: dict[str, Node] = {}
+    stack = [*targets]
+    while len(stack) > 0:
+        name = stack.pop()
+        if name in selected:
+            continue
+        selected[name] = nodes[name]
+        stack.extend(nodes[name].deps)
+    return {name: node for name, node in nodes.items() if name in selected}
+
+
+# Returns names of failed nodes; Dependents of failed nodes do not run
+def run(
+    nodes: dict[str, Node], state: State, jobs: int, force: bool, dry_run: bool
+) -> list[str]:
+    for node in nodes.values():
+        for dep in node.deps:
+            if dep not in nodes:
+                raise RuntimeError(f"Unknown dependency of {node.name}: {dep}")
+
+    dependents: dict[str, list[str]] = {name: [] for name in nodes}
+    waiting = {name: len(node.deps) for name, node in nodes.items()}
+    for node in nodes.values():
+        for dep in node.deps:
+            dependents[dep].append(node.name)
+
+    # (-priority, order, name)
+    order = {name: i for i, name in enumerate(nodes)}
+    ready = [(-n.priority, order[n.name], n.name) for n in nodes.values() if not n.deps]
+    heapq.heapify(ready)
+
+    failed: list[str] = []
+    finished = 0
+    running: dict[Future, tuple[str, float]] = {}
+
+    def complete(name: str):
+        nonlocal finished
+        finished += 1
+        for d in dependents[name]:
+            waiting[d] -= 1
+            if waiting[d] == 0:
+                heapq.heappush(ready, (-nodes[d].priority, order[d], d))
+
+    with ThreadPoolExecutor(jobs) as executor:
+        while len(ready) > 0 or len(running) > 0:
+            while len(ready) > 0 and len(running) < jobs:
+                _, _, name = heapq.heappop(ready)
+                node = nodes[name]
+                # Inputs are ready here since all the dependencies completed
+                if not force and is_done(node, state):
+                    complete(name)
+                    continue
+                if dry_run:
+                    print(f"Run: {name}")
+                    complete(name)
+                    continue
+                running[executor.submit(run_node, node)] = (name, time.perf_counter())
+
+            if len(running) == 0:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, started_at = running.pop(future)
+                seconds = time.perf_counter() - started_at
+                if (e := future.exception()) is not None:
+                    print(f"[failed] {name} ({seconds:.1f}s): {e}")
+                    failed.append(name)
+                    continue
+                state.done(name, fingerprint(nodes[name]))
+                complete(name)
+                print(f"[{finished}/{len(nodes)}] {name} ({seconds:.1f}s)")
+
+    return failed
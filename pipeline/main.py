@@ -0,0 +1,424 @@
+import argparse
+import fnmatch
+import functools
+import glob
+import json
+import os
+import pathlib
+import sys
+import tomllib
+
+from dag import Node, State, run, select
+from shapefiles import mesh_shapefiles
+
+REPO_DIR = pathlib.Path(__file__).parent.parent.resolve()
+DATA_DIR = REPO_DIR / "data"
+
+TIPPECANOE_DESCRIPTION = "1/2.5万植生図GISデータ(環境省生物多様性センター) http://www.biodic.go.jp/kiso/vg/vg_kiso.html を加工して作成"
+
+# layer -> (input geojsonlines, tippecanoe options); Same as README
+TIPPECANOE_LAYERS = {
+    "sai": (
+        "vg67_sai",
+        ["-Z10", "-z12", "-d14", "--no-simplification-of-shared-nodes"],
+    ),
+    "chu": ("vg67_chu", ["-Z8", "-z9", "--no-simplification-of-shared-nodes"]),
+    "dai": ("vg67_dai", ["-Z6", "-z7", "--no-simplification-of-shared-nodes"]),
+    "sai-labels": ("vg67_sai_labels", ["-Z12", "-z12", "-d15"]),
+}
+
+# layer -> stage generating per-mesh geojsons of the layer
+LAYER_STAGES = {
+    "sai": "geojsoner",
+    "chu": "trimmer-chu",
+    "dai": "trimmer-dai",
+    "sai-labels": "labeler",
+}
+
+# Downstream first; Finish meshes already started before starting new meshes
+PRIORITY_MESH_STAGE = 1
+PRIORITY_GEOJSONER = 0
+
+
+# mesh -> rules in geojsoner/cleanup.toml
+def cleanup_rules() -> dict[str, list[dict]]:
+    with open(REPO_DIR / "geojsoner/cleanup.toml", "rb") as f:
+        return tomllib.load(f)
+
+
+# Same as `awk '{print $0}' files > output`; Insert a newline after each file
+def concat_lines(files: list[pathlib.Path], output: pathlib.Path):
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as dst:
+        for file in files:
+            with open(file) as src:
+                for line in src:
+                    dst.write(line if line.endswith("\n") else line + "\n")
+
+
+def build_nodes(
+    shapefile_pattern: str,
+    python: str,
+    stage_options: list[str],
+    fused_labels: bool,
+    hilbert_sort: bool,
+    topology: bool,
+) -> dict[str, Node]:
+    nodes: list[Node] = []
+    geojson_dir = DATA_DIR / "geojson"
+    trimmed_dir = DATA_DIR / "geojson-trimmed"
+    # geojsoner writes labels too, instead of labeler reading its output again
+    layer_stages = (
+        {**LAYER_STAGES, "sai-labels": "geojsoner"} if fused_labels else LAYER_STAGES
+    )
+
+    # Per mesh stages; Trimmers and labeler of a mesh start as soon as the mesh is converted
+    meshes = dict(
+        sorted(mesh_shapefiles(glob.glob(shapefile_pattern, recursive=True)).items())
+    )
+    rules = cleanup_rules()
+    geojsons: dict[str, list[pathlib.Path]] = {layer: [] for layer in LAYER_STAGES}
+    for mesh, shapefile in meshes.items():
+        geojson = geojson_dir / f"{mesh}.geojson"
+        labels = trimmed_dir / "sai-labels" / f"{mesh}.geojson"
+        nodes.append(
+            Node(
+                f"geojsoner/{mesh}",
+                [
+                    *[python, "main.py", "-s", glob.escape(str(shapefile.absolute()))],
+                    *["-o", str(geojson_dir)],
+                    *["-c", str(DATA_DIR / "coverage/meshes")],
+                    *(["-l", str(labels.parent)] if fused_labels else []),
+                ],
+                options=stage_options,
+                cwd=REPO_DIR / "geojsoner",
+                inputs=[glob.escape(str(shapefile.with_suffix(""))) + ".*"],
+                outputs=[geojson, *([labels] if fused_labels else [])],
+                # Changing rules of a mesh reruns the mesh only; Meshes without rules keep fingerprints
+                data=json.dumps(rules[mesh], sort_keys=True) if mesh in rules else "",
+                priority=PRIORITY_GEOJSONER,
+            )
+        )
+        geojsons["sai"].append(geojson)
+        if fused_labels:
+            geojsons["sai-labels"].append(labels)
+
+        # Trimmers read shared arcs instead of the geojson
+        trimmer_input, trimmer_dep = geojson, f"geojsoner/{mesh}"
+        if topology:
+            trimmer_input = DATA_DIR / "topology" / f"{mesh}.topojson"
+            trimmer_dep = f"topology/{mesh}"
+            nodes.append(
+                Node(
+                    trimmer_dep,
+                    [
+                        *[python, "main.py", "-g", glob.escape(str(geojson))],
+                        *["-o", str(trimmer_input.parent)],
+                    ],
+                    options=stage_options,
+                    deps=[f"geojsoner/{mesh}"],
+                    cwd=REPO_DIR / "topology",
+                    inputs=[glob.escape(str(geojson))],
+                    outputs=[trimmer_input],
+                    priority=PRIORITY_MESH_STAGE,
+                )
+            )
+
+        for layer, stage, args, input_path, dep in [
+            ("chu", "trimmer", ["-k", "chu"], trimmer_input, trimmer_dep),
+            ("dai", "trimmer", ["-k", "dai"], trimmer_input, trimmer_dep),
+            *(
+                []
+                if fused_labels
+                else [("sai-labels", "labeler", [], geojson, f"geojsoner/{mesh}")]
+            ),
+        ]:
+            out_dir = trimmed_dir / layer
+            output = out_dir / f"{mesh}.geojson"
+            nodes.append(
+                Node(
+                    f"{LAYER_STAGES[layer]}/{mesh}",
+                    [
+                        *[python, "main.py", "-g", glob.escape(str(input_path))],
+                        *[*args, "-o", str(out_dir)],
+                    ],
+                    options=stage_options,
+                    deps=[dep],
+                    cwd=REPO_DIR / stage,
+                    inputs=[glob.escape(str(input_path))],
+                    outputs=[output],
+                    priority=PRIORITY_MESH_STAGE,
+                )
+            )
+            geojsons[layer].append(output)
+
+    for layer, files in geojsons.items():
+        name, options = TIPPECANOE_LAYERS[layer]
+        geojsonlines = DATA_DIR / f"geojson-lines/{name}.geojsonlines"
+        nodes.append(
+            Node(
+                f"merge/{layer}",
+                functools.partial(concat_lines, files, geojsonlines),
+                deps=[f"{layer_stages[layer]}/{mesh}" for mesh in meshes],
+                inputs=[glob.escape(str(f)) for f in files],
+                outputs=[geojsonlines],
+            )
+        )
+        tippecanoe_input, tippecanoe_dep = geojsonlines, f"merge/{layer}"
+        if hilbert_sort:
+            # Spatially close features next to each other for tippecanoe
+            tippecanoe_input = DATA_DIR / f"geojson-lines/sorted/{name}.geojsonlines"
+            tippecanoe_dep = f"sort/{layer}"
+            nodes.append(
+                Node(
+                    tippecanoe_dep,
+                    [
+                        *[python, str(REPO_DIR / "sorter/main.py")],
+                        *["-i", str(geojsonlines), "-o", str(tippecanoe_input)],
+                    ],
+                    deps=[f"merge/{layer}"],
+                    inputs=[str(geojsonlines)],
+                    outputs=[tippecanoe_input],
+                )
+            )
+        out_dir = DATA_DIR / f"mvt/{layer}/out"
+        nodes.append(
+            Node(
+                f"tippecanoe/{layer}",
+                [
+                    "tippecanoe",
+                    *options,
+                    *["-l", name, f"--name={name}"],
+                    f"--description={TIPPECANOE_DESCRIPTION}",
+                    "--no-tile-compression",
+                    "--no-tile-size-limit",
+                    "--no-feature-limit",
+                    *(["--no-tiny-polygon-reduction"] if layer != "sai-labels" else []),
+                    *["-e", f"{out_dir}/", "--force", "--read-parallel"],
+                    str(tippecanoe_input),
+                ],
+                deps=[tippecanoe_dep],
+                inputs=[str(tippecanoe_input)],
+                outputs=[out_dir / "metadata.json"],
+            )
+        )
+
+    # z0-z5 dai; Simplified per zoom by overview already
+    overview = DATA_DIR / "geojson-lines/vg67_dai_overview.geojsonlines"
+    nodes.append(
+        Node(
+            "overview",
+            [python, "main.py", "-o", str(overview)],
+            deps=[f"trimmer-dai/{mesh}" for mesh in meshes],
+            cwd=REPO_DIR / "overview",
+            inputs=[glob.escape(str(f)) for f in geojsons["dai"]],
+            outputs=[overview],
+        )
+    )
+    overview_dir = DATA_DIR / "mvt/dai-overview/out"
+    nodes.append(
+        Node(
+            "tippecanoe/dai-overview",
+            [
+                "tippecanoe",
+                *["-Z0", "-z5", "--no-line-simplification"],
+                *["-l", "vg67_dai", "--name=vg67_dai_overview"],
+                f"--description={TIPPECANOE_DESCRIPTION}",
+                "--no-tile-compression",
+                "--no-tile-size-limit",
+                "--no-feature-limit",
+                "--no-tiny-polygon-reduction",
+                *["-e", f"{overview_dir}/", "--force", "--read-parallel"],
+                str(overview),
+            ],
+            deps=["overview"],
+            inputs=[str(overview)],
+            outputs=[overview_dir / "metadata.json"],
+        )
+    )
+
+    # Tiles affected by each mesh, from outputs of all the per mesh stages
+    nodes.append(
+        Node(
+            "tileindex",
+            [python, "main.py", "-s", shapefile_pattern],
+            deps=[
+                f"{stage}/{mesh}"
+                for mesh in meshes
+                for stage in sorted(set(layer_stages.values()))
+            ],
+            cwd=REPO_DIR / "tileindex",
+            inputs=[glob.escape(str(f)) for files in geojsons.values() for f in files],
+            outputs=[DATA_DIR / "tileindex/tiles.json"],
+        )
+    )
+    nodes.append(
+        Node(
+            "coverage",
+            [python, str(REPO_DIR / "coverage/main.py")],
+            deps=[f"geojsoner/{mesh}" for mesh in meshes],
+            inputs=[str(DATA_DIR / "coverage/meshes/*.json")],
+            outputs=[DATA_DIR / "coverage/coverage.json"],
+        )
+    )
+
+    # Legends and styles; Independent from meshes
+    nodes.append(
+        Node(
+            "hanrei-crawler",
+            [python, "main.py"],
+            cwd=REPO_DIR / "hanrei_crawler",
+            outputs=[DATA_DIR / "hanrei"],
+        )
+    )
+    nodes.append(
+        Node(
+            "hanrei-postprocess",
+            [python, "postprocess.py"],
+            deps=["hanrei-crawler"],
+            cwd=REPO_DIR / "hanrei_crawler",
+            inputs=[str(DATA_DIR / "hanrei/*_raw/*")],
+            outputs=[DATA_DIR / "hanrei/names", DATA_DIR / "hanrei/descriptions"],
+        )
+    )
+    # Requires the color cache of the lyr file, or slyr (See colormap)
+    nodes.append(
+        Node(
+            "colormap",
+            [
+                python,
+                "colormap.py",
+                "-l",
+                "lyr/origin.lyr",
+                "-o",
+                str(DATA_DIR / "style"),
+            ],
+            cwd=REPO_DIR / "colormap",
+            inputs=[str(REPO_DIR / "colormap/lyr/*"), str(REPO_DIR / "colormap/*.py")],
+            outputs=[DATA_DIR / "style/vg67_sai_style.json"],
+        )
+    )
+    nodes.append(
+        Node(
+            "page",
+            [python, "build.py"],
+            deps=["hanrei-postprocess", "colormap"],
+            cwd=REPO_DIR / "page",
+            inputs=[
+                str(REPO_DIR / "page/**/*"),
+                str(DATA_DIR / "style/*.json"),
+                str(DATA_DIR / "hanrei/names/*.json"),
+            ],
+            outputs=[DATA_DIR / "page/index.html"],
+        )
+    )
+
+    return {node.name: node for node in nodes}
+
+
+def main(
+    shapefile_pattern: str,
+    targets: list[str],
+    state_path: pathlib.Path,
+    python: str,
+    stage_options: list[str],
+    fused_labels: bool,
+    hilbert_sort: bool,
+    topology: bool,
+    jobs: int,
+    force: bool,
+    dry_run: bool,
+):
+    nodes = build_nodes(
+        shapefile_pattern, python, stage_options, fused_labels, hilbert_sort, topology
+    )
+
+    if len(targets) > 0:
+        names = [n for n in nodes if any(fnmatch.fnmatch(n, t) for t in targets)]
+        if len(names) == 0:
+            raise RuntimeError(f"No nodes match targets: {targets}")
+        nodes = select(nodes, names)
+
+    print(f"Nodes: {len(nodes)}")
+    failed = run(nodes, State(state_path), jobs, force, dry_run)
+    if len(failed) > 0:
+        raise RuntimeError(f"Failed nodes: {failed}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "pipeline", "Run the whole pipeline in parallel, skipping completed steps"
+    )
+    parser.add_argument(
+        "-s",
+        "--shapefile-pattern",
+        help="Python glob library style file pattern locating shapefiles",
+        required=True,
+        type=str,
+    )
+    parser.add_argument(
+        "-t",
+        "--target",
+        help="Run only nodes matching this pattern and their dependencies (e.g. 'tippecanoe/*', 'trimmer-chu/p5339*'); Repeatable",
+        action="append",
+        default=[],
+    )
+    parser.add_argument(
+        "--state",
+        help="Completion state file",
+        type=pathlib.Path,
+        default=DATA_DIR / "pipeline/state.jsonl",
+    )
+    parser.add_argument(
+        "--python",
+        help="Python executable to run stages with (fiona and shapely required)",
+        type=str,
+        default=sys.executable,
+    )
+    parser.add_argument(
+        "--log",
+        help="Pass --log to geojsoner, topology, trimmer and labeler (See common)",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--fused-labels",
+        help="Write sai-labels in geojsoner (-l) instead of running labeler",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--hilbert-sort",
+        help="Sort features of each layer along a Hilbert curve (sorter) before tippecanoe",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--topology",
+        help="Encode geojsoner output into shared arcs (topology) and run trimmers on them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of parallel nodes",
+        type=int,
+        default=os.cpu_count(),
+    )
+    parser.add_argument(
+        "-f", "--force", help="Run all nodes ignoring the state", action="store_true"
+    )
+    parser.add_argument(
+        "-n", "--dry-run", help="Print nodes to run only", action="store_true"
+    )
+    args = parser.parse_args()
+    main(
+        args.shapefile_pattern,
+        args.target,
+        args.state,
+        args.python,
+        ["--log", str(args.log.absolute())] if args.log is not None else [],
+        args.fused_labels,
+        args.hilbert_sort,
+        args.topology,
+        args.jobs,
+        args.force,
+        args.dry_run,
+    )
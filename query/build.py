@@ -0,0 +1,71 @@
+import argparse
+import glob
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+
+from geojson_io import load_geojson
+from index import write_index
+
+
+def build(input_path: pathlib.Path, output_path: pathlib.Path) -> int:
+    features = load_geojson(input_path)["features"]
+    write_index(features, output_path)
+    return len(features)
+
+
+def main(geojson_pattern: str, output_dir: pathlib.Path, jobs: int, force: bool):
+    if output_dir.exists() and not output_dir.is_dir():
+        raise RuntimeError(
+            f"Output directory: {output_dir.absolute()} is not a directory"
+        )
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    targets = []
+    for file in sorted(glob.glob(geojson_pattern, recursive=True)):
+        input_path = pathlib.Path(file)
+        output_path = output_dir / f"{input_path.stem.lower()}.npz"
+        # Only meshes whose geojson changed since the last build
+        if (
+            not force
+            and output_path.exists()
+            and output_path.stat().st_mtime_ns >= input_path.stat().st_mtime_ns
+        ):
+            continue
+        targets.append((input_path, output_path))
+
+    print(f"Meshes to build: {len(targets)}")
+    with ProcessPoolExecutor(jobs) as executor:
+        counts = executor.map(build, [i for i, _ in targets], [o for _, o in targets])
+        for (input_path, _), count in zip(targets, counts):
+            print(f"{input_path}: {count} features")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "query-build", "Build per-mesh spatial index files from geojsoner output"
+    )
+    parser.add_argument(
+        "-g",
+        "--geojson-pattern",
+        help="Python glob library style file pattern locating geojsons",
+        type=str,
+        default="../data/geojson/*.geojson",
+    )
+    parser.add_argument(
+        "-o",
+        "--out-dir",
+        help="Directory for index files",
+        type=pathlib.Path,
+        default=pathlib.Path("../data/query"),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes",
+        type=int,
+        default=os.cpu_count(),
+    )
+    parser.add_argument("-f", "--force", help="Rebuild all meshes", action="store_true")
+    args = parser.parse_args()
+    main(args.geojson_pattern, args.out_dir, args.jobs, args.force)
@@ -0,0 +1,167 @@
+# Spatial index of sai features per mesh, and a router from coordinates to meshes
+#
+# An index file per mesh holds WKB of features and their codes in flat arrays (npz).
+# Loading one parses WKB and bulk-loads a packed STRtree of GEOS at once; Recently used meshes stay in memory.
+
+import functools
+import pathlib
+from dataclasses import dataclass
+
+import numpy as np
+import shapely
+from mesh import MESH2_COLS_PER_LNG, MESH2_ROWS_PER_LAT
+
+
+@dataclass
+class MeshIndex:
+    geoms: np.ndarray
+    codes: np.ndarray
+    tree: shapely.STRtree
+
+
+def write_index(features: list[dict], path: pathlib.Path):
+    geoms = np.array(
+        [shapely.geometry.shape(f["geometry"]) for f in features], dtype=object
+    )
+    wkbs = shapely.to_wkb(geoms)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write through a temporary file; Readers may load the index meanwhile
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            wkb=np.frombuffer(b"".join(wkbs), dtype=np.uint8),
+            offsets=np.cumsum([0, *(len(w) for w in wkbs)]),
+            codes=np.array(
+                [feature["properties"]["H"] for feature in features], dtype=np.int32
+            ),
+        )
+    tmp.replace(path)
+
+
+def read_index(path: pathlib.Path) -> MeshIndex:
+    with np.load(path) as data:
+        wkb = data["wkb"].tobytes()
+        offsets = data["offsets"].tolist()
+        codes = data["codes"]
+    geoms = shapely.from_wkb(
+        np.array([wkb[s:e] for s, e in zip(offsets, offsets[1:])], dtype=object)
+    )
+    return MeshIndex(geoms, codes, shapely.STRtree(geoms))
+
+
+# 2nd mesh codes as integers, e.g. 533945
+def mesh2_codes(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    return rows // 8 * 10000 + (cols // 8 - 100) * 100 + rows % 8 * 10 + cols % 8
+
+
+# 2nd mesh code of each point
+def point_meshes(lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    rows = np.floor(np.asarray(lat) * MESH2_ROWS_PER_LAT).astype(np.int64)
+    cols = np.floor(np.asarray(lng) * MESH2_COLS_PER_LNG).astype(np.int64)
+    return mesh2_codes(rows, cols)
+
+
+# Pairs of (bbox index, 2nd mesh code) for meshes overlapping each bbox
+def bbox_meshes(bboxes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    row_min = np.floor(bboxes[:, 1] * MESH2_ROWS_PER_LAT).astype(np.int64)
+    row_max = np.floor(bboxes[:, 3] * MESH2_ROWS_PER_LAT).astype(np.int64)
+    col_min = np.floor(bboxes[:, 0] * MESH2_COLS_PER_LNG).astype(np.int64)
+    col_max = np.floor(bboxes[:, 2] * MESH2_COLS_PER_LNG).astype(np.int64)
+    n_rows = row_max - row_min + 1
+    n_cols = col_max - col_min + 1
+
+    # Expand each bbox into its meshes in row-major order
+    counts = n_rows * n_cols
+    bbox_indexes = np.repeat(np.arange(len(bboxes)), counts)
+    nth = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    rows = row_min[bbox_indexes] + nth // n_cols[bbox_indexes]
+    cols = col_min[bbox_indexes] + nth % n_cols[bbox_indexes]
+    return bbox_indexes, mesh2_codes(rows, cols)
+
+
+# Group indexes by keys; Yields (key, indexes of the key)
+def group_by(keys: np.ndarray):
+    order = np.argsort(keys, kind="stable")
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    for key, indexes in zip(unique_keys.tolist(), np.split(order, starts[1:])):
+        yield key, indexes
+
+
+class Index:
+    def __init__(self, index_dir: pathlib.Path, cache_size: int = 256):
+        self.index_dir = index_dir
+        self.meshes = {int(p.stem[1:]) for p in index_dir.glob("p*.npz")}
+        if len(self.meshes) == 0:
+            raise RuntimeError(f"No index files in {index_dir.absolute()}")
+        self.load = functools.lru_cache(cache_size)(self._load)
+
+    def _load(self, mesh: int) -> MeshIndex | None:
+        if mesh not in self.meshes:
+            return None
+        return read_index(self.index_dir / f"p{mesh}.npz")
+
+    # Returns 2nd mesh codes (0 if NaN), feature indexes in the mesh (-1 if none) and HANREI codes (0 if none) of points
+    # A point on a shared border gets the first feature of the mesh
+    def lookup(
+        self, lng: np.ndarray, lat: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lng = np.asarray(lng, dtype=np.float64)
+        lat = np.asarray(lat, dtype=np.float64)
+        # Points without coordinates (NaN) are in no mesh
+        finite = np.flatnonzero(np.isfinite(lng) & np.isfinite(lat))
+        meshes = np.zeros(len(lng), dtype=np.int64)
+        meshes[finite] = point_meshes(lng[finite], lat[finite])
+        features = np.full(len(lng), -1, dtype=np.int64)
+        codes = np.zeros(len(lng), dtype=np.int32)
+
+        for mesh, indexes in group_by(meshes[finite]):
+            indexes = finite[indexes]
+            if (index := self.load(mesh)) is None:
+                continue
+            points, hits = index.tree.query(
+                shapely.points(lng[indexes], lat[indexes]), predicate="intersects"
+            )
+            # First feature for each point
+            order = np.lexsort([hits, points])
+            points, first = np.unique(points[order], return_index=True)
+            hits = hits[order][first]
+            features[indexes[points]] = hits
+            codes[indexes[points]] = index.codes[hits]
+
+        return meshes, features, codes
+
+    # Returns (bbox index, 2nd mesh code, feature index in the mesh) of features intersecting each bbox
+    # bboxes: (minx, miny, maxx, maxy) rows
+    def query_bboxes(
+        self, bboxes: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        bbox_indexes, meshes = bbox_meshes(bboxes)
+        results = []
+        for mesh, indexes in group_by(meshes):
+            if (index := self.load(mesh)) is None:
+                continue
+            boxes, hits = index.tree.query(
+                shapely.box(*bboxes[bbox_indexes[indexes]].T), predicate="intersects"
+            )
+            results.append(
+                (bbox_indexes[indexes][boxes], np.full(len(hits), mesh), hits)
+            )
+
+        if len(results) == 0:
+            return tuple(np.empty(0, dtype=np.int64) for _ in range(3))  # type: ignore
+        bbox_result, mesh_result, hit_result = (
+            np.concatenate(r) for r in zip(*results)
+        )
+        order = np.lexsort([hit_result, mesh_result, bbox_result])
+        return bbox_result[order], mesh_result[order], hit_result[order]
+
+    def feature(self, mesh: int, i: int) -> dict:
+        index: MeshIndex = self.load(mesh)  # type: ignore
+        return {
+            "type": "Feature",
+            "properties": {"H": int(index.codes[i]), "mesh": f"p{mesh}"},
+            "geometry": shapely.geometry.mapping(index.geoms[i]),
+        }
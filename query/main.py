@@ -0,0 +1,123 @@
+import argparse
+import csv
+import pathlib
+import sys
+import time
+
+import numpy as np
+from geojson_io import dumps_geojson
+from index import Index
+
+
+# Empty or non-numeric cells are NaN; Such rows get empty mesh and H
+def parse_coordinate(value: str | None) -> float:
+    try:
+        return float(value)  # type: ignore
+    except (TypeError, ValueError):
+        return np.nan
+
+
+# Adds mesh and H columns to rows of the CSV; Rows without data get empty values
+def lookup_csv(
+    index: Index,
+    input_path: pathlib.Path,
+    output_path: pathlib.Path | None,
+    lng_column: str,
+    lat_column: str,
+):
+    with open(input_path, newline="") as f:
+        reader = csv.DictReader(f)
+        fieldnames = [*(reader.fieldnames or []), "mesh", "H"]
+        rows = list(reader)
+    for column in [lng_column, lat_column]:
+        if column not in fieldnames:
+            raise RuntimeError(f"No column {column} in {input_path}")
+
+    started_at = time.perf_counter()
+    lng = np.array([parse_coordinate(row[lng_column]) for row in rows])
+    lat = np.array([parse_coordinate(row[lat_column]) for row in rows])
+    meshes, features, codes = index.lookup(lng, lat)
+    seconds = time.perf_counter() - started_at
+
+    found = features >= 0
+    for row, mesh, f, code in zip(
+        rows, meshes.tolist(), found.tolist(), codes.tolist()
+    ):
+        row["mesh"] = f"p{mesh}" if f else ""
+        row["H"] = code if f else ""
+
+    out = open(output_path, "w", newline="") if output_path else sys.stdout
+    try:
+        writer = csv.DictWriter(out, fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(
+        f"Points: {len(rows)}, Found: {int(found.sum())},"
+        f" {len(rows) / max(seconds, 1e-9):.0f} points/sec",
+        file=sys.stderr,
+    )
+
+
+# Prints features intersecting the bboxes as geojson lines
+def query_bboxes(index: Index, bboxes: list[list[float]]):
+    bbox_indexes, meshes, features = index.query_bboxes(np.array(bboxes))
+    for i, mesh, feature in zip(
+        bbox_indexes.tolist(), meshes.tolist(), features.tolist()
+    ):
+        value = index.feature(mesh, feature)
+        value["properties"]["bbox"] = i
+        print(dumps_geojson(value))
+
+
+def parse_bbox(value: str) -> list[float]:
+    bbox = [float(v) for v in value.split(",")]
+    if len(bbox) != 4:
+        raise argparse.ArgumentTypeError(f"Not minx,miny,maxx,maxy: {value}")
+    return bbox
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "query", "Look up HANREI codes at points and features in bboxes"
+    )
+    parser.add_argument(
+        "-i",
+        "--index-dir",
+        help="Directory of index files (See build.py)",
+        type=pathlib.Path,
+        default=pathlib.Path("../data/query"),
+    )
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument(
+        "-p",
+        "--points",
+        help="CSV file of points with a header; Writes it with mesh and H columns",
+        type=pathlib.Path,
+    )
+    target.add_argument(
+        "-b",
+        "--bbox",
+        help="minx,miny,maxx,maxy in WGS84; Prints intersecting features as geojson lines; Repeatable",
+        type=parse_bbox,
+        action="append",
+    )
+    parser.add_argument(
+        "-o", "--out", help="Output CSV file (default: stdout)", type=pathlib.Path
+    )
+    parser.add_argument(
+        "--lng-column", help="Column of longitudes", type=str, default="lng"
+    )
+    parser.add_argument(
+        "--lat-column", help="Column of latitudes", type=str, default="lat"
+    )
+    args = parser.parse_args()
+
+    index = Index(args.index_dir)
+    if args.points is not None:
+        lookup_csv(index, args.points, args.out, args.lng_column, args.lat_column)
+    else:
+        query_bboxes(index, args.bbox)
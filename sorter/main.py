@@ -0,0 +1,164 @@
+import argparse
+import heapq
+import itertools
+import pathlib
+import tempfile
+
+import numpy as np
+import shapely
+from geojson_io import dumps_geojson, loads_geojson
+
+# Same as bounds of sources in page; Features out of them are clamped
+BOUNDS = (122, 24, 154, 46)
+# 2^16 x 2^16 cells; ~50m x ~30m in Japan
+ORDER = 16
+# Number of run files merged at once; Bounds open files
+MERGE_FAN_IN = 64
+# Fixed width prefix of lines in run files: Hilbert key (10 digits) + sequence number (12 digits)
+PREFIX_LENGTH = 22
+
+
+# Index along the Hilbert curve of order for each cell (x, y) in [0, 2^order)
+def hilbert_keys(x: np.ndarray, y: np.ndarray, order: int = ORDER) -> np.ndarray:
+    x = x.astype(np.int64)
+    y = y.astype(np.int64)
+    n = 1 << order
+    keys = np.zeros(len(x), dtype=np.int64)
+    s = n >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx) ^ ry)
+        # Rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, n - 1 - x, x)
+        y = np.where(flip, n - 1 - y, y)
+        x, y = np.where(ry, x, y), np.where(ry, y, x)
+        s >>= 1
+    return keys
+
+
+# Hilbert keys of bbox centers of features in geojson lines; Features without geometry come first
+def feature_keys(lines: list[str]) -> np.ndarray:
+    # Null, missing or unparsable geometries are None with NaN bounds; Keys of (0, 0)
+    bounds = shapely.bounds(shapely.from_geojson(lines, on_invalid="ignore"))
+    west, south, east, north = BOUNDS
+    n = 1 << ORDER
+    x = ((bounds[:, 0] + bounds[:, 2]) / 2 - west) / (east - west) * n
+    y = ((bounds[:, 1] + bounds[:, 3]) / 2 - south) / (north - south) * n
+    return hilbert_keys(
+        np.clip(np.nan_to_num(x), 0, n - 1), np.clip(np.nan_to_num(y), 0, n - 1)
+    )
+
+
+# A line for each feature; Lines of FeatureCollection (e.g. a mesh each, merged by pipeline) are split
+# Members of collections other than features (name, crs of geojsoner) are dropped; tippecanoe does not need them
+def feature_lines(line: str) -> list[str]:
+    value = loads_geojson(line)
+    if value["type"] != "FeatureCollection":
+        return [line if line.endswith("\n") else line + "\n"]
+    return [dumps_geojson(feature) + "\n" for feature in value["features"]]
+
+
+# Sorted runs of feature lines fitting in memory_bytes, prefixed with keys and input order
+def write_runs(
+    input_path: pathlib.Path, tmp_dir: pathlib.Path, memory_bytes: int
+) -> list[pathlib.Path]:
+    runs: list[pathlib.Path] = []
+    seq = 0
+
+    def flush(lines: list[str]):
+        nonlocal seq
+        keys = feature_keys(lines)
+        order = np.argsort(keys, kind="stable")
+        path = tmp_dir / f"run-{len(runs)}.txt"
+        with open(path, "w") as f:
+            for i, key in zip(order.tolist(), keys[order].tolist()):
+                f.write(f"{key:010d}{seq + i:012d}{lines[i]}")
+        runs.append(path)
+        seq += len(lines)
+
+    with open(input_path) as f:
+        lines: list[str] = []
+        size = 0
+        for line in f:
+            if not line.strip():
+                continue
+            features = feature_lines(line)
+            lines.extend(features)
+            size += sum(len(feature) for feature in features)
+            if size >= memory_bytes:
+                flush(lines)
+                lines, size = [], 0
+        if lines:
+            flush(lines)
+    return runs
+
+
+# Prefixes are unique; Comparing lines compares keys then input order
+def merge_runs(runs: list[pathlib.Path], output, strip: bool):
+    files = [open(run) for run in runs]
+    try:
+        for line in heapq.merge(*files):
+            output.write(line[PREFIX_LENGTH:] if strip else line)
+    finally:
+        for f in files:
+            f.close()
+
+
+def main(
+    input_path: pathlib.Path,
+    output_path: pathlib.Path,
+    memory_mb: int,
+    tmp_dir: pathlib.Path | None,
+):
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Next to the output by default; Runs are as large as the input
+    with tempfile.TemporaryDirectory(dir=tmp_dir or output_path.parent) as tmp:
+        runs = write_runs(input_path, pathlib.Path(tmp), memory_mb * 1024 * 1024)
+        print(f"Runs: {len(runs)}")
+
+        # Merge passes until runs fit in the fan-in
+        generation = itertools.count()
+        while len(runs) > MERGE_FAN_IN:
+            merged = []
+            for i in range(0, len(runs), MERGE_FAN_IN):
+                path = pathlib.Path(tmp) / f"merged-{next(generation)}.txt"
+                with open(path, "w") as f:
+                    merge_runs(runs[i : i + MERGE_FAN_IN], f, False)
+                for run in runs[i : i + MERGE_FAN_IN]:
+                    run.unlink()
+                merged.append(path)
+            runs = merged
+
+        # Write through a temporary file; The input may be the output
+        tmp_output = output_path.with_name(f".{output_path.name}.tmp")
+        with open(tmp_output, "w") as f:
+            merge_runs(runs, f, True)
+        tmp_output.replace(output_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "sorter", "Sort features of geojsonlines along a Hilbert curve"
+    )
+    parser.add_argument(
+        "-i", "--input", help="Input geojsonlines", type=pathlib.Path, required=True
+    )
+    parser.add_argument(
+        "-o", "--out", help="Output geojsonlines", type=pathlib.Path, required=True
+    )
+    parser.add_argument(
+        "-m",
+        "--memory-mb",
+        help="Size of lines sorted in memory at once",
+        type=int,
+        default=256,
+    )
+    parser.add_argument(
+        "--tmp-dir",
+        help="Directory for temporary run files (default: directory of the output)",
+        type=pathlib.Path,
+    )
+    args = parser.parse_args()
+    main(args.input, args.out, args.memory_mb, args.tmp_dir)
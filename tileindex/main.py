@@ -0,0 +1,147 @@
+import argparse
+import glob
+import json
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+
+import shapely
+from geojson_io import load_geojson
+from mesh import bounds_tiles, mesh2_bounds
+
+# layer -> (geojson directory under data, zoom levels of tiles); Same as README and pipeline
+# Overzoomed details (-d) do not change tile coordinates
+# None: Dissolved and simplified among all the meshes; Every mesh affects all the tiles in BOUNDS
+LAYERS: dict[str, tuple[str | None, range]] = {
+    "sai": ("geojson", range(10, 13)),
+    "chu": ("geojson-trimmed/chu", range(8, 10)),
+    "dai": ("geojson-trimmed/dai", range(6, 8)),
+    "sai-labels": ("geojson-trimmed/sai-labels", range(12, 13)),
+    "dai-overview": (None, range(0, 6)),
+}
+
+# Same as BOUNDS of overview
+BOUNDS = (122, 24, 154, 46)
+
+# Default buffer of tippecanoe (-b) in 1/256 of a tile; Features within it are in the tile too
+BUFFER = 5
+
+
+# Bounds of the mesh grid and features of the mesh together
+# Features of shapefiles may stick out of the grid a bit
+def mesh_bounds(mesh: str, geojson: pathlib.Path) -> tuple[float, ...]:
+    bounds = mesh2_bounds(mesh[1:])
+    if not geojson.exists():
+        return bounds
+    geoms = [
+        shapely.geometry.shape(f["geometry"]) for f in load_geojson(geojson)["features"]
+    ]
+    if len(geoms) == 0:
+        return bounds
+    west, south, east, north = shapely.total_bounds(geoms).tolist()
+    return (
+        min(bounds[0], west),
+        min(bounds[1], south),
+        max(bounds[2], east),
+        max(bounds[3], north),
+    )
+
+
+# layer -> zoom -> [min x, min y, max x, max y] of tiles
+def mesh_tiles(
+    mesh: str, data_dir: pathlib.Path, buffer: int
+) -> dict[str, dict[int, list[int]]]:
+    layer_bounds: dict[str, tuple[float, ...]] = {}
+    tiles = {}
+    for layer, (directory, zooms) in LAYERS.items():
+        if directory is None:
+            tiles[layer] = {z: list(bounds_tiles(z, BOUNDS)) for z in zooms}
+            continue
+        if directory not in layer_bounds:
+            layer_bounds[directory] = mesh_bounds(
+                mesh, data_dir / directory / f"{mesh}.geojson"
+            )
+        tiles[layer] = {
+            z: list(bounds_tiles(z, layer_bounds[directory], buffer / 256))  # type: ignore
+            for z in zooms
+        }
+    return tiles
+
+
+def main(
+    shapefile_pattern: str,
+    data_dir: pathlib.Path,
+    output: pathlib.Path,
+    buffer: int,
+    jobs: int,
+):
+    # Same mesh names as geojsoner
+    meshes = sorted(
+        {
+            pathlib.Path(f).stem.lower()
+            for f in glob.glob(shapefile_pattern, recursive=True)
+        }
+    )
+    if len(meshes) == 0:
+        raise RuntimeError(f"No shapefiles: {shapefile_pattern}")
+
+    with ProcessPoolExecutor(jobs) as executor:
+        results = executor.map(
+            mesh_tiles,
+            meshes,
+            [data_dir] * len(meshes),
+            [buffer] * len(meshes),
+            chunksize=16,
+        )
+        index = dict(zip(meshes, results))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    json.dump(
+        {"buffer": buffer, "meshes": index},
+        open(output, "w"),
+        separators=(",", ":"),
+    )
+    print(f"Meshes: {len(index)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "tileindex", "Build an index from mesh codes to XYZ tiles of each layer"
+    )
+    parser.add_argument(
+        "-s",
+        "--shapefile-pattern",
+        help="Python glob library style file pattern locating shapefiles",
+        type=str,
+        required=True,
+    )
+    parser.add_argument(
+        "-d",
+        "--data-dir",
+        help="Data directory with geojson and geojson-trimmed",
+        type=pathlib.Path,
+        default=pathlib.Path("../data"),
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        help="Output index file",
+        type=pathlib.Path,
+        default=pathlib.Path("../data/tileindex/tiles.json"),
+    )
+    parser.add_argument(
+        "-b",
+        "--buffer",
+        help="Buffer of tippecanoe in 1/256 of a tile",
+        type=int,
+        default=BUFFER,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of processes",
+        type=int,
+        default=os.cpu_count(),
+    )
+    args = parser.parse_args()
+    main(args.shapefile_pattern, args.data_dir, args.out, args.buffer, args.jobs)
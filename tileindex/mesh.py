@@ -0,0 +1 @@
+../common/mesh.py
\ No newline at end of file
@@ -0,0 +1,55 @@
+import argparse
+import fnmatch
+import json
+import pathlib
+
+from main import LAYERS
+
+
+# {z}/{x}/{y}.pbf paths of tiles of the layer covering any of the meshes
+def tile_paths(index: dict, mesh_patterns: list[str], layer: str) -> list[str]:
+    meshes = [
+        mesh
+        for mesh in index["meshes"]
+        if any(fnmatch.fnmatch(mesh, p.lower()) for p in mesh_patterns)
+    ]
+    if len(meshes) == 0:
+        raise RuntimeError(f"No meshes in the index: {' '.join(mesh_patterns)}")
+
+    tiles = set()
+    for mesh in meshes:
+        for z, (min_x, min_y, max_x, max_y) in index["meshes"][mesh][layer].items():
+            tiles.update(
+                (int(z), x, y)
+                for x in range(min_x, max_x + 1)
+                for y in range(min_y, max_y + 1)
+            )
+    return [f"{z}/{x}/{y}.pbf" for z, x, y in sorted(tiles)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "tileindex-tiles", "Print tiles of a layer affected by meshes"
+    )
+    parser.add_argument(
+        "-i",
+        "--index",
+        help="Index file (See main.py)",
+        type=pathlib.Path,
+        default=pathlib.Path("../data/tileindex/tiles.json"),
+    )
+    parser.add_argument(
+        "-m",
+        "--mesh",
+        help="Mesh code like p573926, or fnmatch pattern like 'p5739*'; Repeatable",
+        type=str,
+        action="append",
+        required=True,
+    )
+    parser.add_argument(
+        "-l", "--layer", help="Layer of tiles", choices=LAYERS.keys(), required=True
+    )
+    args = parser.parse_args()
+
+    for path in tile_paths(json.load(open(args.index)), args.mesh, args.layer):
+        print(path)
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import pathlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+from mesh import tile_meshes
+from mvt import LayerStats, decode_tile
+
+METRICS = ["bytes", "features", "vertices"]
+
+
+@dataclass
+class TileStats:
+    z: int
+    x: int
+    y: int
+    bytes: int
+    layers: list[LayerStats]
+
+    @property
+    def features(self) -> int:
+        return sum(layer.features for layer in self.layers)
+
+    @property
+    def vertices(self) -> int:
+        return sum(layer.vertices for layer in self.layers)
+
+
+def profile_tile(path: pathlib.Path) -> TileStats:
+    data = path.read_bytes()
+    return TileStats(
+        int(path.parent.parent.name),
+        int(path.parent.name),
+        int(path.stem),
+        len(data),
+        decode_tile(data),
+    )
+
+
+# {z}/{x}/{y}.pbf written by tippecanoe -e
+def tile_paths(input_dir: pathlib.Path) -> list[pathlib.Path]:
+    return sorted(input_dir.glob("*/*/*.pbf"))
+
+
+def summarize(values: list[int]) -> dict[str, float]:
+    values = sorted(values)
+    return {
+        "total": sum(values),
+        "mean": sum(values) / len(values),
+        "p50": values[len(values) // 2],
+        "p99": values[min(len(values) - 1, len(values) * 99 // 100)],
+        "max": values[-1],
+    }
+
+
+# Power of 2 buckets; key is the lower bound
+def histogram(values: list[int]) -> dict[int, int]:
+    hist: dict[int, int] = {}
+    for v in values:
+        key = 0 if v == 0 else 1 << (v.bit_length() - 1)
+        hist[key] = hist.get(key, 0) + 1
+    return dict(sorted(hist.items()))
+
+
+def build_report(tiles: list[TileStats], worst_count: int, max_meshes: int) -> dict:
+    zooms: dict[int, list[TileStats]] = {}
+    for tile in tiles:
+        zooms.setdefault(tile.z, []).append(tile)
+
+    def zoom_report(zoom_tiles: list[TileStats]) -> dict:
+        layers: dict[str, list[LayerStats]] = {}
+        for tile in zoom_tiles:
+            for layer in tile.layers:
+                layers.setdefault(layer.name, []).append(layer)
+
+        return {
+            "tiles": len(zoom_tiles),
+            **{m: summarize([getattr(t, m) for t in zoom_tiles]) for m in METRICS},
+            "layers": {
+                name: {m: histogram([getattr(v, m) for v in values]) for m in METRICS}
+                for name, values in sorted(layers.items())
+            },
+        }
+
+    def worst(metric: str) -> list[dict]:
+        return [
+            {
+                "tile": f"{t.z}/{t.x}/{t.y}",
+                **{m: getattr(t, m) for m in METRICS},
+                "meshes": tile_meshes(t.z, t.x, t.y, max_meshes),
+            }
+            for t in sorted(tiles, key=lambda t: getattr(t, metric), reverse=True)[
+                :worst_count
+            ]
+        ]
+
+    return {
+        "zooms": {str(z): zoom_report(v) for z, v in sorted(zooms.items())},
+        "worst": {m: worst(m) for m in METRICS},
+    }
+
+
+def print_report(report: dict):
+    print(
+        "zoom    tiles   bytes(p50/p99/max)            features(p99/max)   vertices(p99/max)"
+    )
+    for z, r in report["zooms"].items():
+        b, f, v = r["bytes"], r["features"], r["vertices"]
+        print(
+            f"{z:>4} {r['tiles']:>8}   {b['p50']:>8} {b['p99']:>9} {b['max']:>9}"
+            f"   {f['p99']:>8} {f['max']:>8}   {v['p99']:>8} {v['max']:>9}"
+        )
+
+    for metric, tiles in report["worst"].items():
+        print(f"\nWorst tiles by {metric}:")
+        for t in tiles:
+            print(f"  {t['tile']:>16} {t[metric]:>10}  meshes: {' '.join(t['meshes'])}")
+
+
+# Compare per-zoom p99 and max with the baseline report. Returns regressions over threshold (%)
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for z, r in report["zooms"].items():
+        if (b := baseline["zooms"].get(z)) is None:
+            continue
+        for metric in METRICS:
+            for stat in ["p99", "max"]:
+                old, new = b[metric][stat], r[metric][stat]
+                change = (new - old) / old * 100 if old > 0 else 0
+                print(f"z{z} {metric} {stat}: {old} -> {new} ({change:+.1f}%)")
+                if change > threshold:
+                    regressions.append(f"z{z} {metric} {stat}: {change:+.1f}%")
+    return regressions
+
+
+def main(
+    input_dir: pathlib.Path,
+    output: pathlib.Path | None,
+    baseline: pathlib.Path | None,
+    threshold: float,
+    worst_count: int,
+    max_meshes: int,
+    jobs: int,
+):
+    paths = tile_paths(input_dir)
+    if len(paths) == 0:
+        raise RuntimeError(f"No tiles in {input_dir.absolute()}")
+
+    with ProcessPoolExecutor(jobs) as executor:
+        tiles = list(executor.map(profile_tile, paths, chunksize=256))
+
+    report = build_report(tiles, worst_count, max_meshes)
+    print_report(report)
+
+    if output is not None:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        print(f"\nCompare with {baseline}:")
+        regressions = compare(report, json.load(open(baseline)), threshold)
+        if len(regressions) > 0:
+            raise RuntimeError(f"Tiles got heavier: {regressions}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "tileprofiler", "Profile size, feature count and vertex count of tiles"
+    )
+    parser.add_argument(
+        "-i",
+        "--input",
+        help="Tile directory generated by tippecanoe -e (e.g. ../data/mvt/sai/out)",
+        required=True,
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "-o", "--out", help="Output report JSON file", type=pathlib.Path
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        help="Report JSON file to compare with; Fails if p99 or max exceeds the threshold",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "--threshold",
+        help="Allowed increase from the baseline in percent",
+        type=float,
+        default=10,
+    )
+    parser.add_argument(
+        "-n", "--worst", help="Number of worst tiles to list", type=int, default=10
+    )
+    parser.add_argument(
+        "--max-meshes",
+        help="List 1st mesh codes instead of 2nd mesh codes for a tile covering more meshes",
+        type=int,
+        default=16,
+    )
+    parser.add_argument(
+        "-j", "--jobs", help="Number of processes", type=int, default=os.cpu_count()
+    )
+    args = parser.parse_args()
+    main(
+        args.input,
+        args.out,
+        args.baseline,
+        args.threshold,
+        args.worst,
+        args.max_meshes,
+        args.jobs,
+    )
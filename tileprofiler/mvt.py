@@ -0,0 +1,109 @@
+# Minimal Mapbox Vector Tile decoder; Reads only sizes and counts, not properties
+# https://github.com/mapbox/vector-tile-spec/blob/master/2.1/vector_tile.proto
+
+import gzip
+from dataclasses import dataclass
+from typing import Iterator
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# Protobuf wire types
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+# Field numbers
+TILE_LAYERS = 3
+LAYER_NAME = 1
+LAYER_FEATURES = 2
+FEATURE_GEOMETRY = 4
+
+# Geometry commands
+COMMAND_MOVE_TO = 1
+COMMAND_LINE_TO = 2
+COMMAND_CLOSE_PATH = 7
+
+
+@dataclass
+class LayerStats:
+    name: str
+    bytes: int
+    features: int
+    vertices: int
+
+
+def read_varint(buf: memoryview, pos: int) -> tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            return value, pos
+        shift += 7
+
+
+# Yields (field number, value); value is int for varints and memoryview for length-delimited fields
+def read_fields(buf: memoryview) -> Iterator[tuple[int, int | memoryview]]:
+    pos = 0
+    while pos < len(buf):
+        key, pos = read_varint(buf, pos)
+        field, wire_type = key >> 3, key & 0x7
+        if wire_type == WIRE_VARINT:
+            value, pos = read_varint(buf, pos)
+            yield field, value
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, pos = read_varint(buf, pos)
+            yield field, buf[pos : pos + length]
+            pos += length
+        elif wire_type == WIRE_FIXED64:
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            pos += 4
+        else:
+            raise RuntimeError(f"Unsupported wire type: {wire_type}")
+
+
+# Number of MoveTo / LineTo points in a packed geometry
+def count_vertices(geometry: memoryview) -> int:
+    vertices = 0
+    pos = 0
+    while pos < len(geometry):
+        command, pos = read_varint(geometry, pos)
+        command_id, count = command & 0x7, command >> 3
+        if command_id in [COMMAND_MOVE_TO, COMMAND_LINE_TO]:
+            vertices += count
+            # Skip parameters (dx, dy)
+            for _ in range(count * 2):
+                _, pos = read_varint(geometry, pos)
+        elif command_id != COMMAND_CLOSE_PATH:
+            raise RuntimeError(f"Unknown geometry command: {command_id}")
+    return vertices
+
+
+def decode_layer(buf: memoryview) -> LayerStats:
+    name = ""
+    features = 0
+    vertices = 0
+    for field, value in read_fields(buf):
+        if field == LAYER_NAME:
+            name = bytes(value).decode()  # type: ignore
+        elif field == LAYER_FEATURES:
+            features += 1
+            for f, v in read_fields(value):  # type: ignore
+                if f == FEATURE_GEOMETRY:
+                    vertices += count_vertices(v)  # type: ignore
+    return LayerStats(name, len(buf), features, vertices)
+
+
+def decode_tile(data: bytes) -> list[LayerStats]:
+    # tippecanoe compresses tiles unless --no-tile-compression
+    if data.startswith(GZIP_MAGIC):
+        data = gzip.decompress(data)
+    return [
+        decode_layer(value)  # type: ignore
+        for field, value in read_fields(memoryview(data))
+        if field == TILE_LAYERS
+    ]
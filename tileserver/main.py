@@ -0,0 +1,508 @@
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import mimetypes
+import pathlib
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+from collections import Counter, OrderedDict, deque
+from dataclasses import dataclass, field
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MIME_TYPES = {
+    ".pbf": "application/x-protobuf",
+    ".mvt": "application/vnd.mapbox-vector-tile",
+    ".geojson": "application/geo+json",
+    ".geojsonlines": "application/geo+json-seq",
+}
+
+COMPRESSIBLE_SUFFIXES = [
+    ".pbf",
+    ".mvt",
+    ".json",
+    ".geojson",
+    ".geojsonlines",
+    ".js",
+    ".css",
+    ".html",
+    ".svg",
+]
+
+# /{name}/{z}/{x}/{y}.pbf under MBTILES_PREFIX
+MBTILES_PREFIX = "/mbtiles/"
+MBTILES_PATH = re.compile(r"^([^/]+)/(\d+)/(\d+)/(\d+)\.(pbf|mvt)$")
+
+METRICS_PATH = "/_metrics"
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+MAX_HEADER_LINES = 100
+
+# Size of reads discarding request bodies
+DRAIN_CHUNK_BYTES = 64 * 1024
+
+
+@dataclass
+class Response:
+    status: int
+    headers: dict[str, str] = field(default_factory=dict)
+    body: bytes = b""
+
+
+STATUS_REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    416: "Range Not Satisfiable",
+    500: "Internal Server Error",
+}
+
+
+# (st_mtime_ns, st_size) of a file; None if missing
+Version = tuple[int, int] | None
+
+
+def file_version(path: pathlib.Path) -> Version:
+    try:
+        stat = path.stat()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+@dataclass
+class CacheEntry:
+    body: bytes
+    etag: str
+    # Version of the file the body is read from; Stale when the file changes
+    version: Version
+
+
+# Entry for each (path, content encoding) bounded by total body bytes
+class LRUCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+
+    def get(self, key: tuple[str, str]) -> CacheEntry | None:
+        if (entry := self.entries.get(key)) is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple[str, str], entry: CacheEntry):
+        if len(entry.body) > self.max_bytes:
+            return
+        if (old := self.entries.pop(key, None)) is not None:
+            self.bytes -= len(old.body)
+        self.entries[key] = entry
+        self.bytes += len(entry.body)
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= len(evicted.body)
+
+
+class Metrics:
+    def __init__(self, latency_window: int = 10000):
+        self.started_at = time.time()
+        self.requests = 0
+        self.statuses: Counter[int] = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.bytes_sent = 0
+        # Latencies (sec) of recent requests
+        self.latencies: deque[float] = deque(maxlen=latency_window)
+
+    def record(self, status: int, body_bytes: int, latency: float):
+        self.requests += 1
+        self.statuses[status] += 1
+        self.bytes_sent += body_bytes
+        self.latencies.append(latency)
+
+    def to_json(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float | None:
+            if len(latencies) == 0:
+                return None
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+        uptime = time.time() - self.started_at
+        return {
+            "uptime_sec": uptime,
+            "requests": self.requests,
+            "requests_per_sec": self.requests / uptime,
+            "statuses": dict(self.statuses),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "bytes_sent": self.bytes_sent,
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p90": percentile(0.9),
+                "p99": percentile(0.99),
+                "max": latencies[-1] * 1000 if len(latencies) > 0 else None,
+            },
+        }
+
+
+class MBTiles:
+    def __init__(self, path: pathlib.Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.version = file_version(path)
+        self.connection = self.connect()
+
+    def connect(self) -> sqlite3.Connection:
+        # Read only; Shared among threads of asyncio.to_thread
+        return sqlite3.connect(
+            f"file:{self.path}?mode=ro", uri=True, check_same_thread=False
+        )
+
+    # tippecanoe -f replaces the archive; Reconnect to read the new file instead of the deleted one
+    def current_connection(self) -> sqlite3.Connection:
+        with self.lock:
+            if (version := file_version(self.path)) != self.version:
+                self.version = version
+                self.connection = self.connect()
+            return self.connection
+
+    def get(self, z: int, x: int, y: int) -> bytes | None:
+        connection = self.current_connection()
+        # MBTiles rows are in TMS order
+        row = connection.execute(
+            "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, (1 << z) - 1 - y),
+        ).fetchone()
+        if row is None:
+            return None
+
+        data = bytes(row[0])
+        # tippecanoe compresses tiles unless --no-tile-compression
+        if data.startswith(GZIP_MAGIC):
+            data = gzip.decompress(data)
+        return data
+
+
+def accepted_encodings(accept_encoding: str) -> set[str]:
+    encodings = set()
+    for token in accept_encoding.split(","):
+        name, *params = [v.strip() for v in token.split(";")]
+        if any(
+            p.replace(" ", "") in ["q=0", "q=0.0", "q=0.00", "q=0.000"] for p in params
+        ):
+            continue
+        if name != "":
+            encodings.add(name.lower())
+    return encodings
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    match encoding:
+        case "br":
+            return brotli.compress(data, quality=5)  # type: ignore
+        case "gzip":
+            return gzip.compress(data, 6, mtime=0)
+        case _:
+            return data
+
+
+# Returns (start, end) inclusive, None for unsupported ranges (serve the whole), or "invalid"
+def parse_range(value: str, size: int) -> tuple[int, int] | None | str:
+    if not value.startswith("bytes=") or "," in value:
+        return None
+    start_str, _, end_str = value[len("bytes=") :].strip().partition("-")
+    try:
+        if start_str == "":
+            # Suffix range: last N bytes
+            length = int(end_str)
+            if length == 0:
+                return "invalid"
+            return max(0, size - length), size - 1
+        start = int(start_str)
+        end = int(end_str) if end_str != "" else size - 1
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        return "invalid"
+    return start, min(end, size - 1)
+
+
+class TileServer:
+    def __init__(
+        self,
+        root: pathlib.Path,
+        mbtiles: dict[str, MBTiles],
+        cache: LRUCache,
+        max_age: int,
+    ):
+        self.root = root.resolve()
+        self.mbtiles = mbtiles
+        self.cache = cache
+        self.max_age = max_age
+        self.metrics = Metrics()
+
+    # File serving the path: An MBTiles archive or a file under the root
+    def source(self, path: str) -> pathlib.Path | None:
+        if path.startswith(MBTILES_PREFIX):
+            match = MBTILES_PATH.match(path[len(MBTILES_PREFIX) :])
+            if match is None or (archive := self.mbtiles.get(match[1])) is None:
+                return None
+            return archive.path
+
+        file = (self.root / path.lstrip("/")).resolve()
+        if file.is_dir():
+            file = file / "index.html"
+        if not file.is_relative_to(self.root) or not file.is_file():
+            return None
+        return file
+
+    def load(self, path: str, file: pathlib.Path) -> bytes | None:
+        if path.startswith(MBTILES_PREFIX):
+            # Matched by source already
+            name, z, x, y, _ = MBTILES_PATH.match(path[len(MBTILES_PREFIX) :]).groups()  # type: ignore
+            return self.mbtiles[name].get(int(z), int(x), int(y))
+        try:
+            return file.read_bytes()
+        except FileNotFoundError:
+            return None
+
+    # Returns the entry of the encoded content
+    # Files rewritten by tippecanoe or page/build.py are read again; Versions are checked on each hit
+    async def get_content(self, path: str, encoding: str) -> CacheEntry | None:
+        file = self.source(path)
+        if file is None:
+            return None
+        version = file_version(file)
+        if (entry := self.cache.get((path, encoding))) is not None:
+            if entry.version == version:
+                self.metrics.cache_hits += 1
+                return entry
+        self.metrics.cache_misses += 1
+
+        data = await asyncio.to_thread(self.load, path, file)
+        if data is None:
+            return None
+
+        # Weak ETag; Same content with another encoding shares the validator
+        etag = f'W/"{hashlib.sha1(data).hexdigest()}"'
+        body = await asyncio.to_thread(compress, data, encoding)
+        entry = CacheEntry(body, etag, version)
+        self.cache.put((path, encoding), entry)
+        return entry
+
+    async def respond(
+        self, method: str, target: str, headers: dict[str, str]
+    ) -> Response:
+        if method not in ["GET", "HEAD"]:
+            return Response(405, {"Allow": "GET, HEAD"})
+
+        path = urllib.parse.unquote(urllib.parse.urlsplit(target).path)
+        if path == METRICS_PATH:
+            body = json.dumps(self.metrics.to_json()).encode()
+            return Response(200, {"Content-Type": "application/json"}, body)
+
+        suffix = pathlib.PurePosixPath(path).suffix
+        range_header = headers.get("range")
+
+        # Ranges apply to the identity encoding only
+        encoding = "identity"
+        if suffix in COMPRESSIBLE_SUFFIXES and range_header is None:
+            accepted = accepted_encodings(headers.get("accept-encoding", ""))
+            if brotli is not None and "br" in accepted:
+                encoding = "br"
+            elif "gzip" in accepted:
+                encoding = "gzip"
+
+        content = await self.get_content(path, encoding)
+        if content is None:
+            return Response(404)
+        body, etag = content.body, content.etag
+
+        response_headers = {
+            "Content-Type": MIME_TYPES.get(suffix)
+            or mimetypes.guess_type(path)[0]
+            or "application/octet-stream",
+            "Cache-Control": f"public, max-age={self.max_age}",
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+            "Accept-Ranges": "bytes",
+            # Allow QGIS / viewers on other origins
+            "Access-Control-Allow-Origin": "*",
+        }
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+
+        if headers.get("if-none-match") == etag:
+            return Response(304, response_headers)
+
+        if range_header is not None:
+            match parse_range(range_header, len(body)):
+                case "invalid":
+                    response_headers["Content-Range"] = f"bytes */{len(body)}"
+                    return Response(416, response_headers)
+                case (start, end):
+                    response_headers["Content-Range"] = (
+                        f"bytes {start}-{end}/{len(body)}"
+                    )
+                    return Response(206, response_headers, body[start : end + 1])
+
+        return Response(200, response_headers, body)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if request_line == b"":
+                    break
+
+                started_at = time.perf_counter()
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in [b"\r\n", b"\n", b""]:
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+
+                # Bodies are not used; Discard them so that the next request starts after them
+                # Chunked bodies are not parsed; Close the connection after the response
+                drained = "transfer-encoding" not in headers
+                try:
+                    await self.drain_body(reader, headers)
+                except ValueError:
+                    request_line, drained = b"", False
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                    response = await self.respond(method, target, headers)
+                except ValueError:
+                    method, version = "GET", "HTTP/1.0"
+                    response = Response(400)
+                except Exception as e:
+                    print(f"Error: {e!r}, request: {request_line!r}")
+                    response = Response(500)
+
+                keep_alive = (
+                    drained
+                    and version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                response.headers["Content-Length"] = str(len(response.body))
+                response.headers["Connection"] = "keep-alive" if keep_alive else "close"
+
+                lines = [
+                    f"HTTP/1.1 {response.status} {STATUS_REASONS[response.status]}",
+                    *[f"{k}: {v}" for k, v in response.headers.items()],
+                ]
+                writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+                if method != "HEAD":
+                    writer.write(response.body)
+                await writer.drain()
+
+                self.metrics.record(
+                    response.status,
+                    len(response.body),
+                    time.perf_counter() - started_at,
+                )
+
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    # Raises ValueError for an invalid Content-Length
+    async def drain_body(self, reader: asyncio.StreamReader, headers: dict[str, str]):
+        length = int(headers.get("content-length", "0"))
+        if length < 0:
+            raise ValueError(f"Invalid Content-Length: {length}")
+        while length > 0:
+            chunk = await reader.readexactly(min(length, DRAIN_CHUNK_BYTES))
+            length -= len(chunk)
+
+
+async def serve(server: TileServer, host: str, port: int):
+    async with await asyncio.start_server(server.handle, host, port) as s:
+        print(f"Serving {server.root} on http://{host}:{port}/")
+        print(f"Metrics: http://{host}:{port}{METRICS_PATH}")
+        await s.serve_forever()
+
+
+def parse_mbtiles(value: str) -> tuple[str, pathlib.Path]:
+    name, sep, path = value.partition("=")
+    if sep == "":
+        raise argparse.ArgumentTypeError(f"Expected name=path: {value}")
+    return name, pathlib.Path(path)
+
+
+def main(
+    root: pathlib.Path,
+    mbtiles: list[tuple[str, pathlib.Path]],
+    host: str,
+    port: int,
+    cache_mb: int,
+    max_age: int,
+):
+    server = TileServer(
+        root,
+        {name: MBTiles(path) for name, path in mbtiles},
+        LRUCache(cache_mb * 1024 * 1024),
+        max_age,
+    )
+    try:
+        asyncio.run(serve(server, host, port))
+    except KeyboardInterrupt:
+        print(json.dumps(server.metrics.to_json(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "tileserver", "Serve tiles and the viewer page for development"
+    )
+    parser.add_argument(
+        "-d",
+        "--directory",
+        help="Root directory to serve",
+        type=pathlib.Path,
+        default=pathlib.Path(__file__).parent.parent / "data",
+    )
+    parser.add_argument(
+        "-m",
+        "--mbtiles",
+        help=f"MBTiles archive to serve at {MBTILES_PREFIX}{{name}}/{{z}}/{{x}}/{{y}}.pbf (name=path, repeatable)",
+        type=parse_mbtiles,
+        action="append",
+        default=[],
+    )
+    parser.add_argument("--host", help="Bind address", type=str, default="127.0.0.1")
+    parser.add_argument("-p", "--port", help="Port", type=int, default=8000)
+    parser.add_argument(
+        "--cache-mb",
+        help="Max size of the in-memory cache for hot tiles",
+        type=int,
+        default=256,
+    )
+    parser.add_argument(
+        "--max-age",
+        help="max-age of Cache-Control header in seconds",
+        type=int,
+        default=0,
+    )
+    args = parser.parse_args()
+    main(
+        args.directory, args.mbtiles, args.host, args.port, args.cache_mb, args.max_age
+    )
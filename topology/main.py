@@ -0,0 +1,109 @@
+import argparse
+import glob
+import pathlib
+
+import shapely
+from geojson_io import dump_geojson, load_geojson
+from instrument import (
+    FileStats,
+    Instrument,
+    add_instrument_arguments,
+    instrument_from_args,
+)
+
+from topology import dump_topology, load_topology, to_collection
+
+
+def encode_file(input_path: pathlib.Path, output_path: pathlib.Path, stats: FileStats):
+    value = load_geojson(input_path)
+    stats.lap("load")
+    stats.count("features", len(value["features"]))
+    geoms = [shapely.geometry.shape(f["geometry"]) for f in value["features"]]
+    vertices = shapely.get_num_coordinates(geoms)
+    stats.count("vertices", int(vertices.sum()))
+
+    topology = dump_topology(value, output_path)
+    stats.lap("encode")
+    stats.count("arcs", len(topology.arc_offsets) - 1)
+    stats.count("arc_vertices", len(topology.xy))
+
+    # Round trip; Each feature gets its own polygons back, also with empty polygons among them
+    decoded = [
+        shapely.geometry.shape(f["geometry"])
+        for f in to_collection(*load_topology(output_path))["features"]
+    ]
+    if (
+        len(decoded) != len(geoms)
+        or (shapely.get_num_coordinates(decoded) != vertices).any()
+    ):
+        raise RuntimeError(f"Features changed by encoding: {output_path}")
+    stats.lap("verify")
+
+
+def decode_file(input_path: pathlib.Path, output_path: pathlib.Path, stats: FileStats):
+    value = to_collection(*load_topology(input_path))
+    stats.lap("decode")
+    stats.count("features", len(value["features"]))
+
+    dump_geojson(value, output_path)
+    stats.lap("dump")
+
+
+def main(pattern: str, output_dir: pathlib.Path, decode: bool, instrument: Instrument):
+    if output_dir.exists() and not output_dir.is_dir():
+        raise RuntimeError(
+            f"Output directory: {output_dir.absolute()} is not a directory"
+        )
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    files = glob.glob(pattern, recursive=True)
+
+    for file in files:
+        print(file)
+        input_path = pathlib.Path(file)
+        if decode:
+            out = output_dir / f"{input_path.stem}.geojson"
+            with instrument.file(input_path) as stats:
+                decode_file(input_path, out, stats)
+        else:
+            out = output_dir / f"{input_path.stem}.topojson"
+            with instrument.file(input_path) as stats:
+                encode_file(input_path, out, stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        "topology", "Encode polygons of geojsons into shared arcs (TopoJSON)"
+    )
+    parser.add_argument(
+        "-g",
+        "--pattern",
+        help="Python glob library style file pattern locating geojsons (topojsons with --decode)",
+        required=True,
+        type=str,
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        help="Directory for output files",
+        type=pathlib.Path,
+    )
+    parser.add_argument(
+        "-d",
+        "--decode",
+        help="Decode topojsons into geojsons instead",
+        action="store_true",
+    )
+    add_instrument_arguments(parser)
+    args = parser.parse_args()
+
+    output = args.out
+    if output is None:
+        output = pathlib.Path(__file__).parent / "../data/topology"
+
+    main(
+        args.pattern,
+        output,
+        args.decode,
+        instrument_from_args("topology-decode" if args.decode else "topology", args),
+    )
@@ -0,0 +1 @@
+../common/quantize.py
\ No newline at end of file
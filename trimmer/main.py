@@ -1,15 +1,24 @@
 import argparse
 import glob
-import json
 import pathlib
 import traceback
-from collections import defaultdict
 from dataclasses import dataclass
 from enum import Enum, auto
-from math import pi, sqrt
+from math import pi
 
+import numpy as np
 import shapely
 import shapely.ops
+from geojson_io import dump_geojson, load_geojson
+from instrument import (
+    FileStats,
+    Instrument,
+    add_instrument_arguments,
+    instrument_from_args,
+)
+from kubun import chu_kubun, dai_kubun
+from quantize import point_ids
+from topology import Topology, border_lengths, load_topology, to_polygons
 
 
 class Kubun(Enum):
@@ -66,61 +75,69 @@ CHU_CONFIG = KubunConfig(
 )
 
 
-def dai_kubun(code: int):
-    if code == 580600:
-        # Water area
-        return 91
-
-    if code == 570400:
-        # Paddy field
-        return 99
-
-    return code // 10000
-
-
+# Border length of each polygon shared with each other polygon, along its own rings
+# A segment counts for another polygon when both ends are its vertices too.
+# Vertices are matched by sorting packed integer coordinates (See common), instead of hashing float tuples.
 def calculate_border_lengthes(geoms: list[shapely.Polygon]) -> list[list[float]]:
-    points = defaultdict(set)
+    # Rings in order of exteriors and interiors, and their vertices in order
+    rings, ring_polygons = shapely.get_rings(geoms, return_index=True)
+    xy, vertex_rings = shapely.get_coordinates(rings, return_index=True)
+    vertex_polygons = ring_polygons[vertex_rings]
+    point = point_ids(xy)
+
+    # Polygons having each point; Sorted by point then polygon
+    n = len(geoms)
+    owner_keys = np.unique(point * n + vertex_polygons)
+    owner_points, owners = owner_keys // n, owner_keys % n
+    owner_starts = np.searchsorted(owner_points, np.arange(point.max(initial=-1) + 1))
+    owner_counts = np.bincount(owner_points, minlength=len(owner_starts))
+
+    # Segments from a to b in each ring
+    a = np.flatnonzero(vertex_rings[:-1] == vertex_rings[1:])
+    b = a + 1
+    distances = np.sqrt((xy[a, 0] - xy[b, 0]) ** 2 + (xy[a, 1] - xy[b, 1]) ** 2)
+
+    # Each segment for each polygon j having a; Kept when j has b too
+    counts = owner_counts[point[a]]
+    segments = np.repeat(np.arange(len(a)), counts)
+    nth = np.arange(len(segments)) - np.repeat(np.cumsum(counts) - counts, counts)
+    j = owners[owner_starts[point[a]][segments] + nth]
+    i = vertex_polygons[a][segments]
+    b_keys = point[b][segments] * n + j
+    b_owned = (
+        owner_keys[np.minimum(np.searchsorted(owner_keys, b_keys), len(owner_keys) - 1)]
+        == b_keys
+    )
+    shared = b_owned & (i != j)
 
-    # build common point information
-    for i, geom in enumerate(geoms):
-        for coord in geom.exterior.coords:
-            points[coord].add(i)
-        for interior in geom.interiors:
-            for coord in interior.coords:
-                points[coord].add(i)
+    # Sum for each pair; Lengths may differ from math.sqrt(dx ** 2 + dy ** 2) by float rounding
+    # e.g. 1 ulp where libm pow(x, 2) is not exactly x * x
+    pairs, pair_index = np.unique(i[shared] * n + j[shared], return_inverse=True)
+    lengthes = np.bincount(pair_index.reshape(-1), distances[segments[shared]])
 
     # Common border length map
-    geo_border_lengthes: list[list[float]] = [
-        [0] * len(geoms) for _ in range(len(geoms))
-    ]
-
-    for i, geom in enumerate(geoms):
-        coords_list = [geom.exterior.coords]
-
-        for interior in geom.interiors:
-            coords_list.append(interior.coords)
+    geo_border_lengthes: list[list[float]] = [[0] * n for _ in range(n)]
+    for pair, length in zip(pairs.tolist(), lengthes.tolist()):
+        geo_border_lengthes[pair // n][pair % n] = length
 
-        past_xy: tuple[float, float] = (0, 0)
-        for coords in coords_list:
-            past_geom_polygons = set()
-
-            for coord in coords:
-                distance = sqrt(
-                    (past_xy[0] - coord[0]) ** 2 + (past_xy[1] - coord[1]) ** 2
-                )
-                past_xy = coord
-                touching_indexes = points[coord]
+    return geo_border_lengthes
 
-                for j in past_geom_polygons:
-                    if i == j:
-                        continue
 
-                    if j in touching_indexes:
-                        geo_border_lengthes[i][j] += distance
+# Same as calculate_border_lengthes, from arcs shared by polygons; No vertices to match
+# order: Polygons of the topology in the order of the result
+def arc_border_lengthes(topology: Topology, order: list[int]) -> list[list[float]]:
+    rank = {k: r for r, k in enumerate(order)}
+    geo_border_lengthes: list[list[float]] = [[0] * len(order) for _ in order]
+    for i, j, length in zip(*(v.tolist() for v in border_lengths(topology))):
+        geo_border_lengthes[rank[i]][rank[j]] = length
+    return geo_border_lengthes
 
-                past_geom_polygons = touching_indexes
 
-    return geo_border_lengthes
+def get_code(config: KubunConfig, properties: dict) -> int:
+    if config.kubun == Kubun.CHU:
+        return chu_kubun(properties["H"])
+    else:
+        return dai_kubun(properties["H"])
 
 
 def get_code_polygons(
@@ -129,10 +146,7 @@ def get_code_polygons(
     code_geometries: list[tuple[int, shapely.Polygon]] = []
 
     for feature in features:
-        if config.kubun == Kubun.CHU:
-            code = feature["properties"]["H"] // 100
-        else:
-            code = dai_kubun(feature["properties"]["H"])
+        code = get_code(config, feature["properties"])
         shape = shapely.geometry.shape(feature["geometry"])
         match shape.geom_type:
             case "Polygon":
@@ -157,19 +171,50 @@ def remove_small_holes(config: KubunConfig, polygon: shapely.Polygon):
 
 
 def process_file(
-    config: KubunConfig, input_path: pathlib.Path, output_path: pathlib.Path
+    config: KubunConfig,
+    input_path: pathlib.Path,
+    output_path: pathlib.Path,
+    stats: FileStats,
 ):
-    value = json.load(open(input_path))
+    topology = None
+    if input_path.suffix == ".topojson":
+        # Polygons of features in order, the same as get_code_polygons
+        topojson, topology, feature_parts = load_topology(input_path)
+        polygons = iter(to_polygons(topology))
+        code_geometries = [
+            (get_code(config, geometry["properties"]), next(polygons))
+            for geometry, count in zip(
+                topojson["objects"]["features"]["geometries"], feature_parts
+            )
+            for _ in range(count)
+        ]
+        value = {"type": "FeatureCollection", **topojson["members"]}
+    else:
+        value = load_geojson(input_path)
+        code_geometries = get_code_polygons(config, value["features"])
+    stats.lap("load")
+    stats.count("polygons", len(code_geometries))
+    stats.count(
+        "vertices",
+        int(shapely.get_num_coordinates([geom for _, geom in code_geometries]).sum()),
+    )
 
-    code_geometries = get_code_polygons(config, value["features"])
     # sort by area size (big -> small)
-    code_geometries_sorted = sorted(code_geometries, key=(lambda item: -item[1].area))
+    order = sorted(
+        range(len(code_geometries)), key=(lambda k: -code_geometries[k][1].area)
+    )
+    code_geometries_sorted = [code_geometries[k] for k in order]
 
     # Build common border length map
-    geo_border_lengthes = calculate_border_lengthes(
-        [geom for _, geom in code_geometries_sorted]
-    )
+    if topology is not None:
+        # Polygons of the topology are in the same order as code_geometries
+        geo_border_lengthes = arc_border_lengthes(topology, order)
+    else:
+        geo_border_lengthes = calculate_border_lengthes(
+            [geom for _, geom in code_geometries_sorted]
+        )
     geo_area_lengthes = [(geom.area, geom.length) for _, geom in code_geometries_sorted]
+    stats.lap("calculate_border_lengthes")
 
     length_at_first = len(geo_border_lengthes)
     # Small to large
@@ -235,6 +280,7 @@ def process_file(
         code_geom_to_merge = code_geometries_sorted[merge_object_idx]
 
         # Merge object!
+        stats.count("merges")
         try:
             merged_geom = shapely.unary_union([code_geom_to_merge[1], geom])
             code_geometries_sorted[merge_object_idx] = (  # type: ignore
@@ -266,9 +312,13 @@ def process_file(
         for l in geo_border_lengthes:
             l.pop(idx)
 
+    stats.lap("merge")
+
     code_geometries_sorted = [
         (code, remove_small_holes(config, p)) for code, p in code_geometries_sorted
     ]
+    stats.lap("remove_small_holes")
+    stats.count("features", len(code_geometries_sorted))
 
     value["features"] = [
         {
@@ -276,15 +326,23 @@ def process_file(
             "properties": {
                 config.key: code,
             },
-            "geometry": json.loads(shapely.to_geojson(geo)),
+            "geometry": shapely.geometry.mapping(geo),
         }
         for code, geo in code_geometries_sorted
     ]
 
-    json.dump(value, open(output_path, "w"), separators=(",", ":"))
+    stats.lap("to_geojson")
+
+    dump_geojson(value, output_path)
+    stats.lap("dump")
 
 
-def main(geojson_pattern: str, output_dir: pathlib.Path, kubun: Kubun):
+def main(
+    geojson_pattern: str,
+    output_dir: pathlib.Path,
+    kubun: Kubun,
+    instrument: Instrument,
+):
     if output_dir.exists() and not output_dir.is_dir():
         raise RuntimeError(
             f"Output directory: {output_dir.absolute()} is not a directory"
@@ -303,7 +361,8 @@ def main(geojson_pattern: str, output_dir: pathlib.Path, kubun: Kubun):
         print(file)
         input_path = pathlib.Path(file)
         out = output_dir / f"{input_path.stem}.geojson"
-        process_file(config, input_path, out)
+        with instrument.file(input_path) as stats:
+            process_file(config, input_path, out, stats)
 
 
 if __name__ == "__main__":
@@ -313,7 +372,7 @@ if __name__ == "__main__":
     parser.add_argument(
         "-g",
         "--geojson-pattern",
-        help="Python glob library style file pattern locating geojsons",
+        help="Python glob library style file pattern locating geojsons, or topojsons of topology",
         required=True,
         type=str,
     )
@@ -331,6 +390,7 @@ if __name__ == "__main__":
         type=str,
         choices={"chu", "dai"},
     )
+    add_instrument_arguments(parser)
     args = parser.parse_args()
 
     match args.kubun:
@@ -339,11 +399,17 @@ if __name__ == "__main__":
         case "dai":
             kubun = Kubun.DAI
 
-    if args.out is None:
+    output = args.out
+    if output is None:
         match kubun:
             case Kubun.CHU:
                 output = pathlib.Path(__file__).parent / "../data/geojson-trimmed/chu"
             case Kubun.DAI:
                 output = pathlib.Path(__file__).parent / "../data/geojson-trimmed/dai"
 
-    main(args.geojson_pattern, output, kubun)
+    main(
+        args.geojson_pattern,
+        output,
+        kubun,
+        instrument_from_args(f"trimmer-{args.kubun}", args),
+    )
@@ -0,0 +1 @@
+../common/topology.py
\ No newline at end of file